@@ -3,14 +3,31 @@ ASGI config for cs314_SITE project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The slot feed (/slots/feed/, server-sent events for the booking pages) is
+only served through this entry point, e.g. ``uvicorn cs314_SITE.asgi:application``;
+under WSGI it answers 503 and the pages simply stop patching their slot lists.
+Requests through here are routed by asgi_urls.py, which serves the async
+versions of the busiest read-only pages (smartward/async_views.py).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from django.core.handlers.asgi import ASGIHandler, ASGIRequest
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cs314_SITE.settings')
 
-application = get_asgi_application()
+
+class Request(ASGIRequest):
+    urlconf = 'cs314_SITE.asgi_urls'
+
+
+class Handler(ASGIHandler):
+    request_class = Request
+
+
+django.setup(set_prefix=False)
+application = Handler()
@@ -0,0 +1,22 @@
+from django.urls import path
+
+from smartward import async_views, urls as smartward_urls
+from .urls import urlpatterns as site_urlpatterns
+
+# The URLs served by asgi.py: those of urls.py, with the smartward pages that
+# have an async version routed to it. They come first so they win the match;
+# smartward's URLs are mounted at the root in urls.py, so the routes carry over.
+ASYNC_VIEWS = {
+    'doctor_dashboard': async_views.doctor_dashboard_view,
+    'receptionist_dashboard': async_views.receptionist_dashboard_view,
+    'doctor_appointments': async_views.doctor_appointments_view,
+    'patient_list': async_views.patient_list_view,
+    'patient_detail': async_views.patient_detail_view,
+    'doctor_view_visits': async_views.doctor_view_visits,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], pattern.default_args, pattern.name)
+    for pattern in smartward_urls.urlpatterns
+    if pattern.name in ASYNC_VIEWS
+] + site_urlpatterns
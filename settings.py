@@ -41,6 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so they see the whole request and every query
+    'smartward.metrics.MetricsMiddleware',
+    'smartward.querybudget.QueryBudgetMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,7 +57,8 @@ ROOT_URLCONF = 'cs314_SITE.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's backend, timing renders for the /metrics endpoint
+        'BACKEND': 'smartward.metrics.TimedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -69,6 +73,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'cs314_SITE.wsgi.application'
+ASGI_APPLICATION = 'cs314_SITE.asgi.application'
 
 
 # Database
@@ -132,11 +137,69 @@ AUTH_USER_MODEL = 'smartward.CustomUser'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Past appointments and old visits are moved here by the sweep_expired command
+ARCHIVE_ROOT = BASE_DIR / 'archive'
+ARCHIVE_VISITS_AFTER_DAYS = 365
+
+# Appointment PDFs are rendered by a pool of worker processes (0 renders in the request)
+PDF_WORKERS = 2
+PDF_QUEUE_SIZE = 16  # renders waiting or running before new ones get a 503
+PDF_TIMEOUT = 30  # seconds
+PDF_EXPORT_TIMEOUT = 300  # seconds, for multi-page appointment sheets
+PDF_EXPORT_MAX_PAGES = 2000  # a sheet is held in memory until written; larger ranges are exported as a ZIP
+
+# Generated PDFs are kept here for reprints, least recently used removed first
+PDF_CACHE_ROOT = BASE_DIR / 'pdf_cache'
+PDF_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Requests over their query budget (smartward/budgets.py) or running the
+# same query shape many times are logged to the 'smartward.queries' logger
+QUERY_BUDGET_ENABLED = True
+
+# Served at /metrics to these addresses only. With several worker processes set
+# METRICS_DIR to a directory they share (on one host), so each worker's /metrics
+# covers them all. Each writes its snapshot there at most every METRICS_FLUSH_INTERVAL.
+METRICS_ALLOWED_IPS = ('127.0.0.1', '::1')
+METRICS_DIR = None
+METRICS_FLUSH_INTERVAL = 5  # seconds
+
+# Dashboard shift and appointment summaries are cached and invalidated by
+# signals (smartward/dashboards.py). With several worker processes use a shared
+# backend (Memcached or Redis) so a change in one worker reaches all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+DASHBOARD_CACHE_TIMEOUT = 300  # seconds
+DASHBOARD_SHIFT_DAYS = 7  # the receptionist dashboard lists shifts starting this far ahead
+
+# Who is on duty is answered from an in-memory index of the shifts in the next
+# ONDUTY_WINDOW_HOURS, reloaded every ONDUTY_REFRESH_MINUTES and on shift changes
+ONDUTY_WINDOW_HOURS = 24
+ONDUTY_REFRESH_MINUTES = 60
+
+# "Did you mean" names are kept in memory by each process; name changes are logged
+# in the cache this long (seconds) for the others to replay before they reload
+SUGGESTION_CHANGE_TIMEOUT = 3600
+
+# Each ASGI process checks the cache for new slot feed events this often (seconds)
+SLOT_FEED_POLL_INTERVAL = 0.5
+
+# Only needed when running Celery; `manage.py run_scheduler` runs the same tasks without a broker
 CELERY_BEAT_SCHEDULE = {
     'delete-expired-appointments-every-10-minutes': {
-        'task': 'yourapp.tasks.delete_expired_appointments',
+        'task': 'smartward.tasks.delete_expired_appointments',
         'schedule': 600.0,  # every 10 minutes
     },
+    'delete-expired-slots-every-10-minutes': {
+        'task': 'smartward.tasks.delete_expired_slots',
+        'schedule': 600.0,  # every 10 minutes
+    },
+    'archive-old-visits-daily': {
+        'task': 'smartward.tasks.archive_old_visits',
+        'schedule': 86400.0,  # every day
+    },
 }
 # settings.py
 
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from smartward import slots
 from smartward.forms import DoctorAppointmentSlotAdminForm
 from .models import CustomUser, DoctorAppointment, DoctorAppointmentSlot, Shift
 from django.contrib.auth.admin import UserAdmin
@@ -35,6 +36,13 @@ class ShiftAdmin(admin.ModelAdmin):
         return local_time.strftime("%d/%m/%Y %I:%M %p")
     formatted_end_time.short_description = 'End Time'
 
+    actions = ['generate_slots']
+
+    @admin.action(description="Generate 15-minute appointment slots for selected shifts")
+    def generate_slots(self, request, queryset):
+        created, skipped = slots.generate_slots(queryset)
+        self.message_user(request, f"Created {created} slots ({skipped} skipped as overlapping existing slots).")
+
     def get_form(self, request, obj=None, **kwargs):
         # Customize the form to only show doctors with usertype 'doctor'
         form = super().get_form(request, obj, **kwargs)
@@ -50,8 +58,8 @@ class SpecializedAppointmentTypeAdmin(admin.ModelAdmin):
 
 @admin.register(SpecializedAppointmentSlot)
 class SpecializedAppointmentSlotAdmin(admin.ModelAdmin):
-    list_display = ['appointment_type', 'formatted_date', 'get_start_time', 'get_end_time']
-    list_filter = ['appointment_type', 'date']
+    list_display = ['appointment_type', 'formatted_date', 'get_start_time', 'get_end_time', 'is_booked']
+    list_filter = ['appointment_type', 'date', 'is_booked']
     search_fields = ['appointment_type__name', 'date']
 
     def formatted_date(self, obj):
@@ -82,7 +90,8 @@ class PatientAdmin(admin.ModelAdmin):
 @admin.register(DoctorAppointmentSlot)
 class DoctorAppointmentSlotAdmin(admin.ModelAdmin):
     form = DoctorAppointmentSlotAdminForm
-    list_display = ['doctor', 'date', 'start_time', 'end_time']
+    list_display = ['doctor', 'date', 'start_time', 'end_time', 'is_booked']
+    list_filter = ['is_booked']
     search_fields = ['doctor__username', 'date']
 
 @admin.register(DoctorAppointment)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SmartwardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'smartward'
+
+    def ready(self):
+        from . import signals  # noqa: F401
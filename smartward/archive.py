@@ -0,0 +1,162 @@
+import gzip
+import json
+import os
+import zlib
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import signals
+from .models import ArchivedRecord, DoctorAppointment, SpecializedAppointment, Visit
+
+
+def _doctor_appointment(appointment):
+    return appointment.slot.start_at, {
+        'doctor': appointment.doctor.username,
+        'start_at': appointment.slot.start_at,
+        'end_at': appointment.slot.end_at,
+    }
+
+
+def _specialized_appointment(appointment):
+    return appointment.slot.start_at, {
+        'appointment_type': appointment.slot.appointment_type.name,
+        'start_at': appointment.slot.start_at,
+        'end_at': appointment.slot.end_at,
+    }
+
+
+def _visit(visit):
+    return visit.visit_date, {
+        'doctor': visit.doctor.username,
+        'nurse': visit.nurse.username,
+    }
+
+
+# kind -> (model, related objects to fetch with it, function returning (occurred_at, context))
+# The context keeps what a reader needs once the slot or staff rows are gone.
+KINDS = {
+    'doctor_appointment': (DoctorAppointment, ('doctor', 'slot'), _doctor_appointment),
+    'specialized_appointment': (SpecializedAppointment, ('slot__appointment_type',), _specialized_appointment),
+    'visit': (Visit, ('doctor', 'nurse'), _visit),
+}
+KIND_BY_MODEL = {model: kind for kind, (model, _, _) in KINDS.items()}
+
+
+def archive_root():
+    return Path(getattr(settings, 'ARCHIVE_ROOT', settings.BASE_DIR / 'archive'))
+
+
+class ArchiveWriter:
+    """Appends records of one kind to a gzip-compressed JSON Lines file, opened on first write.
+
+    Each write is compressed as a gzip member of its own, which a plain gzip
+    reader reads back as one stream, and write() returns the member's byte
+    offset so a reader can seek to it and decompress only that batch.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        stamp = timezone.now().strftime('%Y%m%dT%H%M%S%f')
+        self.name = f"{kind}/{stamp}-{os.getpid()}.jsonl.gz"
+        self._file = None
+
+    def write(self, records):
+        if self._file is None:
+            path = archive_root() / self.name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(path, 'ab')
+        data = ''.join(json.dumps(record, cls=DjangoJSONEncoder) + '\n' for record in records)
+        offset = self._file.seek(0, os.SEEK_END)
+        self._file.write(gzip.compress(data.encode('utf-8')))
+        # Records must be on disk before the rows they came from are deleted
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return offset
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def archive_rows(writer, pks):
+    """Move the rows with these primary keys to the archive file, leaving tombstones.
+
+    Call inside a transaction so the tombstones and the deletes commit together.
+    """
+    model, related, describe = KINDS[writer.kind]
+    objects = list(model.objects.filter(pk__in=pks).select_related(*related).order_by('pk'))
+    records, tombstones = [], []
+    for obj in objects:
+        occurred_at, context = describe(obj)
+        record = serializers.serialize('python', [obj])[0]
+        record.update(kind=writer.kind, occurred_at=occurred_at, context=context)
+        records.append(record)
+        tombstones.append(ArchivedRecord(
+            kind=writer.kind, original_id=obj.pk, patient_id=obj.patient_id,
+            occurred_at=occurred_at, archive_file=writer.name,
+        ))
+    offset = writer.write(records)
+    for tombstone in tombstones:
+        tombstone.archive_offset = offset
+    ArchivedRecord.objects.bulk_create(tombstones)
+    signals.delete_in_batch(model, objects)
+    return len(objects)
+
+
+def patient_history(patient_id, kinds=None):
+    """Load a patient's archived records, oldest first.
+
+    Only the batches named by the patient's tombstones are read: each file is
+    opened once and only the gzip members at their offsets are decompressed, and
+    only when this is called, so archived history costs nothing until someone
+    asks for it.
+    """
+    tombstones = ArchivedRecord.objects.filter(patient_id=patient_id)
+    if kinds:
+        tombstones = tombstones.filter(kind__in=kinds)
+    wanted = defaultdict(lambda: defaultdict(set))
+    rows = tombstones.values_list('kind', 'original_id', 'archive_file', 'archive_offset')
+    for kind, original_id, archive_file, archive_offset in rows:
+        wanted[archive_file][archive_offset].add((kind, original_id))
+
+    records = []
+    for archive_file, batches in wanted.items():
+        path = archive_root() / archive_file
+        if not path.exists():
+            continue
+        with open(path, 'rb') as f:
+            for offset in sorted(batches):
+                keys = batches[offset]
+                for line in _read_member(f, offset).splitlines():
+                    record = json.loads(line)
+                    if (record['kind'], record['pk']) in keys:
+                        record['occurred_at'] = parse_datetime(record['occurred_at'])
+                        record['label'] = record['kind'].replace('_', ' ').capitalize()
+                        records.append(record)
+    return sorted(records, key=lambda record: record['occurred_at'])
+
+
+def _read_member(f, offset, chunk_size=64 * 1024):
+    """Decompress the gzip member starting at a byte offset, stopping at its end."""
+    f.seek(offset)
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    chunks = []
+    while not decompressor.eof:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            break
+        chunks.append(decompressor.decompress(chunk))
+    return b''.join(chunks).decode('utf-8')
@@ -0,0 +1,152 @@
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import connections
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.utils import timezone
+
+from . import archive, dashboards, onduty, search, suggest
+from .models import DoctorAppointment, Patient, Visit
+from .pagination import apaginate_request
+
+# Async versions of the read-only views that take most of the traffic. Under the
+# ASGI entry point they replace those in views.py (see asgi_urls.py), so waiting
+# on the database no longer holds a thread per request; under WSGI the sync
+# views keep being served. Templates are rendered on the request's thread, where
+# lazy values such as request.user may still run queries.
+_render = sync_to_async(render)
+
+
+async def _user(request):
+    """The request's user, also set as request.user so rendering does not load it again."""
+    request.user = await request.auser()
+    return request.user
+
+
+async def _separately(func, *args):
+    """Run the sync `func` on a thread, and so a database connection, of its own.
+
+    The async ORM runs all queries of a request on that request's one thread,
+    so gathering them still runs them one after another; calls made through
+    this overlap. The connection is closed afterwards, as after a request.
+    """
+    async with ThreadSensitiveContext():
+        try:
+            return await sync_to_async(func)(*args)
+        finally:
+            await sync_to_async(connections.close_all)()
+
+
+async def _nothing():
+    return None
+
+
+@login_required
+async def doctor_dashboard_view(request):
+    user = await _user(request)
+    shifts, appointments = await asyncio.gather(
+        _separately(dashboards.doctor_shifts, user.pk),
+        _separately(dashboards.doctor_appointment_summary, user.pk),
+    )
+    return await _render(request, 'doctor_dashboard.html', {
+        'user': user,
+        'shifts': shifts,
+        'appointments': appointments,
+    })
+
+
+@login_required
+async def receptionist_dashboard_view(request):
+    user = await _user(request)
+
+    if user.usertype != 'receptionist':
+        return redirect('home')
+
+    (on_duty, starting_soon), doctors_shifts, appointment_summary = await asyncio.gather(
+        _separately(onduty.get_index().on_duty),
+        _separately(dashboards.current_shifts),
+        _separately(dashboards.appointment_summary),
+    )
+    return await _render(request, 'receptionist_dashboard.html', {
+        'user': user,
+        'doctors_shifts': doctors_shifts,
+        'appointment_summary': appointment_summary,
+        'shift_days': settings.DASHBOARD_SHIFT_DAYS,
+        'on_duty': on_duty,
+        'starting_soon': starting_soon,
+    })
+
+
+@login_required
+async def doctor_appointments_view(request):
+    user = await _user(request)
+
+    if user.usertype != 'doctor':
+        return redirect('home')
+
+    threshold_time = timezone.now() - timedelta(minutes=10)
+
+    # Filter appointments to include only those that are scheduled in the future,
+    # excluding bookings that have ended more than 10 minutes ago
+    appointments = [appointment async for appointment in DoctorAppointment.objects.filter(
+        doctor=user,
+        slot__end_at__gte=threshold_time,
+    ).select_related('patient', 'slot').order_by('slot__start_at')]
+    return await _render(request, 'doctor_appointments.html', {
+        'appointments': appointments,
+    })
+
+
+async def patient_list_view(request):
+    query = request.GET.get('q', '').strip()
+    suggested_query = None
+
+    if query:
+        patients = await search.apaginate_patients(query, request.GET.get('cursor'))
+
+        if not patients:
+            suggested_query = await sync_to_async(suggest.suggest)(query)
+    else:
+        patients = await apaginate_request(request, Patient.objects.all(), ('id',))
+
+    return await _render(request, 'patient_list.html', {
+        'patients': patients,
+        'page': patients,
+        'query': query,
+        'suggested_query': suggested_query
+    })
+
+
+async def patient_detail_view(request, patient_id):
+    # The archive is read while the patient is fetched rather than after
+    patient, archived_records = await asyncio.gather(
+        aget_object_or_404(Patient, id=patient_id),
+        _separately(archive.patient_history, patient_id) if request.GET.get('history') else _nothing(),
+    )
+    return await _render(request, 'patient_detail.html', {'patient': patient, 'archived_records': archived_records})
+
+
+@login_required
+async def doctor_view_visits(request):
+    query = request.GET.get('q')
+    user = await _user(request)
+    visits = Visit.objects.filter(doctor=user).select_related('patient')
+    suggested_query = None
+
+    if query:
+        # Patient ID, name or contact matches from the search index
+        visits = visits.filter(search.matching_patients_q(query))
+
+    visits = await apaginate_request(request, visits, ('-visit_date', '-id'))
+    if query and not visits:
+        suggested_query = await sync_to_async(suggest.suggest)(query)
+
+    return await _render(request, 'doctor_view_visits.html', {
+        'visits': visits,
+        'page': visits,
+        'query': query,
+        'suggested_query': suggested_query
+    })
@@ -0,0 +1,37 @@
+from django.db.models import Exists, OuterRef
+
+from .models import DoctorAppointment, DoctorAppointmentSlot, SpecializedAppointment, SpecializedAppointmentSlot
+
+
+def refresh_doctor_slots(slot_ids):
+    """Recompute is_booked for the given doctor slots in a single UPDATE."""
+    slot_ids = [pk for pk in slot_ids if pk is not None]
+    if slot_ids:
+        DoctorAppointmentSlot.objects.filter(pk__in=slot_ids).update(
+            is_booked=Exists(DoctorAppointment.objects.filter(slot=OuterRef('pk')))
+        )
+
+
+def refresh_specialized_slots(slot_ids):
+    """Recompute is_booked for the given specialized slots in a single UPDATE."""
+    slot_ids = [pk for pk in slot_ids if pk is not None]
+    if slot_ids:
+        SpecializedAppointmentSlot.objects.filter(pk__in=slot_ids).update(
+            is_booked=Exists(SpecializedAppointment.objects.filter(slot=OuterRef('pk')))
+        )
+
+
+def free_doctor_slots(from_date):
+    """Unbooked doctor slots from a date on; an index range scan on (is_booked, date)."""
+    # The doctor is part of a slot's str(), which is how forms list them
+    return DoctorAppointmentSlot.objects.filter(is_booked=False, date__gte=from_date).select_related('doctor')
+
+
+def free_specialized_slots(from_date=None, appointment_type=None):
+    """Unbooked specialized slots, optionally from a date and for one appointment type."""
+    slots = SpecializedAppointmentSlot.objects.filter(is_booked=False).select_related('appointment_type')
+    if from_date is not None:
+        slots = slots.filter(date__gte=from_date)
+    if appointment_type is not None:
+        slots = slots.filter(appointment_type=appointment_type)
+    return slots
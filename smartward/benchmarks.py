@@ -0,0 +1,256 @@
+import gc
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import CustomUser, DoctorAppointment, Patient, SpecializedAppointment, SpecializedAppointmentType, Visit
+from .querybudget import QueryRecorder
+
+
+class Scenario:
+    """One GET request to benchmark: a URL name with its arguments, query string and user."""
+
+    def __init__(self, name, url_name, role=None, args=(), params=None):
+        self.name = name
+        self.url_name = url_name
+        self.role = role
+        self.args = args
+        self.params = params or {}
+
+
+class Fixtures:
+    """The users and rows the scenarios point at, picked from whatever data is loaded.
+
+    The doctor is the one with the most visits, so doctor_view_visits sees the
+    heaviest case in the dataset.
+    """
+
+    def __init__(self):
+        busiest = (
+            Visit.objects.values('doctor').annotate(n=Count('id')).order_by('-n').values_list('doctor', 'n').first()
+        )
+        self.doctor = CustomUser.objects.filter(pk=busiest[0]).first() if busiest else None
+        self.doctor_visits = busiest[1] if busiest else 0
+        if self.doctor is None:
+            self.doctor = CustomUser.objects.filter(usertype='doctor').order_by('pk').first()
+        self.nurse = CustomUser.objects.filter(usertype='nurse').order_by('pk').first()
+        self.receptionist = CustomUser.objects.filter(usertype='receptionist').order_by('pk').first()
+        self.patient = Patient.objects.order_by('pk').first()
+        self.visit = Visit.objects.filter(doctor=self.doctor).order_by('-pk').first() if self.doctor else None
+        self.appointment = DoctorAppointment.objects.filter(slot__start_at__gte=timezone.now()).order_by('pk').first()
+        self.specialized_appointment = SpecializedAppointment.objects.filter(
+            slot__start_at__gte=timezone.now()
+        ).order_by('pk').first()
+        self.appointment_type = SpecializedAppointmentType.objects.order_by('pk').first()
+
+    def user(self, role):
+        return getattr(self, role) if role else None
+
+    def describe(self):
+        return {
+            'patients': Patient.objects.count(),
+            'visits': Visit.objects.count(),
+            'doctor_visits': self.doctor_visits,
+        }
+
+
+def scenarios(fixtures):
+    """The benchmarked requests, covering every route in smartward/urls.py."""
+    f = fixtures
+    patient = f.patient
+    today = timezone.localdate()
+    export_range = {'first_date': today.strftime('%d/%m/%Y'), 'last_date': today.strftime('%d/%m/%Y')}
+    found = [
+        Scenario('home', 'home'),
+        Scenario('login', 'login'),
+        Scenario('logout', 'logout', 'receptionist'),
+        Scenario('doctor_dashboard', 'doctor_dashboard', 'doctor'),
+        Scenario('nurse_dashboard', 'nurse_dashboard', 'nurse'),
+        Scenario('receptionist_dashboard', 'receptionist_dashboard', 'receptionist'),
+        Scenario('on_duty', 'on_duty', 'receptionist'),
+        Scenario('doctor_profile', 'doctor_profile', 'doctor'),
+        Scenario('edit_profile', 'edit_profile', 'doctor'),
+        Scenario('book_appointment', 'book_appointment', 'receptionist'),
+        Scenario('appointment_success', 'appointment_success', 'receptionist'),
+        Scenario('doctor_appointments', 'doctor_appointments', 'doctor'),
+        Scenario('specialized_appointment_list', 'specialized_appointment_list', 'receptionist'),
+        Scenario('export_appointments', 'export_appointments', 'receptionist'),
+        Scenario('export_appointments_zip', 'export_appointments', 'receptionist', params={**export_range, 'output': 'zip'}),
+        # The test client is not ASGI, so this times the refusal rather than the stream
+        Scenario('slot_feed', 'slot_feed', 'receptionist'),
+        Scenario('slot_search', 'slot_search', 'receptionist'),
+        Scenario('slot_search_date', 'slot_search', 'receptionist', params={'date': today.isoformat()}),
+        Scenario('slot_search_specialized', 'slot_search', 'receptionist', params={'kind': 'specialized'}),
+        Scenario('staff_search', 'staff_search', 'nurse', params={'usertype': 'doctor'}),
+        Scenario('add_patient', 'add_patient', 'receptionist'),
+        Scenario('patient_list', 'patient_list', 'receptionist'),
+        Scenario('patient_visit_list', 'patient_visit_list', 'nurse'),
+        Scenario('doctor_view_visits', 'doctor_view_visits', 'doctor'),
+        Scenario('metrics', 'metrics'),
+    ]
+    if patient:
+        found += [
+            Scenario('patient_list_q_name', 'patient_list', 'receptionist', params={'q': patient.last_name}),
+            Scenario('patient_list_q_full_name', 'patient_list', 'receptionist',
+                     params={'q': f'{patient.first_name} {patient.last_name}'}),
+            Scenario('patient_list_q_id', 'patient_list', 'receptionist', params={'q': str(patient.pk)}),
+            Scenario('patient_visit_list_q', 'patient_visit_list', 'nurse', params={'q': patient.last_name}),
+            Scenario('doctor_view_visits_q', 'doctor_view_visits', 'doctor', params={'q': patient.last_name}),
+            Scenario('update_patient', 'update_patient', 'receptionist', args=(patient.pk,)),
+            Scenario('patient_detail', 'patient_detail', 'receptionist', args=(patient.pk,)),
+            Scenario('patient_detail_history', 'patient_detail', 'receptionist', args=(patient.pk,), params={'history': 1}),
+            Scenario('create_visit', 'create_visit', 'nurse', args=(patient.pk,)),
+        ]
+    if f.visit:
+        found.append(Scenario('doctor_attend_visit', 'doctor_attend_visit', 'doctor', args=(f.visit.pk,)))
+    if f.appointment:
+        found += [
+            # A GET only redirects; nothing is deleted
+            Scenario('delete_doctor_appointment', 'delete_doctor_appointment', 'receptionist', args=(f.appointment.pk,)),
+            Scenario('print_appointment', 'print_appointment', 'receptionist', args=(f.appointment.pk,)),
+        ]
+    if f.specialized_appointment:
+        found += [
+            Scenario('delete_specialized_appointment', 'delete_specialized_appointment', 'receptionist',
+                     args=(f.specialized_appointment.pk,)),
+            Scenario('sp_print_appointment', 'sp_print_appointment', 'receptionist', args=(f.specialized_appointment.pk,)),
+        ]
+    if f.appointment_type:
+        found.append(Scenario('book_specialized_appointment', 'book_specialized_appointment', 'receptionist',
+                              args=(f.appointment_type.pk,)))
+    return found
+
+
+def uncovered_routes(found):
+    """Named smartward routes that no scenario requests."""
+    from . import urls
+
+    covered = {scenario.url_name for scenario in found}
+    return sorted(
+        pattern.name for pattern in urls.urlpatterns
+        if pattern.name and pattern.name not in covered
+    )
+
+
+def _request(scenario, fixtures):
+    # A view that fails is recorded with its status instead of stopping the run
+    client = Client(raise_request_exception=False)
+    user = fixtures.user(scenario.role)
+    if user is not None:
+        client.force_login(user)
+    url = reverse(scenario.url_name, args=scenario.args)
+
+    def send():
+        response = client.get(url, scenario.params)
+        # Streamed responses do their work while being read
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        return response
+
+    return send
+
+
+def measure(scenario, fixtures, repeat=5, warmup=1):
+    """Time a scenario: median and minimum wall time, queries and peak traced memory of one run."""
+    for _ in range(warmup):
+        _request(scenario, fixtures)()
+
+    timings = []
+    for _ in range(repeat):
+        send = _request(scenario, fixtures)
+        gc.collect()
+        started = time.perf_counter()
+        response = send()
+        timings.append(time.perf_counter() - started)
+
+    # Queries and memory come from a separate run; tracing would distort the timings
+    send = _request(scenario, fixtures)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with QueryRecorder([connection.alias]) as recorder:
+            send()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'url': reverse(scenario.url_name, args=scenario.args),
+        'params': scenario.params,
+        'status': response.status_code,
+        'wall_ms_median': round(statistics.median(timings) * 1000, 3),
+        'wall_ms_min': round(min(timings) * 1000, 3),
+        'queries': len(recorder.queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def run(only=None, repeat=5, warmup=1, log=None):
+    """Benchmark the scenarios (all, or those named in `only`) and return the results document."""
+    log = log or (lambda message: None)
+    fixtures = Fixtures()
+    found = scenarios(fixtures)
+    if only:
+        found = [scenario for scenario in found if scenario.name in only]
+    results = {}
+    # The test client's host name, which ALLOWED_HOSTS may not list
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        for scenario in found:
+            results[scenario.name] = measure(scenario, fixtures, repeat, warmup)
+            result = results[scenario.name]
+            log(f"{scenario.name:34} {result['status']} {result['wall_ms_median']:9.1f} ms "
+                f"{result['queries']:4} queries {result['peak_kb']:9.1f} KB")
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'repeat': repeat,
+            'dataset': fixtures.describe(),
+            'uncovered_routes': uncovered_routes(found) if not only else [],
+        },
+        'results': results,
+    }
+
+
+def compare(current, baseline, tolerance=0.2, memory_tolerance=None):
+    """List regressions of `current` against `baseline`.
+
+    Wall time and peak memory may grow by `tolerance` (a fraction) before they
+    count; any extra query is a regression, as query counts do not vary between
+    runs. Scenarios missing from either side are ignored.
+    """
+    memory_tolerance = tolerance if memory_tolerance is None else memory_tolerance
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        if result['wall_ms_median'] > before['wall_ms_median'] * (1 + tolerance):
+            regressions.append(f"{name}: {before['wall_ms_median']} ms -> {result['wall_ms_median']} ms")
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        if result['peak_kb'] > before['peak_kb'] * (1 + memory_tolerance):
+            regressions.append(f"{name}: {before['peak_kb']} KB -> {result['peak_kb']} KB peak memory")
+        if result['status'] != before['status']:
+            regressions.append(f"{name}: status {before['status']} -> {result['status']}")
+    return regressions
+
+
+def save(document, path):
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
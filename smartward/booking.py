@@ -0,0 +1,57 @@
+import random
+import time
+
+from django.db import IntegrityError, OperationalError, transaction
+
+from .models import DoctorAppointment, DoctorAppointmentSlot, SpecializedAppointment, SpecializedAppointmentSlot
+
+RETRIES = 3
+
+
+class SlotUnavailable(Exception):
+    """The slot was booked by someone else between showing the form and saving it."""
+
+
+def _claim(slot_model, slot_id):
+    """Atomically flip a slot from free to booked.
+
+    The conditional UPDATE is a compare-and-set: of two concurrent claims the second
+    waits on the row lock and then matches zero rows, so it never sees a free slot
+    that has just been taken.
+    """
+    if not slot_model.objects.filter(pk=slot_id, is_booked=False).update(is_booked=True):
+        raise SlotUnavailable()
+
+
+def _with_retries(book, retries):
+    # Deadlocks and lock timeouts are transient under contention; a conflict is not.
+    for attempt in range(retries + 1):
+        try:
+            with transaction.atomic():
+                return book()
+        except IntegrityError:
+            # The unique constraint on the appointment's slot caught a double booking
+            raise SlotUnavailable()
+        except OperationalError:
+            if attempt == retries:
+                raise
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+
+def book_doctor_slot(patient_id, slot_id, retries=RETRIES):
+    """Book a doctor slot for a patient, raising SlotUnavailable if it is already taken."""
+    def book():
+        _claim(DoctorAppointmentSlot, slot_id)
+        doctor_id = DoctorAppointmentSlot.objects.values_list('doctor_id', flat=True).get(pk=slot_id)
+        return DoctorAppointment.objects.create(patient_id=patient_id, doctor_id=doctor_id, slot_id=slot_id)
+
+    return _with_retries(book, retries)
+
+
+def book_specialized_slot(patient_id, slot_id, retries=RETRIES):
+    """Book a specialized slot for a patient, raising SlotUnavailable if it is already taken."""
+    def book():
+        _claim(SpecializedAppointmentSlot, slot_id)
+        return SpecializedAppointment.objects.create(patient_id=patient_id, slot_id=slot_id)
+
+    return _with_retries(book, retries)
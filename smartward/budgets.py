@@ -0,0 +1,49 @@
+# Maximum number of SQL queries per request for each URL name in smartward/urls.py,
+# checked by smartward.querybudget. Counts include the session and user lookups and
+# cover the heaviest method of the view (usually the POST), with some headroom.
+DEFAULT_BUDGET = 20
+
+QUERY_BUDGETS = {
+    'home': 2,
+    'login': 10,  # user lookup, last_login update and a new session, each in a transaction
+    'logout': 4,
+
+    # Dashboards
+    'doctor_dashboard': 5,
+    'nurse_dashboard': 4,
+    'receptionist_dashboard': 5,
+    'on_duty': 3,
+
+    # Profile
+    'doctor_profile': 4,
+    'edit_profile': 8,
+
+    # Appointments
+    'book_appointment': 16,
+    'appointment_success': 3,
+    'doctor_appointments': 5,
+    'delete_doctor_appointment': 8,
+    'book_specialized_appointment': 12,
+    'specialized_appointment_list': 4,
+    'delete_specialized_appointment': 6,
+    'print_appointment': 3,
+    'sp_print_appointment': 3,
+    'export_appointments': 6,
+    'slot_feed': 2,
+    'slot_search': 3,
+    'staff_search': 3,
+
+    # Patients
+    'add_patient': 8,
+    'patient_list': 5,
+    'update_patient': 8,
+    'patient_detail': 4,
+
+    # Visits
+    'patient_visit_list': 5,
+    'create_visit': 10,
+    'doctor_view_visits': 5,
+    'doctor_attend_visit': 6,
+
+    'metrics': 1,
+}
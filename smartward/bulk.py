@@ -0,0 +1,55 @@
+from itertools import islice
+
+from django.db import connections, transaction
+
+
+def _adapter(field, connection):
+    """The backend conversion a column needs before it reaches the driver, or None."""
+    internal_type = field.get_internal_type()
+    if internal_type == 'DateTimeField':
+        return connection.ops.adapt_datetimefield_value
+    if internal_type == 'DateField':
+        return connection.ops.adapt_datefield_value
+    if internal_type == 'DecimalField':
+        return lambda value: connection.ops.adapt_decimalfield_value(value, field.max_digits, field.decimal_places)
+    return None
+
+
+def insert_rows(model, field_names, rows, batch_size=5000, progress=None, using='default'):
+    """INSERT plain tuples into a model's table with executemany, one transaction per batch.
+
+    For loading millions of rows: bulk_create builds a model instance and runs
+    each field's preparation for every value, which caps it at a few thousand
+    rows a second. Here values go straight to the driver, converting only
+    dates, datetimes and decimals. Like bulk_create no signals are sent, and
+    field defaults are not applied, so every column needed must be given.
+    Returns the number of rows written; `progress(count)` is called after each batch.
+    """
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in field_names]
+    adapters = [(i, adapter) for i, adapter in enumerate(_adapter(field, connection) for field in fields) if adapter]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+
+    count = 0
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        if adapters:
+            batch = [list(row) for row in batch]
+            for row in batch:
+                for i, adapter in adapters:
+                    if row[i] is not None:
+                        row[i] = adapter(row[i])
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            cursor.executemany(sql, batch)
+        count += len(batch)
+        if progress:
+            progress(count)
+    return count
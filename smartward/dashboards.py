@@ -0,0 +1,143 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import MAX_SHIFT_LENGTH, DoctorAppointment, DoctorAppointmentSlot, Shift
+
+# Every entry is stored under the current versions of the scopes it was built
+# from. A change bumps those versions, so later reads look up a new key and the
+# old entry is never served again; it is left to expire. The versions are read
+# before the queries run, so an entry built from data that changed meanwhile
+# lands under a key that is already out of date.
+SHIFTS = 'shifts'
+APPOINTMENTS = 'appointments'
+
+_pending = threading.local()
+
+
+def _timeout():
+    return getattr(settings, 'DASHBOARD_CACHE_TIMEOUT', 300)
+
+
+def _version_key(scope):
+    return f'dashboard:version:{scope}'
+
+
+def _versions(scopes):
+    keys = [_version_key(scope) for scope in scopes]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start from the clock rather than 1: a counter that was evicted must
+            # not come back at a value old entries were stored under
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return '.'.join(str(found[key]) for key in keys)
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def _cached(name, scopes, compute):
+    key = f'dashboard:{name}:{_versions(scopes)}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, _timeout())
+    return value
+
+
+def invalidate(*scopes):
+    """Bump the versions of `scopes` once the current transaction commits.
+
+    Scopes from many rows changed in one transaction are bumped once each.
+    """
+    pending = getattr(_pending, 'scopes', None)
+    if pending is None:
+        pending = _pending.scopes = set()
+    pending.update(scopes)
+    transaction.on_commit(_flush)
+
+
+def _flush():
+    # A rolled-back transaction leaves its scopes here for the next commit,
+    # which only costs an extra rebuild
+    scopes, _pending.scopes = _pending.scopes, set()
+    if scopes:
+        _bump(sorted(scopes))
+
+
+def invalidate_shifts(doctor_ids):
+    invalidate(SHIFTS, *(f'{SHIFTS}:{doctor_id}' for doctor_id in doctor_ids))
+
+
+def invalidate_appointments(doctor_ids):
+    invalidate(APPOINTMENTS, *(f'{APPOINTMENTS}:{doctor_id}' for doctor_id in doctor_ids))
+
+
+def doctor_shifts(doctor_id):
+    """The doctor's shifts that have not started yet, soonest first."""
+    shifts = _cached(f'doctor_shifts:{doctor_id}', [f'{SHIFTS}:{doctor_id}'], lambda: list(
+        Shift.objects.filter(doctor_id=doctor_id, start_time__gt=timezone.now())
+        .order_by('start_time').values('start_time', 'end_time')
+    ))
+    # An entry can be a few minutes old, so shifts that have started since drop out here
+    now = timezone.now()
+    return [shift for shift in shifts if shift['start_time'] > now]
+
+
+def doctor_appointment_summary(doctor_id):
+    """Today's booked and free slots of a doctor, and appointments booked from today on."""
+    today = timezone.localdate()
+
+    def compute():
+        counts = DoctorAppointmentSlot.objects.filter(doctor_id=doctor_id, date=today).aggregate(
+            booked=Count('id', filter=Q(is_booked=True)),
+            free=Count('id', filter=Q(is_booked=False)),
+        )
+        counts['upcoming'] = DoctorAppointment.objects.filter(doctor_id=doctor_id, slot__date__gte=today).count()
+        return counts
+
+    return _cached(f'doctor_appointments:{doctor_id}:{today}', [f'{APPOINTMENTS}:{doctor_id}'], compute)
+
+
+def current_shifts():
+    """Doctors' shifts that have not ended and start within DASHBOARD_SHIFT_DAYS, soonest first."""
+    def compute():
+        now = timezone.now()
+        horizon = now + timedelta(days=getattr(settings, 'DASHBOARD_SHIFT_DAYS', 7))
+        return list(
+            Shift.objects.filter(
+                doctor__usertype='doctor', start_time__gte=now - MAX_SHIFT_LENGTH, start_time__lt=horizon,
+                end_time__gt=now,
+            )
+            .order_by('start_time', 'id')
+            .values('start_time', 'end_time', doctor_username=F('doctor__username'))
+        )
+
+    shifts = _cached('current_shifts', [SHIFTS], compute)
+    now = timezone.now()
+    return [shift for shift in shifts if shift['end_time'] > now]
+
+
+def appointment_summary():
+    """Per doctor with slots today: booked and free slot counts, busiest first."""
+    today = timezone.localdate()
+    return _cached(f'appointments:{today}', [APPOINTMENTS], lambda: list(
+        DoctorAppointmentSlot.objects.filter(date=today)
+        .values(doctor_username=F('doctor__username'))
+        .annotate(booked=Count('id', filter=Q(is_booked=True)), free=Count('id', filter=Q(is_booked=False)))
+        .order_by('-booked', 'doctor_username')
+    ))
@@ -0,0 +1,245 @@
+import random
+import time
+from array import array
+from datetime import datetime, time as dt_time, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import bulk, search, slots
+from .models import (
+    CustomUser, DoctorAppointment, DoctorAppointmentSlot, Patient, Shift, SpecializedAppointment,
+    SpecializedAppointmentSlot, SpecializedAppointmentType, Visit, slot_bounds,
+)
+
+FIRST_NAMES = (
+    'Aisha', 'Akanisi', 'Alesana', 'Amit', 'Ana', 'Anjali', 'Arun', 'Asena', 'Ben', 'Chloe', 'Daniel', 'Deepak',
+    'Elena', 'Emele', 'Epeli', 'Fatima', 'Grace', 'Hannah', 'Iliesa', 'Isaac', 'Jack', 'James', 'Jone', 'Kavita',
+    'Kelera', 'Laisa', 'Liam', 'Lusiana', 'Maria', 'Meera', 'Mere', 'Mohammed', 'Nikhil', 'Noah', 'Olivia',
+    'Paula', 'Pita', 'Priya', 'Rahul', 'Ravi', 'Ruci', 'Sai', 'Salote', 'Samuela', 'Sanjay', 'Sarah', 'Seini',
+    'Sereana', 'Sunita', 'Tevita', 'Timoci', 'Unaisi', 'Vani', 'Vijay', 'Viliame', 'Waisea', 'Yash', 'Zara',
+)
+LAST_NAMES = (
+    'Ali', 'Bainimarama', 'Brown', 'Chand', 'Chen', 'Delana', 'Fong', 'Gounder', 'Kaur', 'Koroi', 'Kumar',
+    'Lal', 'Lee', 'Mataitoga', 'Naidu', 'Nair', 'Nand', 'Narayan', 'Prasad', 'Qarase', 'Rabuka', 'Raj', 'Ram',
+    'Reddy', 'Seru', 'Sharma', 'Singh', 'Smith', 'Taylor', 'Tikoduadua', 'Tuilagi', 'Vakaloloma', 'Verma',
+    'Vunibobo', 'Waqa', 'Williams', 'Wong', 'Yee',
+)
+STREETS = ('Victoria Parade', 'Waimanu Road', 'Princes Road', 'Ratu Sukuna Road', 'Grantham Road', 'Queens Road')
+TOWNS = ('Suva', 'Nausori', 'Lautoka', 'Nadi', 'Labasa', 'Ba', 'Sigatoka', 'Savusavu')
+CONDITIONS = ('Asthma', 'Diabetes', 'Hypertension', 'Arthritis', 'Allergies', 'Gout', 'Anaemia')
+APPOINTMENT_TYPES = ('X-Ray', 'Ultrasound', 'Blood Test', 'Physiotherapy', 'Dental Check', 'Eye Test')
+
+WEIGHTS = [Decimal(n) / 2 for n in range(6, 300)]  # 3.0 to 149.5 kg
+TEMPERATURES = [Decimal(n) / 10 for n in range(355, 401)]  # 35.5 to 40.0 °C
+SHIFT_HOURS = (dt_time(8), dt_time(16))
+SPECIALIZED_HOURS = (dt_time(9), dt_time(16))
+SPECIALIZED_SLOT_LENGTH = timedelta(minutes=30)
+
+
+class DatasetGenerator:
+    """Fills the database with a deterministic synthetic clinic.
+
+    Everything is written in batches, one transaction per batch, with
+    bulk_create, or for the two big tables (patients and visits) with
+    bulk.insert_rows. Neither sends model signals, so the fields the signals
+    maintain (slot start_at/end_at and is_booked) are filled in here and the
+    search index is rebuilt at the end. All rows are tagged with `prefix`
+    (usernames and patient emails) so a second dataset can be loaded next to
+    the first. Dates are laid out around `now`, so the same seed and `now`
+    give the same data.
+    """
+
+    def __init__(self, seed=0, prefix='synthetic', batch_size=5000, now=None, log=None):
+        self.rng = random.Random(seed)
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.now = now or timezone.now()
+        self.log = log or (lambda message: None)
+
+    def _bulk_create(self, model, objects, total=None):
+        """bulk_create an iterable in batches; returns the number of rows written."""
+        count = 0
+        batch = []
+        started = time.perf_counter()
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                count += self._write(model, batch)
+                batch = []
+                if total and count % (self.batch_size * 20) == 0:
+                    self.log(f"  {model.__name__}: {count}/{total} ({count / (time.perf_counter() - started):.0f} rows/s)")
+        count += self._write(model, batch)
+        self.log(f"{model.__name__}: {count} rows in {time.perf_counter() - started:.1f}s")
+        return count
+
+    def _insert_rows(self, model, field_names, rows, total):
+        started = time.perf_counter()
+
+        def progress(count):
+            if count % (self.batch_size * 20) == 0:
+                self.log(f"  {model.__name__}: {count}/{total} ({count / (time.perf_counter() - started):.0f} rows/s)")
+
+        count = bulk.insert_rows(model, field_names, rows, self.batch_size, progress)
+        self.log(f"{model.__name__}: {count} rows in {time.perf_counter() - started:.1f}s")
+        return count
+
+    def _write(self, model, batch):
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+        return len(batch)
+
+    def staff(self, usertype, count):
+        # One password hash for everyone: hashing is deliberately slow
+        password = make_password('password')
+        code = usertype[0].upper()
+        self._bulk_create(CustomUser, (
+            CustomUser(
+                username=f'{self.prefix}_{usertype}{n:04d}', id_number=f'{self.prefix[:10]}-{code}{n}',
+                usertype=usertype, password=password,
+                first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+            )
+            for n in range(count)
+        ))
+        return list(CustomUser.objects.filter(
+            usertype=usertype, username__startswith=f'{self.prefix}_{usertype}'
+        ).values_list('pk', flat=True))
+
+    def patients(self, count):
+        rng = self.rng
+        today = self.now.date()
+
+        def patient(n):
+            first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            return (
+                first_name, last_name,
+                f'{rng.randint(1, 400)} {rng.choice(STREETS)}, {rng.choice(TOWNS)}',
+                f'{rng.randint(2000000, 9999999)}',
+                f'{rng.randint(2000000, 9999999)}',
+                today - timedelta(days=rng.randint(0, 95 * 365)),
+                f'{first_name}.{last_name}.{n}@{self.prefix}.example.com'.lower(),
+                rng.choice(CONDITIONS) if rng.random() < 0.3 else None,
+            )
+
+        self._insert_rows(Patient, (
+            'first_name', 'last_name', 'address', 'phone_contact', 'emergency_contact', 'dob', 'email',
+            'medical_conditions',
+        ), (patient(n) for n in range(count)), count)
+        # Ids only; a compact array keeps a million of them cheap
+        return array('q', Patient.objects.filter(
+            email__endswith=f'@{self.prefix}.example.com'
+        ).order_by('pk').values_list('pk', flat=True).iterator(chunk_size=10000))
+
+    def shifts(self, doctor_ids, days_back, days_ahead):
+        """Weekday day shifts for every doctor, each doctor taking about one day in five off."""
+        tz = timezone.get_current_timezone()
+        today = timezone.localdate(self.now)
+        shifts = []
+        for offset in range(-days_back, days_ahead + 1):
+            day = today + timedelta(days=offset)
+            if day.weekday() >= 5:
+                continue
+            for doctor_id in doctor_ids:
+                if self.rng.random() < 0.2:
+                    continue
+                shifts.append(Shift(
+                    doctor_id=doctor_id,
+                    start_time=timezone.make_aware(datetime.combine(day, SHIFT_HOURS[0]), tz),
+                    end_time=timezone.make_aware(datetime.combine(day, SHIFT_HOURS[1]), tz),
+                ))
+        self._bulk_create(Shift, shifts)
+        return shifts
+
+    def doctor_slots(self, shifts, booked_ratio, patient_ids):
+        """Cut the upcoming shifts into slots and book a share of them."""
+        planned, _ = slots.plan_slots(
+            [shift for shift in shifts if shift.end_time > self.now], start=self.now, now=self.now
+        )
+        for slot in planned:
+            slot.is_booked = self.rng.random() < booked_ratio
+        self._bulk_create(DoctorAppointmentSlot, planned)
+        if not planned:
+            return
+        booked = DoctorAppointmentSlot.objects.filter(
+            doctor_id__in={slot.doctor_id for slot in planned}, is_booked=True, start_at__gte=self.now
+        ).values_list('pk', 'doctor_id')
+        self._bulk_create(DoctorAppointment, (
+            DoctorAppointment(slot_id=slot_id, doctor_id=doctor_id, patient_id=self.rng.choice(patient_ids))
+            for slot_id, doctor_id in booked.iterator(chunk_size=self.batch_size)
+        ))
+
+    def specialized(self, days_ahead, booked_ratio, patient_ids):
+        """Half-hourly slots for each appointment type on the coming weekdays, a share of them booked."""
+        types = []
+        for name in APPOINTMENT_TYPES:
+            appointment_type, _ = SpecializedAppointmentType.objects.get_or_create(
+                name=name, defaults={'description': f'{name} appointments'}
+            )
+            types.append(appointment_type)
+
+        today = timezone.localdate(self.now)
+        planned = []
+        for offset in range(days_ahead + 1):
+            day = today + timedelta(days=offset)
+            if day.weekday() >= 5:
+                continue
+            start = datetime.combine(day, SPECIALIZED_HOURS[0])
+            while start.time() < SPECIALIZED_HOURS[1]:
+                end = start + SPECIALIZED_SLOT_LENGTH
+                start_at, end_at = slot_bounds(day, start.time(), end.time())
+                if start_at > self.now:
+                    for appointment_type in types:
+                        planned.append(SpecializedAppointmentSlot(
+                            appointment_type=appointment_type, date=day,
+                            start_time=start.time(), end_time=end.time(), start_at=start_at, end_at=end_at,
+                            is_booked=self.rng.random() < booked_ratio,
+                        ))
+                start = end
+        # Only the newly created booked slots, not those of an earlier dataset
+        newest = SpecializedAppointmentSlot.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+        self._bulk_create(SpecializedAppointmentSlot, planned)
+        booked = SpecializedAppointmentSlot.objects.filter(pk__gt=newest, is_booked=True).values_list('pk', flat=True)
+        self._bulk_create(SpecializedAppointment, (
+            SpecializedAppointment(slot_id=slot_id, patient_id=self.rng.choice(patient_ids))
+            for slot_id in booked.iterator(chunk_size=self.batch_size)
+        ))
+
+    def visits(self, count, patient_ids, doctor_ids, nurse_ids, days_back):
+        rng = self.rng
+        span = days_back * 86400
+
+        def visit():
+            return (
+                rng.choice(patient_ids), rng.choice(doctor_ids), rng.choice(nurse_ids),
+                self.now - timedelta(seconds=rng.randrange(span)),
+                rng.choice(WEIGHTS), rng.choice(TEMPERATURES),
+                f'{rng.randint(90, 180)}/{rng.randint(55, 110)}',
+                'Reviewed.' if rng.random() < 0.5 else None,
+            )
+
+        self._insert_rows(Visit, (
+            'patient', 'doctor', 'nurse', 'visit_date', 'weight', 'temperature', 'blood_pressure', 'doctor_notes',
+        ), (visit() for _ in range(count)), count)
+
+    def generate(self, doctors, nurses, receptionists, patients, visits, days_back, days_ahead,
+                 booked_ratio, index=True):
+        if CustomUser.objects.filter(username__startswith=f'{self.prefix}_').exists():
+            raise ValueError(f"A dataset with prefix {self.prefix!r} already exists; choose another prefix.")
+        if not (doctors and nurses and patients):
+            raise ValueError("At least one doctor, one nurse and one patient are needed.")
+
+        doctor_ids = self.staff('doctor', doctors)
+        nurse_ids = self.staff('nurse', nurses)
+        self.staff('receptionist', receptionists)
+        patient_ids = self.patients(patients)
+        shifts = self.shifts(doctor_ids, days_back, days_ahead)
+        self.doctor_slots(shifts, booked_ratio, patient_ids)
+        self.specialized(days_ahead, booked_ratio, patient_ids)
+        self.visits(visits, patient_ids, doctor_ids, nurse_ids, days_back)
+        if index:
+            started = time.perf_counter()
+            count = search.rebuild_index(batch_size=self.batch_size)
+            self.log(f"Search index: {count} patients in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,139 @@
+import io
+import tempfile
+import zipfile
+
+from django.conf import settings
+
+from . import pdf
+from .models import DoctorAppointment, SpecializedAppointment
+
+SLIP_TEMPLATES = {
+    'doctor_appointment': 'appointment_pdf_template.html',
+    'specialized_appointment': 'sp_Appointment_pdf_template.html',
+}
+SHEET_TEMPLATE = 'appointment_sheet_pdf_template.html'
+CHUNK_SIZE = 200
+
+
+class SheetTooLarge(pdf.PdfError):
+    """The range has more appointments than one PDF may have pages."""
+
+
+def appointments_between(first_date, last_date, doctor=None, appointment_type=None):
+    """Doctor and specialized appointments on dates first_date..last_date, in time order.
+
+    Each is a single select_related query. Specialized appointments have no
+    doctor, so a doctor filter leaves them out, and an appointment type filter
+    leaves out the doctor appointments.
+    """
+    doctor_appointments = DoctorAppointment.objects.none()
+    specialized_appointments = SpecializedAppointment.objects.none()
+    if appointment_type is None:
+        doctor_appointments = DoctorAppointment.objects.filter(
+            slot__date__range=(first_date, last_date)
+        ).select_related('patient', 'doctor', 'slot').order_by('slot__start_at', 'id')
+        if doctor is not None:
+            doctor_appointments = doctor_appointments.filter(doctor=doctor)
+    if doctor is None:
+        specialized_appointments = SpecializedAppointment.objects.filter(
+            slot__date__range=(first_date, last_date)
+        ).select_related('patient', 'slot__appointment_type').order_by('slot__start_at', 'id')
+        if appointment_type is not None:
+            specialized_appointments = specialized_appointments.filter(slot__appointment_type=appointment_type)
+    return doctor_appointments, specialized_appointments
+
+
+def _chunks(appointments):
+    chunk = []
+    for appointment in appointments.iterator(chunk_size=CHUNK_SIZE):
+        chunk.append(appointment)
+        if len(chunk) == CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def sheet_pdf(doctor_appointments, specialized_appointments):
+    """All the slips as one PDF file, one page per appointment, rewound to the start.
+
+    xhtml2pdf lays a whole document out in memory, so the slips are rendered
+    CHUNK_SIZE at a time, each chunk in its own worker job, and the pages are
+    joined with pypdf into a temporary file. pypdf still holds every finished
+    page until the file is written, about as much memory as the file's size,
+    so ranges of more than PDF_EXPORT_MAX_PAGES appointments raise SheetTooLarge
+    and should be exported as a ZIP, which stays flat.
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    max_pages = getattr(settings, 'PDF_EXPORT_MAX_PAGES', 2000)
+    if doctor_appointments.count() + specialized_appointments.count() > max_pages:
+        raise SheetTooLarge(
+            f"The range has more than {max_pages} appointments, too many for one PDF. Export a ZIP instead."
+        )
+    timeout = getattr(settings, 'PDF_EXPORT_TIMEOUT', 300)
+    writer = PdfWriter()
+    for name, appointments in (
+        ('doctor_appointments', doctor_appointments),
+        ('specialized_appointments', specialized_appointments),
+    ):
+        for chunk in _chunks(appointments):
+            context = {'doctor_appointments': [], 'specialized_appointments': [], name: chunk}
+            writer.append(PdfReader(io.BytesIO(pdf.render_pdf(SHEET_TEMPLATE, context, timeout))))
+    if not writer.pages:
+        # The template's "No appointments in this range." page
+        writer.append(PdfReader(io.BytesIO(pdf.render_pdf(SHEET_TEMPLATE, {}, timeout))))
+    output = tempfile.TemporaryFile()
+    writer.write(output)
+    output.seek(0)
+    return output
+
+
+class _ZipBuffer(io.RawIOBase):
+    """A write-only stream that hands back whatever zipfile wrote since the last drain."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def zip_stream(doctor_appointments, specialized_appointments):
+    """Yield a ZIP archive of the slips piece by piece.
+
+    Rows are read in chunks and each slip is written and yielded before the
+    next is rendered, so memory stays flat however many appointments there are.
+    Cached slips are reused, but new ones are not added to the PDF cache, which
+    would otherwise push out the slips being reprinted. Slips that cannot be
+    rendered are listed in errors.txt instead.
+    """
+    buffer = _ZipBuffer()
+    errors = []
+    # PDFs are already compressed, so the entries are stored as they are
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+        for kind, appointments in (
+            ('doctor_appointment', doctor_appointments),
+            ('specialized_appointment', specialized_appointments),
+        ):
+            for appointment in appointments.iterator(chunk_size=CHUNK_SIZE):
+                name = f'{appointment.slot.date}/{kind}_{appointment.id}.pdf'
+                try:
+                    content = pdf.appointment_pdf(SLIP_TEMPLATES[kind], kind, appointment, store=False)
+                except pdf.PdfError as err:
+                    errors.append(f'{name}: {err}')
+                    continue
+                archive.writestr(name, content)
+                yield buffer.drain()
+        if errors:
+            archive.writestr('errors.txt', '\n'.join(errors) + '\n')
+    yield buffer.drain()
@@ -1,13 +1,64 @@
-from datetime import date, timedelta
+import copy
+from datetime import date
+from urllib.parse import urlencode
 from django.utils import timezone
 from django import forms
 from django.contrib.auth.forms import UserChangeForm
-from .models import CustomUser, DoctorAppointment, DoctorAppointmentSlot, Patient, Shift, SpecializedAppointment, SpecializedAppointmentSlot, Visit
+from django.urls import reverse
+from .models import CustomUser, DoctorAppointment, DoctorAppointmentSlot, Patient, Shift, SpecializedAppointment, SpecializedAppointmentSlot, SpecializedAppointmentType, Visit
 from django.core.exceptions import ValidationError
-import pytz
+from . import availability, booking
 import datetime
 
 
+class PickerWidget(forms.Widget):
+    """Picks a ModelChoiceField value by searching a JSON endpoint (smartward.pickers, static/picker.js).
+
+    Unlike Select it never loads the field's choices: rendering costs at most one
+    query, for the label of the current value. `params` are sent with every search.
+    """
+    template_name = 'widgets/picker.html'
+
+    class Media:
+        js = ['picker.js']
+
+    def __init__(self, url_name, params=None, date_filter=False, placeholder='Search', attrs=None):
+        super().__init__(attrs)
+        self.url_name = url_name
+        self.params = dict(params or {})
+        self.date_filter = date_filter
+        self.placeholder = placeholder
+
+    def __deepcopy__(self, memo):
+        obj = super().__deepcopy__(memo)
+        obj.params = copy.copy(self.params)
+        return obj
+
+    def _label(self, value):
+        choices = getattr(self, 'choices', None)
+        if value in (None, '') or not hasattr(choices, 'queryset'):
+            return None
+        try:
+            obj = choices.queryset.filter(pk=value).first()
+        except (ValueError, TypeError, ValidationError):
+            return None
+        return choices.field.label_from_instance(obj) if obj is not None else None
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        label = self._label(context['widget']['value'])
+        context['widget'].update({
+            # A value that is not among the choices is dropped, as a <select> would
+            'value': context['widget']['value'] if label is not None else None,
+            'label': label,
+            'url': reverse(self.url_name),
+            'params': urlencode(self.params),
+            'date_filter': self.date_filter,
+            'placeholder': self.placeholder,
+        })
+        return context
+
+
 class ProfileUpdateForm(UserChangeForm):
     password = None  # Exclude the password field
 
@@ -94,7 +145,7 @@ class ShiftForm(forms.ModelForm):
             raise forms.ValidationError("End time must be after start time.")
 
         # Convert times to Fiji Time before further validation
-        tz = pytz.timezone('Pacific/Fiji')
+        tz = timezone.get_default_timezone()
         if start_time and timezone.is_naive(start_time):
             cleaned_data['start_time'] = timezone.make_aware(start_time, tz)
         if end_time and timezone.is_naive(end_time):
@@ -112,37 +163,8 @@ class DoctorAppointmentSlotAdminForm(forms.ModelForm):
             'end_time': forms.TimeInput(attrs={'type': 'time'}),
         }
 
-    def clean(self):
-        cleaned_data = super().clean()
-        start_time = cleaned_data.get('start_time')
-        end_time = cleaned_data.get('end_time')
-        date = cleaned_data.get('date')
-
-        if start_time is None or end_time is None:
-            raise ValidationError("Both start time and end time must be specified.")
-
-        if start_time >= end_time:
-            raise ValidationError("End time must be after start time.")
-
-        if date:
-            now = timezone.localtime()
-            slot_datetime = timezone.make_aware(
-                timezone.datetime.combine(date, start_time),
-                timezone.get_current_timezone()
-            )
-            if slot_datetime < now:
-                raise ValidationError("The slot cannot be in the past.")
-        
-        slot_duration = timedelta(
-            hours=end_time.hour - start_time.hour,
-            minutes=end_time.minute - start_time.minute
-        )
-        max_duration = timedelta(minutes=30)
-
-        if slot_duration > max_duration:
-            raise ValidationError("The appointment slot duration cannot exceed 30 minutes.")
-
-        return cleaned_data
+    # Validation is done by DoctorAppointmentSlot.clean(), which shares its rules
+    # and shift lookup with the bulk slot tools in smartward.slots.
     
     
 class SpecializedAppointmentForm(forms.ModelForm):
@@ -150,7 +172,7 @@ class SpecializedAppointmentForm(forms.ModelForm):
     slot = forms.ModelChoiceField(
         queryset=SpecializedAppointmentSlot.objects.none(),
         label='Available Slots',
-        widget=forms.Select
+        widget=PickerWidget('slot_search', {'kind': 'specialized'}, date_filter=True, placeholder='Appointment type')
     )
 
     class Meta:
@@ -160,11 +182,11 @@ class SpecializedAppointmentForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Filter slots that are only in the future and not already booked
-        self.fields['slot'].queryset = SpecializedAppointmentSlot.objects.filter(
-            date__gte=timezone.now().date()
-        ).exclude(
-            specializedappointment__isnull=False  # Exclude already booked slots
-        )
+        self.fields['slot'].queryset = availability.free_specialized_slots(from_date=timezone.now().date())
+        appointment_type = self.initial.get('appointment_type')
+        if appointment_type is not None:
+            # The booking page is for one type, so the picker starts with its slots
+            self.fields['slot'].widget.params['appointment_type'] = appointment_type.pk
 
     def clean_patient_id(self):
         patient_id = self.cleaned_data.get('patient_id')
@@ -173,10 +195,11 @@ class SpecializedAppointmentForm(forms.ModelForm):
         return patient_id
 
     def save(self, commit=True):
+        """Book the slot; raises booking.SlotUnavailable if it was taken in the meantime."""
+        if commit:
+            return booking.book_specialized_slot(self.cleaned_data['patient_id'], self.cleaned_data['slot'].pk)
         instance = super().save(commit=False)
         instance.patient = Patient.objects.get(id=self.cleaned_data['patient_id'])
-        if commit:
-            instance.save()
         return instance
 
 class DoctorAppointmentForm(forms.ModelForm):
@@ -211,15 +234,14 @@ class ReceptionistAppointmentForm(forms.ModelForm):
     class Meta:
         model = DoctorAppointment
         fields = ['patient_id', 'slot']
+        widgets = {
+            'slot': PickerWidget('slot_search', {'kind': 'doctor'}, date_filter=True, placeholder='Doctor name'),
+        }
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Filter slots that are only in the future and not already booked
-        self.fields['slot'].queryset = DoctorAppointmentSlot.objects.filter(
-            date__gte=timezone.now().date()
-        ).exclude(
-            doctorappointment__isnull=False  # Exclude already booked slots
-        )
+        self.fields['slot'].queryset = availability.free_doctor_slots(timezone.now().date())
 
     def clean_patient_id(self):
         patient_id = self.cleaned_data.get('patient_id')
@@ -228,11 +250,12 @@ class ReceptionistAppointmentForm(forms.ModelForm):
         return patient_id
 
     def save(self, commit=True):
+        """Book the slot; raises booking.SlotUnavailable if it was taken in the meantime."""
+        if commit:
+            return booking.book_doctor_slot(self.cleaned_data['patient_id'], self.cleaned_data['slot'].pk)
         appointment = super().save(commit=False)
         appointment.patient_id = self.cleaned_data['patient_id']  # Set patient from patient_id
         appointment.doctor = self.cleaned_data['slot'].doctor  # Set doctor from the selected slot
-        if commit:
-            appointment.save()
         return appointment
     
 
@@ -242,6 +265,7 @@ class VisitForm(forms.ModelForm):
         fields = ['patient', 'doctor', 'weight', 'temperature', 'blood_pressure']
         widgets = {
             'patient': forms.HiddenInput(),  # We'll pass patient data directly
+            'doctor': PickerWidget('staff_search', {'usertype': 'doctor'}, placeholder='Doctor name'),
         }
 
 
@@ -252,3 +276,46 @@ class DoctorVisitForm(forms.ModelForm):
         widgets = {
             'doctor_notes': forms.Textarea(attrs={'rows': 5, 'cols': 40}),
         }
+
+
+class AppointmentExportForm(forms.Form):
+    MAX_DAYS = 31
+    OUTPUT_CHOICES = [
+        ('pdf', 'One PDF, a page per appointment'),
+        ('zip', 'ZIP of appointment slips'),
+    ]
+
+    first_date = forms.DateField(
+        label='From',
+        widget=forms.DateInput(format='%d/%m/%Y', attrs={'placeholder': 'dd/mm/yyyy'}),
+        input_formats=['%d/%m/%Y']
+    )
+    last_date = forms.DateField(
+        label='To',
+        widget=forms.DateInput(format='%d/%m/%Y', attrs={'placeholder': 'dd/mm/yyyy'}),
+        input_formats=['%d/%m/%Y']
+    )
+    doctor = forms.ModelChoiceField(
+        queryset=CustomUser.objects.filter(usertype='doctor'), required=False,
+        help_text='Only this doctor\'s appointments.'
+    )
+    appointment_type = forms.ModelChoiceField(
+        queryset=SpecializedAppointmentType.objects.all(), required=False,
+        help_text='Only specialized appointments of this type.'
+    )
+    output = forms.ChoiceField(choices=OUTPUT_CHOICES)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        first_date = cleaned_data.get('first_date')
+        last_date = cleaned_data.get('last_date')
+
+        if first_date and last_date:
+            if last_date < first_date:
+                raise ValidationError("The end date must not be before the start date.")
+            if (last_date - first_date).days >= self.MAX_DAYS:
+                raise ValidationError(f"Export at most {self.MAX_DAYS} days at a time.")
+
+        if cleaned_data.get('doctor') and cleaned_data.get('appointment_type'):
+            raise ValidationError("Choose either a doctor or an appointment type, not both.")
+        return cleaned_data
@@ -0,0 +1,130 @@
+import json
+import os
+import re
+import subprocess
+import sys
+
+# Packages that must only load when a feature needs them: PDF rendering,
+# Celery and the PDF process pool. A web worker that has them after boot pays
+# for them in start-up time and memory though most requests never print or
+# schedule anything. Django's sqlite backend and asgiref already import
+# multiprocessing and concurrent.futures themselves, so the pool is caught by
+# the submodules only a ProcessPoolExecutor pulls in.
+LAZY_MODULES = (
+    'xhtml2pdf', 'reportlab', 'pypdf', 'celery', 'kombu', 'concurrent.futures.process', 'multiprocessing.queues',
+)
+
+# What a web worker does before its first request
+BOOT = '''
+import json, resource, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+from django.core.wsgi import get_wsgi_application
+from django.urls import get_resolver
+get_wsgi_application()
+get_resolver().url_patterns
+print(json.dumps({
+    'seconds': time.perf_counter() - started,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': sorted(sys.modules),
+}))
+'''
+
+_LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+class ImportNode:
+    """One module in the import tree with its own and cumulative import time in microseconds."""
+
+    def __init__(self, name, self_us, cumulative_us):
+        self.name = name
+        self.self_us = self_us
+        self.cumulative_us = cumulative_us
+        self.children = []
+
+
+def parse(output):
+    """Build the import tree from `python -X importtime` output; returns the top-level nodes.
+
+    A module is printed after everything it imported, one indent deeper than
+    itself, so each line adopts the pending lines of the next level down.
+    """
+    pending = {}
+    for line in output.splitlines():
+        match = _LINE_RE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        level = len(indent) // 2
+        node = ImportNode(name, int(self_us), int(cumulative_us))
+        node.children = pending.pop(level + 1, [])
+        pending.setdefault(level, []).append(node)
+    return pending.get(0, [])
+
+
+def format_tree(roots, min_ms=1.0, depth=None):
+    """Lines of the tree ranked by cumulative time, leaving out modules faster than `min_ms`."""
+    lines = []
+
+    def walk(nodes, level):
+        for node in sorted(nodes, key=lambda node: node.cumulative_us, reverse=True):
+            if node.cumulative_us < min_ms * 1000:
+                break
+            lines.append(f"{node.cumulative_us / 1000:9.1f} {node.self_us / 1000:8.1f}  {'  ' * level}{node.name}")
+            if depth is None or level + 1 < depth:
+                walk(node.children, level + 1)
+
+    walk(roots, 0)
+    return lines
+
+
+def profile_boot():
+    """Boot a web worker in a fresh interpreter with the current settings and profile its imports.
+
+    Returns (tree roots, {'seconds', 'max_rss_kb', 'modules'}); the timing is
+    taken with -X importtime on, which adds a little overhead of its own.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT], capture_output=True, text=True, cwd=os.getcwd(),
+    )
+    if result.returncode:
+        raise RuntimeError(f"Booting the project failed:\n{result.stderr[-2000:]}")
+    return parse(result.stderr), json.loads(result.stdout.splitlines()[-1])
+
+
+def measure_boot(repeat=5):
+    """Median boot time and peak RSS of a worker over `repeat` fresh interpreters, without profiling."""
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', BOOT], capture_output=True, text=True, cwd=os.getcwd())
+        if result.returncode:
+            raise RuntimeError(f"Booting the project failed:\n{result.stderr[-2000:]}")
+        runs.append(json.loads(result.stdout.splitlines()[-1]))
+    seconds = sorted(run['seconds'] for run in runs)
+    rss = sorted(run['max_rss_kb'] for run in runs)
+    return {
+        'seconds': seconds[len(seconds) // 2],
+        'max_rss_kb': rss[len(rss) // 2],
+        'modules': len(runs[0]['modules']),
+    }
+
+
+def _within(module, package):
+    return module == package or module.startswith(package + '.')
+
+
+def eager_lazy_modules(modules):
+    """The LAZY_MODULES packages found among loaded module names."""
+    return [package for package in LAZY_MODULES if any(_within(name, package) for name in modules)]
+
+
+def import_chain(roots, package):
+    """The modules leading to the first import of `package`, outermost first, or None."""
+    for node in roots:
+        if _within(node.name, package):
+            return [node.name]
+        chain = import_chain(node.children, package)
+        if chain:
+            return [node.name, *chain]
+    return None
@@ -0,0 +1,66 @@
+class IntervalTree:
+    """A static interval tree over (start, end, value) tuples.
+
+    The intervals are sorted by start and read as an implicit balanced binary
+    search tree (the middle element of a range is its root), where every node
+    also records the largest end in its subtree. Subtrees that end too early or
+    start too late are skipped, so queries cost O(log n + matches).
+    """
+
+    def __init__(self, intervals=()):
+        self._items = sorted(intervals, key=lambda item: (item[0], item[1]))
+        self._max_end = [None] * len(self._items)
+        self._build(0, len(self._items))
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self._items[mid][1]
+        for child in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child is not None and child > max_end:
+                max_end = child
+        self._max_end[mid] = max_end
+        return max_end
+
+    def _search(self, lo, hi, starts_before, ends_after, inclusive, found):
+        # Collect items with start < starts_before and end > ends_after
+        # (start <= starts_before and end >= ends_after when inclusive).
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        max_end = self._max_end[mid]
+        if max_end < ends_after or (not inclusive and max_end == ends_after):
+            return
+        self._search(lo, mid, starts_before, ends_after, inclusive, found)
+        start, end, _ = self._items[mid]
+        if start < starts_before or (inclusive and start == starts_before):
+            if end > ends_after or (inclusive and end == ends_after):
+                found.append(self._items[mid])
+            self._search(mid + 1, hi, starts_before, ends_after, inclusive, found)
+
+    def overlapping(self, start, end):
+        """Return the intervals overlapping [start, end), in start order."""
+        found = []
+        self._search(0, len(self._items), end, start, False, found)
+        return found
+
+    def at(self, point):
+        """Return the intervals containing a single point."""
+        return [item for item in self.containing(point, point) if item[1] > point]
+
+    def containing(self, start, end):
+        """Return the intervals that cover all of [start, end]."""
+        found = []
+        self._search(0, len(self._items), start, end, True, found)
+        return found
+
+    def contains(self, start, end):
+        """True if a single interval covers all of [start, end]."""
+        return bool(self.containing(start, end))
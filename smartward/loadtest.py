@@ -0,0 +1,333 @@
+import http.cookiejar
+import json
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from django.contrib.auth.hashers import check_password
+from django.db.models import Max, Min
+from django.urls import Resolver404, resolve, reverse
+
+from .models import CustomUser, Patient, SpecializedAppointmentType
+
+_ATTEND_RE = re.compile(r'/doctor/attend_visit/(\d+)/')
+# What the booking views say when a slot was taken first, on the redirect
+# target or in the re-rendered form when the slot was gone before validation
+_CONFLICT_MARKERS = (b'has just been booked', b'Select a valid choice')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Redirects are followed by VirtualUser so each hop is timed on its own
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def _route(path):
+    """The URL name of a path, as in the metrics labels, or "unmatched"."""
+    try:
+        return resolve(urllib.parse.urlsplit(path).path).url_name or 'unmatched'
+    except Resolver404:
+        return 'unmatched'
+
+
+class Results:
+    """Latencies and outcomes per scenario ("<route> <method>"), shared by all virtual users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.outcomes = {}
+
+    def record(self, scenario, seconds, outcome):
+        with self.lock:
+            self.latencies.setdefault(scenario, []).append(seconds)
+            counts = self.outcomes.setdefault(scenario, {'ok': 0, 'error': 0, 'conflict': 0})
+            counts[outcome] += 1
+
+    def report(self, elapsed):
+        report = {}
+        for scenario in sorted(self.latencies):
+            samples = sorted(self.latencies[scenario])
+            counts = self.outcomes[scenario]
+            report[scenario] = {
+                'requests': len(samples),
+                'throughput_rps': round(len(samples) / elapsed, 2),
+                'p50_ms': round(_percentile(samples, 50) * 1000, 1),
+                'p95_ms': round(_percentile(samples, 95) * 1000, 1),
+                'p99_ms': round(_percentile(samples, 99) * 1000, 1),
+                'max_ms': round(samples[-1] * 1000, 1),
+                'errors': counts['error'],
+                'error_rate': round(counts['error'] / len(samples), 4),
+                'conflicts': counts['conflict'],
+            }
+        return report
+
+
+def _percentile(samples, p):
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class VirtualUser:
+    """One logged-in browser: its own cookies, random stream and timing of every request."""
+
+    def __init__(self, base_url, username, password, pool, results, seed, timeout=30, slot_choices=5):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.pool = pool
+        self.results = results
+        self.rng = random.Random(seed)
+        self.timeout = timeout
+        self.slot_choices = slot_choices
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect())
+
+    def _csrf_token(self):
+        return next((cookie.value for cookie in self.cookies if cookie.name == 'csrftoken'), '')
+
+    def send(self, method, path, params=None, data=None):
+        """Make one request; returns (status, redirect location, body). Status 0 means no response."""
+        url = self.base_url + path
+        if params:
+            url += '?' + urllib.parse.urlencode(params)
+        body = None
+        headers = {}
+        if data is not None:
+            token = self._csrf_token()
+            body = urllib.parse.urlencode({**data, 'csrfmiddlewaretoken': token}).encode()
+            headers = {'X-CSRFToken': token, 'Referer': url}
+        request = urllib.request.Request(url, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, None, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers.get('Location'), e.read()
+        except (urllib.error.URLError, OSError):
+            return 0, None, b''
+
+    def request(self, method, path, params=None, data=None, classify=None):
+        """Send a request, record it, and follow a redirect the way a browser would.
+
+        `classify(status, location, body)` may return 'conflict' for a booking
+        that lost its slot; otherwise 4xx, 5xx, failed connections and POSTs
+        that do not redirect are errors.
+        Returns the body of the final page and the path of the first redirect.
+        """
+        scenario = f'{_route(path)} {method}'
+        started = time.perf_counter()
+        status, location, body = self.send(method, path, params, data)
+        elapsed = time.perf_counter() - started
+        if location:
+            location = urllib.parse.urlsplit(location).path
+            body = self.request('GET', location)[0]
+        if status == 0 or status >= 400:
+            outcome = 'error'
+        elif classify:
+            outcome = classify(status, location, body)
+        elif method == 'POST' and status != 302:
+            # The form was shown again, so it was rejected
+            outcome = 'error'
+        else:
+            outcome = 'ok'
+        self.results.record(scenario, elapsed, outcome)
+        return body, location
+
+    def login(self):
+        self.send('GET', reverse('login'))
+        status, location, _ = self.send('POST', reverse('login'), data={
+            'username': self.username, 'password': self.password,
+        })
+        return status == 302
+
+    def think(self, mean):
+        if mean > 0:
+            time.sleep(self.rng.expovariate(1 / mean))
+
+    def choose_slot(self, params):
+        """Ask the slot picker's endpoint for free slots, as the booking pages do, and pick one."""
+        body, _ = self.request('GET', reverse('slot_search'), params)
+        try:
+            slots = [option['id'] for option in json.loads(body)['results']]
+        except (ValueError, KeyError):
+            return None
+        # The earliest slots are the ones everybody wants, which is where conflicts happen
+        return self.rng.choice(slots[:self.slot_choices]) if slots else None
+
+
+def _booking_outcome(status, location, body):
+    # Both booking views redirect with a message; a slot taken before the form
+    # was validated re-renders the form instead
+    if any(marker in body for marker in _CONFLICT_MARKERS):
+        return 'conflict'
+    return 'ok' if status == 302 else 'error'
+
+
+def receptionist_script(user, pool):
+    """Search for a patient, then book them a doctor or specialized appointment."""
+    patient_id, first_name, last_name = user.rng.choice(pool.patients)
+    query = user.rng.choice((last_name, f'{first_name} {last_name}', str(patient_id)))
+    user.request('GET', reverse('patient_list'), {'q': query})
+
+    if pool.appointment_types and user.rng.random() < 0.3:
+        appointment_type = user.rng.choice(pool.appointment_types)
+        path = reverse('book_specialized_appointment', args=(appointment_type,))
+        user.request('GET', path)
+        slot = user.choose_slot({'kind': 'specialized', 'appointment_type': appointment_type})
+        if slot:
+            user.request('POST', path, data={'patient_id': patient_id, 'slot': slot}, classify=_booking_outcome)
+    else:
+        path = reverse('book_appointment')
+        user.request('GET', path)
+        slot = user.choose_slot({'kind': 'doctor'})
+        if slot:
+            user.request('POST', path, data={'patient_id': patient_id, 'slot': slot}, classify=_booking_outcome)
+
+
+def nurse_script(user, pool):
+    """Take a patient's vitals and create a visit for one of the doctors."""
+    patient_id = user.rng.choice(pool.patients)[0]
+    path = reverse('create_visit', args=(patient_id,))
+    user.request('GET', path)
+    user.request('POST', path, data={
+        'patient': patient_id,
+        'doctor': user.rng.choice(pool.doctors),
+        'weight': f'{user.rng.uniform(3, 150):.2f}',
+        'temperature': f'{user.rng.uniform(35.5, 39.5):.1f}',
+        'blood_pressure': f'{user.rng.randint(95, 170)}/{user.rng.randint(55, 105)}',
+    })
+
+
+def doctor_script(user, pool):
+    """Open the visit list, sometimes searching it, and write notes on one visit."""
+    params = {'q': user.rng.choice(pool.patients)[2]} if user.rng.random() < 0.2 else None
+    body, _ = user.request('GET', reverse('doctor_view_visits'), params)
+    visits = _ATTEND_RE.findall(body.decode(errors='replace'))
+    if not visits:
+        return
+    path = reverse('doctor_attend_visit', args=(user.rng.choice(visits),))
+    user.request('GET', path)
+    user.request('POST', path, data={'doctor_notes': f'Seen at {time.strftime("%H:%M:%S")}. Load test note.'})
+
+
+SCRIPTS = {
+    'receptionist': receptionist_script,
+    'nurse': nurse_script,
+    'doctor': doctor_script,
+}
+
+
+class Pool:
+    """Accounts and rows the virtual users draw from, read from the database behind the server."""
+
+    def __init__(self, password, counts, patient_sample=1000, seed=0):
+        rng = random.Random(seed)
+        self.accounts = {role: self._accounts(role, password, count) for role, count in counts.items() if count}
+        self.doctors = list(CustomUser.objects.filter(usertype='doctor').values_list('pk', flat=True))
+        self.appointment_types = list(SpecializedAppointmentType.objects.values_list('pk', flat=True))
+
+        # Random ids across the table without ORDER BY RANDOM() over every patient
+        bounds = Patient.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        wanted = set()
+        if bounds['low'] is not None:
+            wanted = {rng.randint(bounds['low'], bounds['high']) for _ in range(patient_sample)}
+        self.patients = list(Patient.objects.filter(pk__in=wanted).values_list('pk', 'first_name', 'last_name'))
+
+    def _accounts(self, role, password, count):
+        # Checking a hash is slow, so only as many users as there are virtual users are tried
+        accounts = []
+        for username, encoded in CustomUser.objects.filter(usertype=role, is_active=True).order_by('pk').values_list(
+            'username', 'password'
+        ).iterator():
+            if check_password(password, encoded):
+                accounts.append(username)
+                if len(accounts) == count:
+                    break
+        return accounts
+
+
+def run(base_url, counts, duration=60, think_time=1.0, password='password', slot_choices=5, seed=0,
+        timeout=30, log=None):
+    """Run the role scripts concurrently against a server for `duration` seconds.
+
+    `counts` maps a role to its number of virtual users. Each one logs in as
+    its own account where there are enough (accounts are shared otherwise),
+    then repeats its script with exponentially distributed think time between
+    iterations. Returns the report document.
+    """
+    log = log or (lambda message: None)
+    pool = Pool(password, counts, seed=seed)
+    if not pool.patients:
+        raise ValueError("No patients to work with; load data first (see generate_dataset).")
+    for role, count in counts.items():
+        if count and not pool.accounts.get(role):
+            raise ValueError(f"No active {role} account accepts the given password.")
+
+    results = Results()
+    users = []
+    for role, count in counts.items():
+        for n in range(count):
+            accounts = pool.accounts[role]
+            users.append((role, VirtualUser(
+                base_url, accounts[n % len(accounts)], password, pool, results,
+                seed=seed * 1000 + len(users), timeout=timeout, slot_choices=slot_choices,
+            )))
+
+    login_failures = []
+    deadline = [0.0]
+
+    def begin():
+        # The clock starts once everyone has logged in
+        deadline[0] = time.monotonic() + duration
+
+    start = threading.Barrier(len(users) + 1, action=begin)
+
+    def virtual_user(role, user):
+        logged_in = user.login()
+        if not logged_in:
+            login_failures.append(user.username)
+        start.wait()
+        if not logged_in:
+            return
+        script = SCRIPTS[role]
+        while time.monotonic() < deadline[0]:
+            script(user, pool)
+            user.think(think_time)
+
+    threads = [threading.Thread(target=virtual_user, args=user, daemon=True) for user in users]
+    for thread in threads:
+        thread.start()
+    log(f"{len(users)} virtual users logging in to {base_url}...")
+    start.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    scenarios = results.report(elapsed)
+    total = sum(result['requests'] for result in scenarios.values())
+    return {
+        'meta': {
+            'base_url': base_url,
+            'users': counts,
+            'duration_s': round(elapsed, 2),
+            'think_time_s': think_time,
+            'seed': seed,
+            'login_failures': login_failures,
+        },
+        'totals': {
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2),
+            'errors': sum(result['errors'] for result in scenarios.values()),
+            'conflicts': sum(result['conflicts'] for result in scenarios.values()),
+        },
+        'scenarios': scenarios,
+    }
+
+
+def save(document, path):
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
@@ -0,0 +1,112 @@
+import random
+import threading
+import time
+from datetime import date, time as dt_time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+
+from smartward import booking
+from smartward.models import CustomUser, DoctorAppointment, DoctorAppointmentSlot, Patient, slot_bounds
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer the booking service from many threads and check for double bookings. "
+        "Creates its own doctor, patients and slots and removes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=16)
+        parser.add_argument('--slots', type=int, default=200)
+        parser.add_argument('--attempts', type=int, default=100, help="Booking attempts per worker.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        workers, attempts = options['workers'], options['attempts']
+        doctor, patient_ids, slot_ids = self.create_fixtures(options['slots'], workers)
+        counts = {'booked': 0, 'conflicts': 0, 'errors': 0}
+        counts_lock = threading.Lock()
+        start_barrier = threading.Barrier(workers)
+
+        def worker(number):
+            rng = random.Random(options['seed'] + number)
+            local = {'booked': 0, 'conflicts': 0, 'errors': 0}
+            start_barrier.wait()
+            try:
+                for _ in range(attempts):
+                    try:
+                        booking.book_doctor_slot(rng.choice(patient_ids), rng.choice(slot_ids))
+                        local['booked'] += 1
+                    except booking.SlotUnavailable:
+                        local['conflicts'] += 1
+                    except Exception:
+                        local['errors'] += 1
+            finally:
+                connection.close()
+                with counts_lock:
+                    for key, value in local.items():
+                        counts[key] += value
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        try:
+            double_booked = (
+                DoctorAppointment.objects.filter(slot_id__in=slot_ids)
+                .values('slot_id').annotate(n=Count('id')).filter(n__gt=1).count()
+            )
+            appointments = DoctorAppointment.objects.filter(slot_id__in=slot_ids).count()
+            flagged = DoctorAppointmentSlot.objects.filter(pk__in=slot_ids, is_booked=True).count()
+        finally:
+            self.remove_fixtures(doctor, patient_ids)
+
+        total = workers * attempts
+        self.stdout.write(
+            f"{workers} workers, {total} attempts in {elapsed:.2f}s ({total / elapsed:.0f} attempts/s)\n"
+            f"booked: {counts['booked']} ({counts['booked'] / elapsed:.0f} bookings/s), "
+            f"conflicts: {counts['conflicts']}, errors: {counts['errors']}\n"
+            f"appointments: {appointments}, slots flagged booked: {flagged}, double-booked slots: {double_booked}"
+        )
+        if double_booked or appointments != counts['booked'] or flagged != appointments:
+            self.stderr.write(self.style.ERROR("Booking invariants violated."))
+        else:
+            self.stdout.write(self.style.SUCCESS("No double bookings."))
+
+    def create_fixtures(self, slot_count, patient_count):
+        suffix = f"{int(time.time())}{random.randint(0, 9999)}"
+        doctor = CustomUser.objects.create(
+            username=f"bench_doctor_{suffix}", id_number=f"bench{suffix}", usertype='doctor'
+        )
+        Patient.objects.bulk_create(
+            Patient(
+                first_name='Bench', last_name=f'Patient{n}', address='-', phone_contact='0000000',
+                emergency_contact='0000000', dob=date(1990, 1, 1), email=f"bench{suffix}_{n}@example.com",
+            )
+            for n in range(patient_count)
+        )
+        day = date.today() + timedelta(days=365)
+        slots = []
+        for n in range(slot_count):
+            slot = DoctorAppointmentSlot(
+                doctor=doctor, date=day + timedelta(days=n // 48),
+                start_time=dt_time((n % 48) // 2, 30 * (n % 2)),
+                end_time=dt_time((n % 48) // 2, 30 * (n % 2) + 29),
+            )
+            slot.start_at, slot.end_at = slot_bounds(slot.date, slot.start_time, slot.end_time)
+            slots.append(slot)
+        DoctorAppointmentSlot.objects.bulk_create(slots)
+        patient_ids = list(Patient.objects.filter(email__startswith=f"bench{suffix}_").values_list('pk', flat=True))
+        slot_ids = list(DoctorAppointmentSlot.objects.filter(doctor=doctor).values_list('pk', flat=True))
+        return doctor, patient_ids, slot_ids
+
+    def remove_fixtures(self, doctor, patient_ids):
+        # Slots and appointments go with the doctor through the cascade
+        doctor.delete()
+        Patient.objects.filter(pk__in=patient_ids).delete()
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from smartward import serverbench
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests per second of the busiest read-only pages under the WSGI and the ASGI "
+        "entry point (which serves their async views) at rising concurrency, against the loaded data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*',
+                            help="benchmark_views scenario names to send, default the async-served pages.")
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 16, 64],
+                            help="Concurrent requests to test at (default 1 16 64).")
+        parser.add_argument('--duration', type=float, default=10, help="Seconds per interface and level.")
+        parser.add_argument('--latency', type=float, default=0,
+                            help="Milliseconds added to every query, standing in for a database server's round trip.")
+        parser.add_argument('--wsgi-threads', type=int,
+                            help="Threads of the WSGI worker, like gunicorn --threads (default one per request).")
+        parser.add_argument('--output', help="Save the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        if min(options['concurrency']) < 1:
+            raise CommandError("--concurrency levels must be at least 1.")
+        if options['duration'] <= 0:
+            raise CommandError("--duration must be positive.")
+        if options['latency'] < 0:
+            raise CommandError("--latency cannot be negative.")
+        if options['wsgi_threads'] is not None and options['wsgi_threads'] < 1:
+            raise CommandError("--wsgi-threads must be at least 1.")
+
+        document = serverbench.run(
+            only=options['scenarios'], concurrency=options['concurrency'], duration=options['duration'],
+            latency=options['latency'] / 1000, threads=options['wsgi_threads'], log=self.stdout.write,
+        )
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - set(document['meta']['scenarios'])
+            if unknown:
+                raise CommandError(f"Unknown or unavailable scenario {', '.join(sorted(unknown))}.")
+        for level, ratio in serverbench.speedups(document).items():
+            self.stdout.write(f"x{level}: ASGI serves {ratio}x the requests per second of WSGI.")
+        if options['output']:
+            serverbench.save(document, options['output'])
+            self.stdout.write(f"Results saved to {options['output']}.")
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from smartward import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Time every smartward route through the test client against the loaded data "
+        "(see generate_dataset), recording wall time, query count and peak memory per view. "
+        "With --compare, fail when a view regressed against a saved baseline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help="Scenario names to run, default all.")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per scenario.")
+        parser.add_argument('--warmup', type=int, default=1, help="Untimed runs per scenario first.")
+        parser.add_argument('--output', help="Save the results as JSON to this file.")
+        parser.add_argument('--compare', metavar='BASELINE', help="Baseline JSON file to compare against.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed slowdown and memory growth as a fraction (default 0.2).")
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError("--repeat must be at least 1.")
+        baseline = benchmarks.load(options['compare']) if options['compare'] else None
+
+        document = benchmarks.run(
+            only=options['scenarios'], repeat=options['repeat'], warmup=options['warmup'], log=self.stdout.write
+        )
+        if options['scenarios']:
+            unknown = set(options['scenarios']) - set(document['results'])
+            if unknown:
+                raise CommandError(f"Unknown or unavailable scenario {', '.join(sorted(unknown))}.")
+        for route in document['meta']['uncovered_routes']:
+            self.stderr.write(self.style.WARNING(f"No scenario covers route {route!r}."))
+        if options['output']:
+            benchmarks.save(document, options['output'])
+            self.stdout.write(f"Results saved to {options['output']}.")
+
+        if baseline is not None:
+            regressions = benchmarks.compare(document, baseline, options['tolerance'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(self.style.ERROR(regression))
+                raise CommandError(f"{len(regressions)} regressions against {options['compare']}.")
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {options['compare']}."))
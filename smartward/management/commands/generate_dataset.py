@@ -0,0 +1,75 @@
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from smartward.dataset import DatasetGenerator
+
+
+def _parse_now(value):
+    """An aware datetime from a local date (taken as midnight) or date and time."""
+    try:
+        now = parse_datetime(value)
+        if now is None:
+            day = parse_date(value)
+            now = datetime.combine(day, datetime.min.time()) if day else None
+    except ValueError:
+        now = None
+    if now is None:
+        raise CommandError("--now must be a date (YYYY-MM-DD) or a time (YYYY-MM-DD HH:MM).")
+    return timezone.make_aware(now) if timezone.is_naive(now) else now
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with a synthetic clinic for scale testing: staff, shifts, slots, "
+        "appointments, patients and visits. The same --seed and --now always produce the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--now', help="Date (YYYY-MM-DD) or time (YYYY-MM-DD HH:MM) the history and upcoming days are "
+                          "laid out around; defaults to the current time, so pass it to repeat a dataset."
+        )
+        parser.add_argument('--prefix', default='synthetic', help="Tag for usernames and patient emails.")
+        parser.add_argument('--doctors', type=int, default=50)
+        parser.add_argument('--nurses', type=int, default=100)
+        parser.add_argument('--receptionists', type=int, default=10)
+        parser.add_argument('--patients', type=int, default=100000)
+        parser.add_argument('--visits', type=int, default=1000000)
+        parser.add_argument('--days-back', type=int, default=365, help="Days of shift and visit history.")
+        parser.add_argument('--days-ahead', type=int, default=14, help="Days of upcoming shifts and slots.")
+        parser.add_argument('--booked', type=float, default=0.6, help="Share of upcoming slots that are booked.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-index', action='store_true', help="Skip rebuilding the patient search index.")
+
+    def handle(self, *args, **options):
+        if not 0 <= options['booked'] <= 1:
+            raise CommandError("--booked must be between 0 and 1.")
+        if options['days_back'] < 1 or options['days_ahead'] < 0:
+            raise CommandError("--days-back must be at least 1 and --days-ahead not negative.")
+
+        generator = DatasetGenerator(
+            seed=options['seed'], prefix=options['prefix'], batch_size=options['batch_size'],
+            now=_parse_now(options['now']) if options['now'] else None,
+            log=self.stdout.write,
+        )
+        started = time.perf_counter()
+        try:
+            generator.generate(
+                doctors=options['doctors'],
+                nurses=options['nurses'],
+                receptionists=options['receptionists'],
+                patients=options['patients'],
+                visits=options['visits'],
+                days_back=options['days_back'],
+                days_ahead=options['days_ahead'],
+                booked_ratio=options['booked'],
+                index=not options['no_index'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Dataset generated in {time.perf_counter() - started:.1f}s."))
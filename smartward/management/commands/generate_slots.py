@@ -0,0 +1,55 @@
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from smartward import slots
+from smartward.models import CustomUser
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%d/%m/%Y').date()
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}, expected dd/mm/yyyy.")
+
+
+class Command(BaseCommand):
+    help = "Cut the doctors' shifts in a date range into fixed-length appointment slots."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='first_date', type=parse_date, help="First date (dd/mm/yyyy), default today.")
+        parser.add_argument('--to', dest='last_date', type=parse_date, help="Last date (dd/mm/yyyy), default a week on.")
+        parser.add_argument('--doctor', action='append', help="Doctor username; may be repeated. Default all doctors.")
+        parser.add_argument('--minutes', type=int, default=15, help="Slot length in minutes (at most 30).")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be created without saving.")
+
+    def handle(self, *args, **options):
+        first_date = options['first_date'] or date.today()
+        last_date = options['last_date'] or first_date + timedelta(days=7)
+        if last_date < first_date:
+            raise CommandError("--to must not be before --from.")
+
+        doctors = None
+        if options['doctor']:
+            doctors = CustomUser.objects.filter(usertype='doctor', username__in=options['doctor'])
+            missing = set(options['doctor']) - set(doctors.values_list('username', flat=True))
+            if missing:
+                raise CommandError(f"No doctor named {', '.join(sorted(missing))}.")
+
+        length = timedelta(minutes=options['minutes'])
+        start, end = slots.date_window(first_date, last_date)
+        started = time.perf_counter()
+        try:
+            if options['dry_run']:
+                planned, skipped = slots.plan_slots(slots.shifts_between(start, end, doctors), length, start, end)
+                created = len(planned)
+            else:
+                created, skipped = slots.generate_slots(slots.shifts_between(start, end, doctors), length, start, end)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        verb = "Would create" if options['dry_run'] else "Created"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {created} slots ({skipped} skipped as overlapping) in {time.perf_counter() - started:.2f}s."
+        ))
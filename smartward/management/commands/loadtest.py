@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from smartward import loadtest
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a clinic day against a running server: receptionists search and book, nurses "
+        "create visits and doctors attend them, all concurrently. Reports throughput, latency "
+        "percentiles, errors and booking conflicts per route. Run it with the settings of the "
+        "server under test, as accounts and patients are read from its database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--receptionists', type=int, default=4, help="Concurrent receptionists.")
+        parser.add_argument('--nurses', type=int, default=4, help="Concurrent nurses.")
+        parser.add_argument('--doctors', type=int, default=4, help="Concurrent doctors.")
+        parser.add_argument('--duration', type=float, default=60, help="Seconds to run for.")
+        parser.add_argument('--think-time', type=float, default=1.0,
+                            help="Mean pause between a user's actions in seconds; 0 for none.")
+        parser.add_argument('--password', default='password',
+                            help="Password of the staff accounts (generate_dataset uses 'password').")
+        parser.add_argument('--slot-choices', type=int, default=5,
+                            help="Receptionists pick among this many of the earliest free slots.")
+        parser.add_argument('--timeout', type=float, default=30, help="Per-request timeout in seconds.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Save the report as JSON to this file.")
+
+    def handle(self, *args, **options):
+        counts = {role: options[f'{role}s'] for role in loadtest.SCRIPTS}
+        if any(count < 0 for count in counts.values()) or not any(counts.values()):
+            raise CommandError("Give at least one virtual user.")
+        try:
+            document = loadtest.run(
+                options['base_url'], counts, duration=options['duration'], think_time=options['think_time'],
+                password=options['password'], slot_choices=options['slot_choices'], seed=options['seed'],
+                timeout=options['timeout'], log=self.stdout.write,
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        self.stdout.write(
+            f"{'scenario':36} {'reqs':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+            f"{'errors':>7} {'conflicts':>9}"
+        )
+        for name, result in document['scenarios'].items():
+            self.stdout.write(
+                f"{name:36} {result['requests']:6} {result['throughput_rps']:7.2f} {result['p50_ms']:8.1f} "
+                f"{result['p95_ms']:8.1f} {result['p99_ms']:8.1f} {result['errors']:7} {result['conflicts']:9}"
+            )
+        totals = document['totals']
+        self.stdout.write(
+            f"{totals['requests']} requests in {document['meta']['duration_s']}s "
+            f"({totals['throughput_rps']} req/s), {totals['errors']} errors, {totals['conflicts']} booking conflicts."
+        )
+        for username in document['meta']['login_failures']:
+            self.stderr.write(self.style.WARNING(f"{username} could not log in."))
+        if options['output']:
+            loadtest.save(document, options['output'])
+            self.stdout.write(f"Report saved to {options['output']}.")
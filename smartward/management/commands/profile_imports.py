@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from smartward import importtime
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot a web worker in a fresh interpreter with the current settings and print its imports "
+        "as a tree ranked by cumulative time, then its median boot time and peak RSS. Warns when "
+        "a package that should load lazily (PDF rendering, Celery, process pools) loads at boot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-ms', type=float, default=2.0, help="Hide modules faster than this.")
+        parser.add_argument('--depth', type=int, help="Levels of the tree to show, default all.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Unprofiled boots to time for the summary; 0 to skip.")
+        parser.add_argument('--check', action='store_true',
+                            help="Fail if a lazily loaded package is imported at boot.")
+
+    def handle(self, *args, **options):
+        try:
+            roots, boot = importtime.profile_boot()
+            timing = importtime.measure_boot(options['repeat']) if options['repeat'] > 0 else None
+        except RuntimeError as e:
+            raise CommandError(e)
+
+        self.stdout.write(f"{'cumul ms':>9} {'self ms':>8}  module")
+        for line in importtime.format_tree(roots, options['min_ms'], options['depth']):
+            self.stdout.write(line)
+
+        if timing:
+            self.stdout.write(
+                f"Boot: {timing['seconds'] * 1000:.0f} ms median of {options['repeat']}, "
+                f"peak RSS {timing['max_rss_kb'] / 1024:.1f} MB, {timing['modules']} modules."
+            )
+        eager = importtime.eager_lazy_modules(boot['modules'])
+        for name in eager:
+            chain = ' > '.join(importtime.import_chain(roots, name) or [name])
+            self.stderr.write(self.style.WARNING(f"{name} is imported at boot ({chain}); it should load on first use."))
+        if eager and options['check']:
+            raise CommandError(f"{len(eager)} lazily loaded packages imported at boot.")
@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from smartward import search
+
+
+class Command(BaseCommand):
+    help = "Rebuild the patient search index from the Patient table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        count = search.rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} patients in {time.perf_counter() - started:.2f}s."
+        ))
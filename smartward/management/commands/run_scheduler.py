@@ -0,0 +1,32 @@
+import signal
+
+from django.core.management.base import BaseCommand
+
+from smartward import scheduler
+
+
+class Command(BaseCommand):
+    help = "Run the periodic maintenance tasks in this process, without Celery."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run every task once and exit.")
+        parser.add_argument('--list', action='store_true', help="List the registered tasks and exit.")
+        parser.add_argument('--tick', type=float, default=1.0, help="Seconds between checks for due tasks.")
+
+    def handle(self, *args, **options):
+        tasks = scheduler.discover()
+        if options['list']:
+            for task in tasks.values():
+                self.stdout.write(f"{task.name}: every {task.interval}s (jitter {task.jitter:.0%})")
+            return
+
+        runner = scheduler.Scheduler(tasks)
+        if not options['once']:
+            signal.signal(signal.SIGTERM, lambda *args: runner.stop())
+            self.stdout.write(f"Running {len(tasks)} tasks, Ctrl-C to stop.")
+        try:
+            runner.run(once=options['once'], tick=options['tick'])
+        except KeyboardInterrupt:
+            runner.stop()
+        for task in runner.tasks:
+            self.stdout.write(task.stats())
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from smartward import sweeper
+
+
+class Command(BaseCommand):
+    help = "Archive expired appointments and old visits, and delete expired free slots, in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sweeps', nargs='*', help=f"Sweeps to run ({', '.join(sweeper.SWEEPS)}), default all.")
+        parser.add_argument('--batch-size', type=int, default=sweeper.BATCH_SIZE)
+        parser.add_argument('--sleep', type=float, default=0.0, help="Seconds to pause between batches.")
+        parser.add_argument('--full', action='store_true', help="Ignore the watermark and check every expired row.")
+        parser.add_argument('--dry-run', action='store_true', help="Count the rows without deleting them.")
+
+    def handle(self, *args, **options):
+        unknown = set(options['sweeps']) - set(sweeper.SWEEPS)
+        if unknown:
+            raise CommandError(f"Unknown sweep {', '.join(sorted(unknown))}.")
+        reports = sweeper.sweep_expired(
+            options['sweeps'],
+            batch_size=options['batch_size'],
+            sleep=options['sleep'],
+            full=options['full'],
+            dry_run=options['dry_run'],
+        )
+        for report in reports:
+            self.stdout.write(str(report))
@@ -0,0 +1,441 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import weakref
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates
+
+from .querybudget import context_execute_wrapper
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'smartward_http_requests_total': (
+        'counter', 'Requests handled, by route, method and status.', None),
+    'smartward_http_request_duration_seconds': (
+        'histogram', 'Time to produce the response, by route.', LATENCY_BUCKETS),
+    'smartward_db_queries_per_request': (
+        'histogram', 'SQL queries run per request, by route.', QUERY_COUNT_BUCKETS),
+    'smartward_db_query_seconds_total': (
+        'counter', 'Time spent in SQL queries, by route.', None),
+    'smartward_template_render_seconds_total': (
+        'counter', 'Time spent rendering templates, by route.', None),
+    'smartward_pdf_render_seconds': (
+        'histogram', 'Time to produce a PDF through the PDF service, by template.', LATENCY_BUCKETS),
+}
+
+_local = threading.local()
+# The current request's timings; a context variable so that queries and
+# renders it runs on other threads (ASGI, sync_to_async) are counted too
+_timings = ContextVar('smartward_request_timings', default=None)
+_last_flush = 0.0
+# (pid, start time in ns) naming this process's snapshot file; reset after a fork
+_process = None
+_SNAPSHOT_NAME = re.compile(r'^(\d+)-(\d+)\.json$')
+RETIRED = 'retired.json'
+
+
+class _Shard:
+    """One thread's metrics. Only its own thread writes to it, so updates need no lock."""
+
+    def __init__(self):
+        self.counters = defaultdict(float)
+        self.histograms = {}
+
+    def merge(self, other):
+        """Add another shard's metrics to this one's."""
+        for key, value in list(other.counters.items()):
+            self.counters[key] += value
+        for key, counts in list(other.histograms.items()):
+            counts = list(counts)
+            if key in self.histograms:
+                self.histograms[key] = [a + b for a, b in zip(self.histograms[key], counts)]
+            else:
+                self.histograms[key] = counts
+
+
+class _ThreadExit:
+    """Kept in a thread's local storage, so it is collected when the thread exits."""
+
+
+# Shards of running threads, and the metrics of threads that have exited.
+# Servers that start a thread per request (runserver, some WSGI servers) would
+# otherwise leave a shard behind for every request they handled.
+_shards = set()
+_finished = _Shard()
+_shards_lock = threading.RLock()
+
+
+def _retire(shard):
+    with _shards_lock:
+        _shards.discard(shard)
+        _finished.merge(shard)
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _Shard()
+        with _shards_lock:
+            _shards.add(shard)
+        _local.shard = shard
+        _local.exit = _ThreadExit()
+        weakref.finalize(_local.exit, _retire, shard)
+        return shard
+
+
+def inc(name, labels, amount=1):
+    """Add to a counter; labels is a tuple of (label, value) pairs."""
+    _shard().counters[name, labels] += amount
+
+
+def observe(name, labels, value):
+    """Record one observation in a histogram."""
+    histograms = _shard().histograms
+    key = (name, labels)
+    buckets = METRICS[name][2]
+    if key not in histograms:
+        # Counts per bucket (the last one is +Inf), then the sum of the values
+        histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+    counts = histograms[key]
+    counts[bisect_left(buckets, value)] += 1
+    counts[-1] += value
+
+
+def snapshot():
+    """This process's metrics summed over its threads, as JSON-serialisable lists."""
+    total = _Shard()
+    with _shards_lock:
+        total.merge(_finished)
+        for shard in list(_shards):
+            total.merge(shard)
+    return {
+        'counters': [[name, list(labels), value] for (name, labels), value in total.counters.items()],
+        'histograms': [[name, list(labels), counts] for (name, labels), counts in total.histograms.items()],
+    }
+
+
+def _metrics_dir():
+    return getattr(settings, 'METRICS_DIR', None)
+
+
+def _flush_interval():
+    return getattr(settings, 'METRICS_FLUSH_INTERVAL', 5)
+
+
+def _snapshot_name():
+    """This process's file name, <pid>-<start time>.json, so a reused pid gets a file of its own."""
+    global _process
+    pid = os.getpid()
+    if _process is None or _process[0] != pid:
+        _process = (pid, time.time_ns())
+        atexit.register(_retire_process, pid)
+    return f'{pid}-{_process[1]}.json'
+
+
+def _write_json(path, data):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush(force=False):
+    """Write this process's snapshot to METRICS_DIR for the /metrics view of any worker to read.
+
+    With several worker processes (gunicorn), each one writes its own file, at
+    most every METRICS_FLUSH_INTERVAL seconds. When a process exits its counts
+    are folded into retired.json and its file removed, so counters never go
+    backwards and the directory holds one file per running process.
+    """
+    global _last_flush
+    directory = _metrics_dir()
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush < _flush_interval()):
+        return
+    _last_flush = now
+    os.makedirs(directory, exist_ok=True)
+    _write_json(os.path.join(directory, _snapshot_name()), snapshot())
+
+
+@contextmanager
+def _directory_lock(directory):
+    """Serialise updates of retired.json between the processes sharing the directory."""
+    try:
+        import fcntl
+    except ImportError:
+        # Not on Unix, where there are no worker processes to coordinate with
+        yield
+        return
+    with open(os.path.join(directory, 'retired.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _retire_files(directory, filenames, current=None):
+    """Fold snapshot files into retired.json, then remove them.
+
+    With `current`, this process's snapshot at exit, that is folded in instead
+    of the files, which only hold an older copy of it.
+    """
+    with _directory_lock(directory):
+        retired_path = os.path.join(directory, RETIRED)
+        snapshots = [_read_json(retired_path) or {'counters': [], 'histograms': []}]
+        paths = [os.path.join(directory, filename) for filename in filenames]
+        if current is not None:
+            snapshots.append(current)
+        else:
+            snapshots += [snap for snap in map(_read_json, paths) if snap is not None]
+        _write_json(retired_path, _as_snapshot(_totals(snapshots)))
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def _retire_process(pid):
+    # Registered at exit; a child forked after registration has its own
+    directory = _metrics_dir()
+    if pid != os.getpid() or not directory or not os.path.isdir(directory):
+        return
+    _retire_files(directory, [_snapshot_name()], current=snapshot())
+
+
+def _running(pid):
+    if os.name != 'posix':
+        # os.kill(pid, 0) would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _dead_files(directory, filenames):
+    """Files of processes that exited without retiring them (killed), unwritten for a few flush intervals.
+
+    A process is gone when its pid is no longer running or when a later file
+    has the same pid. All processes sharing METRICS_DIR must run on one host.
+    """
+    files = [(filename, *map(int, _SNAPSHOT_NAME.match(filename).groups())) for filename in filenames]
+    latest = {}
+    for _, pid, start in files:
+        latest[pid] = max(latest.get(pid, 0), start)
+    stale_before = time.time() - 3 * _flush_interval()
+    dead = []
+    for filename, pid, start in files:
+        if start == latest[pid] and _running(pid):
+            continue
+        try:
+            if os.path.getmtime(os.path.join(directory, filename)) < stale_before:
+                dead.append(filename)
+        except FileNotFoundError:
+            continue
+    return dead
+
+
+def collect():
+    """Metrics summed over all worker processes: {(name, labels): value or counts}."""
+    snapshots = [snapshot()]
+    directory = _metrics_dir()
+    if directory and os.path.isdir(directory):
+        own = _snapshot_name()
+        filenames = [
+            filename for filename in os.listdir(directory)
+            if _SNAPSHOT_NAME.match(filename) and filename != own
+        ]
+        dead = _dead_files(directory, filenames)
+        if dead:
+            _retire_files(directory, dead)
+        for filename in [RETIRED, *(filename for filename in filenames if filename not in dead)]:
+            snap = _read_json(os.path.join(directory, filename))
+            if snap is not None:
+                snapshots.append(snap)
+    return _totals(snapshots)
+
+
+def _totals(snapshots):
+    totals = {}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            totals[key] = totals.get(key, 0) + value
+        for name, labels, counts in snap['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            if key in totals:
+                totals[key] = [a + b for a, b in zip(totals[key], counts)]
+            else:
+                totals[key] = counts
+    return totals
+
+
+def _as_snapshot(totals):
+    snap = {'counters': [], 'histograms': []}
+    for (name, labels), value in totals.items():
+        snap['histograms' if isinstance(value, list) else 'counters'].append([name, list(labels), value])
+    return snap
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+
+def render_text():
+    """All metrics in the Prometheus text exposition format."""
+    by_name = defaultdict(list)
+    for (name, labels), value in sorted(collect().items()):
+        by_name[name].append((labels, value))
+
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in by_name.get(name, ()):
+            if kind == 'counter':
+                lines.append(f'{name}{_format_labels(labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value):
+                cumulative += count
+                lines.append(f'{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(labels)} {value[-1]}')
+            lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class _RequestTimings:
+    """Per-request DB and template time, filled in by the query wrapper and template backend.
+
+    An async view can run queries on several threads at once, hence the lock.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.template_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.queries += 1
+                self.query_seconds += elapsed
+
+
+class MetricsMiddleware:
+    """Records latency, query count and time, and template time per route.
+
+    Routes are the URL names from smartward/urls.py; requests that do not
+    resolve are counted under "unmatched" to keep the label set small.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        timings = _RequestTimings()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with context_execute_wrapper(timings, ['default']):
+                response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        self._record(request, response, timings, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        timings = _RequestTimings()
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with context_execute_wrapper(timings, ['default']):
+                response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        self._record(request, response, timings, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, timings, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        route = (match.url_name if match else None) or 'unmatched'
+        labels = (('route', route),)
+        inc('smartward_http_requests_total', (*labels, ('method', request.method), ('status', str(response.status_code))))
+        observe('smartward_http_request_duration_seconds', labels, elapsed)
+        observe('smartward_db_queries_per_request', labels, timings.queries)
+        inc('smartward_db_query_seconds_total', labels, timings.query_seconds)
+        inc('smartward_template_render_seconds_total', labels, timings.template_seconds)
+        flush()
+
+
+class _TimedTemplate:
+    def __init__(self, template):
+        self._template = template
+
+    def __getattr__(self, name):
+        return getattr(self._template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self._template.render(context, request)
+        finally:
+            timings = _timings.get()
+            if timings is not None:
+                timings.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend, timing each render for MetricsMiddleware."""
+
+    def from_string(self, template_code):
+        return _TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return _TimedTemplate(super().get_template(template_name))
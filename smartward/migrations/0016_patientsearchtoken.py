@@ -0,0 +1,63 @@
+# Generated by Django 5.0 on 2026-10-18 02:35
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# A frozen copy of smartward.search.patient_tokens as of this migration, so
+# later changes to the tokenizer do not change what it builds
+WORD_RE = re.compile(r'[^\W_]+')
+
+
+def _words(value):
+    return WORD_RE.findall((value or '').lower())
+
+
+def _digits(value):
+    return re.sub(r'\D', '', value or '')
+
+
+def patient_tokens(patient):
+    words = _words(patient.first_name) + _words(patient.last_name) + _words(patient.email)
+    words += [_digits(patient.phone_contact), _digits(patient.emergency_contact)]
+    tokens = set()
+    for word in words:
+        if word:
+            padded = '  ' + word + ' '
+            tokens |= {padded[i:i + 3] for i in range(len(padded) - 2)}
+    return tokens
+
+
+def build_index(apps, schema_editor):
+    Patient = apps.get_model('smartward', 'Patient')
+    PatientSearchToken = apps.get_model('smartward', 'PatientSearchToken')
+    batch = []
+    for patient in Patient.objects.order_by('pk').iterator(chunk_size=2000):
+        batch.extend(PatientSearchToken(patient_id=patient.pk, token=token) for token in patient_tokens(patient))
+        if len(batch) >= 2000:
+            PatientSearchToken.objects.bulk_create(batch)
+            batch = []
+    PatientSearchToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartward', '0015_visit_doctor_notes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=3)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='smartward.patient')),
+            ],
+            options={
+                'unique_together': {('token', 'patient')},
+            },
+        ),
+        migrations.RunPython(build_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartward', '0016_patientsearchtoken'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='visit',
+            index=models.Index(fields=['doctor', 'visit_date', 'id'], name='visit_doctor_date_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0 on 2026-10-18 02:39
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef
+
+
+def backfill_is_booked(apps, schema_editor):
+    DoctorAppointmentSlot = apps.get_model('smartward', 'DoctorAppointmentSlot')
+    DoctorAppointment = apps.get_model('smartward', 'DoctorAppointment')
+    SpecializedAppointmentSlot = apps.get_model('smartward', 'SpecializedAppointmentSlot')
+    SpecializedAppointment = apps.get_model('smartward', 'SpecializedAppointment')
+    DoctorAppointmentSlot.objects.update(
+        is_booked=Exists(DoctorAppointment.objects.filter(slot=OuterRef('pk')))
+    )
+    SpecializedAppointmentSlot.objects.update(
+        is_booked=Exists(SpecializedAppointment.objects.filter(slot=OuterRef('pk')))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartward', '0017_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorappointmentslot',
+            name='is_booked',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='specializedappointmentslot',
+            name='is_booked',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='doctorappointmentslot',
+            index=models.Index(fields=['is_booked', 'date', 'start_time'], name='doc_slot_free_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='specializedappointmentslot',
+            index=models.Index(fields=['is_booked', 'date', 'start_time'], name='sp_slot_free_idx'),
+        ),
+        migrations.RunPython(backfill_is_booked, migrations.RunPython.noop),
+    ]
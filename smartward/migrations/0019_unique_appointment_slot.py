@@ -0,0 +1,52 @@
+# Generated by Django 5.0 on 2026-10-18 02:39
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def move_double_bookings_aside(apps, schema_editor):
+    """Give every booking after the first on a slot its own copy of that slot.
+
+    The unique constraints below would fail on slots booked more than once, and
+    deleting appointments would lose them, so the extra ones keep their time on
+    a duplicate slot and are listed for the receptionists to sort out.
+    """
+    models_by_kind = (
+        ('DoctorAppointment', 'DoctorAppointmentSlot', ('doctor_id', 'date', 'start_time', 'end_time')),
+        ('SpecializedAppointment', 'SpecializedAppointmentSlot', ('appointment_type_id', 'date', 'start_time', 'end_time')),
+    )
+    for appointment_name, slot_name, slot_fields in models_by_kind:
+        Appointment = apps.get_model('smartward', appointment_name)
+        Slot = apps.get_model('smartward', slot_name)
+        doubled = (
+            Appointment.objects.values('slot').annotate(bookings=Count('pk')).filter(bookings__gt=1)
+            .values_list('slot', flat=True)
+        )
+        for slot in Slot.objects.filter(pk__in=list(doubled)):
+            extra = Appointment.objects.filter(slot=slot).order_by('booked_at', 'pk')[1:]
+            for appointment in extra:
+                copy = Slot.objects.create(is_booked=True, **{field: getattr(slot, field) for field in slot_fields})
+                Appointment.objects.filter(pk=appointment.pk).update(slot=copy)
+                print(
+                    f'\n  {appointment_name} {appointment.pk} double-booked {slot_name} {slot.pk} '
+                    f'({slot.date} {slot.start_time}); moved to new slot {copy.pk}'
+                )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartward', '0018_slot_is_booked'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_double_bookings_aside, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='doctorappointment',
+            constraint=models.UniqueConstraint(fields=('slot',), name='unique_doctor_appointment_slot'),
+        ),
+        migrations.AddConstraint(
+            model_name='specializedappointment',
+            constraint=models.UniqueConstraint(fields=('slot',), name='unique_specialized_appointment_slot'),
+        ),
+    ]
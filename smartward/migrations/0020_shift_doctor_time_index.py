@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-18 02:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartward', '0019_unique_appointment_slot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shift',
+            index=models.Index(fields=['doctor', 'start_time', 'end_time'], name='shift_doctor_time_idx'),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.0 on 2026-10-18 03:10
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def slot_bounds(day, start_time, end_time):
+    # A copy of smartward.models.slot_bounds as it was when this migration was written
+    tz = timezone.get_default_timezone()
+    return (
+        timezone.make_aware(datetime.combine(day, start_time), tz),
+        timezone.make_aware(datetime.combine(day, end_time), tz),
+    )
+
+
+def fill_start_end_at(apps, schema_editor):
+    for model_name in ('DoctorAppointmentSlot', 'SpecializedAppointmentSlot'):
+        model = apps.get_model('smartward', model_name)
+        batch = []
+        for slot in model.objects.order_by('pk').iterator(chunk_size=2000):
+            slot.start_at, slot.end_at = slot_bounds(slot.date, slot.start_time, slot.end_time)
+            batch.append(slot)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ['start_at', 'end_at'])
+                batch = []
+        model.objects.bulk_update(batch, ['start_at', 'end_at'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartward', '0020_shift_doctor_time_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doctorappointmentslot',
+            name='start_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='doctorappointmentslot',
+            name='end_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='specializedappointmentslot',
+            name='start_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='specializedappointmentslot',
+            name='end_at',
+            field=models.DateTimeField(editable=False, null=True),
+        ),
+        migrations.RunPython(fill_start_end_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='doctorappointmentslot',
+            name='start_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='doctorappointmentslot',
+            name='end_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='specializedappointmentslot',
+            name='start_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AlterField(
+            model_name='specializedappointmentslot',
+            name='end_at',
+            field=models.DateTimeField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='doctorappointmentslot',
+            index=models.Index(fields=['start_at', 'id'], name='doc_slot_start_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorappointmentslot',
+            index=models.Index(fields=['doctor', 'start_at'], name='doc_slot_doctor_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='doctorappointmentslot',
+            index=models.Index(fields=['end_at'], name='doc_slot_end_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='specializedappointmentslot',
+            index=models.Index(fields=['start_at', 'id'], name='sp_slot_start_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='specializedappointmentslot',
+            index=models.Index(fields=['end_at'], name='sp_slot_end_at_idx'),
+        ),
+    ]
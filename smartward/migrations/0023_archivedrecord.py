@@ -0,0 +1,29 @@
+# Generated by Django 5.0 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartward', '0022_sweepwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=30)),
+                ('original_id', models.BigIntegerField()),
+                ('patient_id', models.BigIntegerField()),
+                ('occurred_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('archive_file', models.CharField(max_length=255)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['patient_id', 'occurred_at'], name='archive_patient_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'original_id'), name='unique_archived_record')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 04:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartward', '0023_archivedrecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedrecord',
+            name='archive_offset',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
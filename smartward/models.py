@@ -1,10 +1,22 @@
 from django.contrib.auth.models import AbstractUser
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.conf import settings
-from django.forms import ValidationError
 from django.utils import timezone
-import pytz
-from datetime import date
+from datetime import date, datetime, timedelta
+
+# Enforced by Shift.clean(), so queries for the shifts overlapping a time only
+# need to look this far back for their starts and can stay on the index
+MAX_SHIFT_LENGTH = timedelta(hours=24)
+
+
+def slot_bounds(day, start_time, end_time):
+    """Return the aware start and end datetimes of a slot's date and times in local time."""
+    tz = timezone.get_default_timezone()
+    return (
+        timezone.make_aware(datetime.combine(day, start_time), tz),
+        timezone.make_aware(datetime.combine(day, end_time), tz),
+    )
 
 class CustomUser(AbstractUser):
     USER_TYPE_CHOICES = [
@@ -35,9 +47,18 @@ class Shift(models.Model):
     end_time = models.DateTimeField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'start_time', 'end_time'], name='shift_doctor_time_idx'),
+        ]
+
     def __str__(self):
         return f"Shift for {self.doctor.username} from {self.get_start_time()} to {self.get_end_time()}"
 
+    def clean(self):
+        if self.start_time and self.end_time and self.end_time - self.start_time > MAX_SHIFT_LENGTH:
+            raise ValidationError("A shift cannot be longer than 24 hours.")
+
     def is_active(self):
         """Return True if the shift is currently active."""
         now = timezone.localtime()  # Ensure timezone aware
@@ -76,27 +97,47 @@ class SpecializedAppointmentSlot(models.Model):
     date = models.DateField()
     start_time = models.TimeField()
     end_time = models.TimeField()
+    # Maintained by smartward.availability whenever an appointment is booked or cancelled
+    is_booked = models.BooleanField(default=False, editable=False)
+    # date + start_time/end_time as aware datetimes, filled in by save()
+    start_at = models.DateTimeField(editable=False)
+    end_at = models.DateTimeField(editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_at', 'id'], name='sp_slot_start_at_idx'),
+            models.Index(fields=['end_at'], name='sp_slot_end_at_idx'),
+            models.Index(fields=['is_booked', 'date', 'start_time'], name='sp_slot_free_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.start_at, self.end_at = slot_bounds(self.date, self.start_time, self.end_time)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'date', 'start_time', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'start_at', 'end_at'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.appointment_type.name} on {self.date} from {self.get_start_time()} to {self.get_end_time()}"
 
-    def is_booked(self):
-        """Check if the appointment slot is booked."""
-        return self.specializedappointment_set.exists()
-
     def get_start_time(self):
         """Return the formatted start time in local timezone."""
-        return timezone.localtime(timezone.make_aware(timezone.datetime.combine(self.date, self.start_time))).strftime("%d/%m/%Y %I:%M %p")
+        return timezone.localtime(self.start_at).strftime("%d/%m/%Y %I:%M %p")
 
     def get_end_time(self):
         """Return the formatted end time in local timezone."""
-        return timezone.localtime(timezone.make_aware(timezone.datetime.combine(self.date, self.end_time))).strftime("%d/%m/%Y %I:%M %p")
+        return timezone.localtime(self.end_at).strftime("%d/%m/%Y %I:%M %p")
 
 class SpecializedAppointment(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
     slot = models.ForeignKey(SpecializedAppointmentSlot, on_delete=models.CASCADE)
     booked_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['slot'], name='unique_specialized_appointment_slot'),
+        ]
+
     def __str__(self):
         return f"Appointment for {self.patient} for {self.slot.appointment_type.name} on {self.slot.date} at {self.slot.get_start_time()}"
 
@@ -105,41 +146,32 @@ class DoctorAppointmentSlot(models.Model):
     date = models.DateField(default=date.today)
     start_time = models.TimeField()
     end_time = models.TimeField()
+    # Maintained by smartward.availability whenever an appointment is booked or cancelled
+    is_booked = models.BooleanField(default=False, editable=False)
+    # date + start_time/end_time as aware datetimes, filled in by save()
+    start_at = models.DateTimeField(editable=False)
+    end_at = models.DateTimeField(editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start_at', 'id'], name='doc_slot_start_at_idx'),
+            models.Index(fields=['doctor', 'start_at'], name='doc_slot_doctor_start_idx'),
+            models.Index(fields=['end_at'], name='doc_slot_end_at_idx'),
+            models.Index(fields=['is_booked', 'date', 'start_time'], name='doc_slot_free_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.start_at, self.end_at = slot_bounds(self.date, self.start_time, self.end_time)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'date', 'start_time', 'end_time'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'start_at', 'end_at'}
+        super().save(*args, **kwargs)
 
     def clean(self):
-        """Ensure the end time is after the start time and is not in the past."""
-        if self.start_time is None or self.end_time is None:
-            raise ValidationError("Both start time and end time must be specified.")
-
-        if self.start_time >= self.end_time:
-            raise ValidationError("End time must be after start time.")
-
-        now = timezone.localtime()
-        slot_datetime = timezone.make_aware(
-            timezone.datetime.combine(self.date, self.start_time),
-            timezone.get_current_timezone()
-        )
-        if slot_datetime < now:
-            raise ValidationError("The slot cannot be in the past.")
-        
-        # Validate that the slot is within the doctor's shift times
-        shifts = Shift.objects.filter(doctor=self.doctor)
-
-        if not shifts.exists():
-            raise ValidationError("The doctor does not have any shifts defined.")
-
-        # Check if the slot falls within any active shift
-        is_valid_slot = False
-        for shift in shifts:
-            if (shift.start_time <= slot_datetime < shift.end_time) and \
-               (shift.start_time < timezone.make_aware(
-                   timezone.datetime.combine(self.date, self.end_time),
-                   timezone.get_current_timezone()) <= shift.end_time):
-                is_valid_slot = True
-                break
-
-        if not is_valid_slot:
-            raise ValidationError("The slot must be within the doctor's shift time.")
+        """Ensure the end time is after the start time, is not in the past and is within a shift."""
+        from .slots import check_slot
+
+        check_slot(self.doctor_id, self.date, self.start_time, self.end_time)
 
     def __str__(self):
         return f"Slot on {self.date} from {self.start_time} to {self.end_time} for {self.doctor.username}"
@@ -152,6 +184,11 @@ class DoctorAppointment(models.Model):
     slot = models.ForeignKey(DoctorAppointmentSlot, on_delete=models.CASCADE)
     booked_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['slot'], name='unique_doctor_appointment_slot'),
+        ]
+
     def __str__(self):
         return f"Appointment for {self.patient.first_name} {self.patient.last_name} with {self.doctor.username} on {self.slot.start_time}"
 
@@ -168,5 +205,54 @@ class Visit(models.Model):
     blood_pressure = models.CharField(max_length=7, help_text="Enter blood pressure in format: Systolic/Diastolic", default="120/80")
     doctor_notes = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['doctor', 'visit_date', 'id'], name='visit_doctor_date_idx'),
+        ]
+
     def __str__(self):
         return f"Visit for {self.patient} on {self.visit_date.strftime('%d/%m/%Y')} by Nurse {self.nurse.username}"
+
+
+class PatientSearchToken(models.Model):
+    """One n-gram of a patient's searchable fields, kept current by smartward.signals."""
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='search_tokens')
+    token = models.CharField(max_length=3)
+
+    class Meta:
+        unique_together = [('token', 'patient')]
+
+    def __str__(self):
+        return f"{self.token!r} -> patient {self.patient_id}"
+
+
+class SweepWatermark(models.Model):
+    """How far an expiry sweep has got, so the next run only looks at newer rows."""
+    name = models.CharField(max_length=50, unique=True)
+    swept_until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} swept until {self.swept_until}"
+
+
+class ArchivedRecord(models.Model):
+    """Tombstone for an appointment or visit moved out to a compressed archive file by smartward.archive."""
+    kind = models.CharField(max_length=30)
+    original_id = models.BigIntegerField()
+    patient_id = models.BigIntegerField()
+    occurred_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    archive_file = models.CharField(max_length=255)
+    # Byte offset of the gzip member holding the record in archive_file
+    archive_offset = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'original_id'], name='unique_archived_record'),
+        ]
+        indexes = [
+            models.Index(fields=['patient_id', 'occurred_at'], name='archive_patient_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived {self.kind} {self.original_id} for patient {self.patient_id}"
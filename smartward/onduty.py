@@ -0,0 +1,171 @@
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .intervals import IntervalTree
+from .models import MAX_SHIFT_LENGTH, Shift
+
+VERSION_KEY = 'onduty:version'
+
+_FIELDS = ('id', 'doctor_id', 'start_time', 'end_time', 'doctor__username', 'doctor__first_name', 'doctor__last_name')
+
+
+def _shift(row):
+    pk, doctor_id, start, end, username, first_name, last_name = row
+    return {
+        'shift_id': pk,
+        'doctor_id': doctor_id,
+        'doctor': f'{first_name} {last_name}'.strip() or username,
+        'username': username,
+        'start': start,
+        'end': end,
+    }
+
+
+def _bump():
+    """Move the shared version on, returning the new value (None if it had to be reset)."""
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+        return None
+
+
+class OnDutyIndex:
+    """Current and upcoming doctor shifts in an interval tree, answering who is on duty without queries.
+
+    The index holds the shifts that overlap [now, now + window) as of its last
+    full load, which is redone every `refresh` so shifts further ahead move in.
+    Shift changes in this process are applied row by row from the signals, and
+    bump a version in the cache; another process that sees the version move
+    reloads its index, so with a shared cache all workers agree. Reads cost a
+    cache lookup and an O(log n + matches) tree search.
+    """
+
+    def __init__(self, window=timedelta(hours=24), refresh=timedelta(hours=1)):
+        self.window = window
+        self.refresh = refresh
+        self._lock = threading.Lock()
+        # Replaced, never modified, so readers can use them without the lock
+        self._shifts = {}
+        self._snapshot = None
+        self._version = None
+        self._loaded_at = None
+        self._loaded_until = None
+
+    def _cache_version(self):
+        version = cache.get(VERSION_KEY)
+        if version is None:
+            # From the clock so an evicted counter never matches an old value
+            cache.add(VERSION_KEY, time.time_ns(), None)
+            version = cache.get(VERSION_KEY)
+        return version
+
+    def load(self):
+        """Reload the shifts overlapping the window from the database."""
+        # Read before the query, so a change during the load forces another one
+        version = self._cache_version()
+        now = timezone.now()
+        until = now + self.window
+        rows = Shift.objects.filter(
+            start_time__gte=now - MAX_SHIFT_LENGTH, start_time__lt=until, end_time__gt=now
+        ).values_list(*_FIELDS)
+        shifts = {row[0]: _shift(row) for row in rows}
+        with self._lock:
+            self._shifts = shifts
+            self._snapshot = None
+            self._version = version
+            self._loaded_at = now
+            self._loaded_until = until
+
+    def _current(self):
+        now = timezone.now()
+        if (
+            self._loaded_at is None
+            or now - self._loaded_at >= self.refresh
+            or cache.get(VERSION_KEY) != self._version
+        ):
+            self.load()
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    shifts = self._shifts
+                    tree = IntervalTree((shift['start'], shift['end'], pk) for pk, shift in shifts.items())
+                    self._snapshot = (tree, shifts)
+                snapshot = self._snapshot
+        return snapshot
+
+    def apply(self, shift_id, shift):
+        """Put a shift dict in the index (None removes it) and tell the other processes."""
+        with self._lock:
+            if self._loaded_at is None:
+                _bump()
+                return
+            shifts = dict(self._shifts)
+            if shift is None or shift['end'] <= self._loaded_at or shift['start'] >= self._loaded_until:
+                shifts.pop(shift_id, None)
+            else:
+                shifts[shift_id] = shift
+            self._shifts = shifts
+            self._snapshot = None
+            version = _bump()
+            # Anything but our own bump means another process changed shifts as well
+            if version is None or self._version is None or version != self._version + 1:
+                self._loaded_at = None
+            self._version = version
+
+    def shift_changed(self, shift_id):
+        """Re-read one shift after it was saved."""
+        row = Shift.objects.filter(pk=shift_id).values_list(*_FIELDS).first()
+        self.apply(shift_id, _shift(row) if row else None)
+
+    def shift_removed(self, shift_id):
+        self.apply(shift_id, None)
+
+    def on_duty(self, at=None, within=timedelta(hours=2)):
+        """Doctors on shift at `at` (default now), and those whose shift starts in the `within` after it.
+
+        Returns (on_duty, starting_soon), each a list of shift dicts in start
+        order; a doctor with overlapping shifts is listed once per shift. Only
+        times up to window - refresh ahead of now are answered in full.
+        """
+        at = at or timezone.now()
+        tree, shifts = self._current()
+        on_duty = [shifts[pk] for _, _, pk in tree.at(at)]
+        starting_soon = [shifts[pk] for start, _, pk in tree.overlapping(at, at + within) if start > at]
+        return on_duty, starting_soon
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = OnDutyIndex(
+                window=timedelta(hours=getattr(settings, 'ONDUTY_WINDOW_HOURS', 24)),
+                refresh=timedelta(minutes=getattr(settings, 'ONDUTY_REFRESH_MINUTES', 60)),
+            )
+        return _index
+
+
+def shift_changed(shift_id):
+    """Update this process's index, if it has one, and invalidate the others."""
+    if _index is not None:
+        _index.shift_changed(shift_id)
+    else:
+        _bump()
+
+
+def shift_removed(shift_id):
+    if _index is not None:
+        _index.shift_removed(shift_id)
+    else:
+        _bump()
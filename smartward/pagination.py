@@ -0,0 +1,153 @@
+import base64
+import datetime
+import json
+import operator
+from functools import reduce
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+PER_PAGE = 25
+
+
+class CursorPage:
+    """One page of a keyset-paginated queryset, with opaque next/previous cursors."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder drops microseconds below milliseconds, which would make a
+    # cursor point slightly before its own row.
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(direction, values):
+    data = json.dumps([direction, values], cls=CursorEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (direction, values) from a cursor, or (None, None) if it is missing or malformed."""
+    if not cursor:
+        return None, None
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(data)
+    except (ValueError, TypeError):
+        return None, None
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        return None, None
+    return direction, values
+
+
+def _value(obj, field):
+    if isinstance(obj, dict):
+        return obj[field]
+    for part in field.split('__'):
+        obj = getattr(obj, part)
+    return obj
+
+
+def _after(ordering, values, reverse=False):
+    """Build the filter selecting rows strictly after `values` in `ordering`.
+
+    For ordering (a, -b, c) this is a > x OR (a = x AND b < y) OR (a = x AND b = y AND c > z),
+    which the database answers with a range scan on an index over the same columns.
+    """
+    conditions = []
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+        lookup = f"{name}__lt" if descending else f"{name}__gt"
+        conditions.append(equal & Q(**{lookup: value}))
+        equal &= Q(**{name: value})
+    return reduce(operator.or_, conditions)
+
+
+def _page_rows(queryset, ordering, cursor, per_page):
+    """The sliced queryset holding the rows of the page the cursor points at, with the cursor's direction."""
+    direction, values = decode_cursor(cursor)
+    if values is not None and len(values) != len(ordering):
+        direction, values = None, None
+
+    if direction == 'prev':
+        reversed_ordering = [f[1:] if f.startswith('-') else f"-{f}" for f in ordering]
+        return queryset.filter(_after(ordering, values, reverse=True)).order_by(*reversed_ordering)[:per_page + 1], direction
+    if direction == 'next':
+        queryset = queryset.filter(_after(ordering, values))
+    return queryset.order_by(*ordering)[:per_page + 1], direction
+
+
+def _page(rows, ordering, direction, per_page):
+    if direction == 'prev':
+        has_more_before = len(rows) > per_page
+        rows = rows[:per_page][::-1]
+        has_more_after = True
+    else:
+        has_more_after = len(rows) > per_page
+        rows = rows[:per_page]
+        has_more_before = direction == 'next'
+
+    def key(row):
+        return [_value(row, field.lstrip('-')) for field in ordering]
+
+    next_cursor = encode_cursor('next', key(rows[-1])) if rows and has_more_after else None
+    previous_cursor = encode_cursor('prev', key(rows[0])) if rows and has_more_before else None
+    return CursorPage(rows, next_cursor, previous_cursor)
+
+
+def paginate(queryset, ordering, cursor=None, per_page=PER_PAGE):
+    """Return a CursorPage of `queryset` ordered by `ordering`.
+
+    The last field of `ordering` must be unique (usually the primary key) so that
+    every row has a distinct position. No COUNT query is run; one extra row is
+    fetched to find out whether another page exists.
+    """
+    ordering = list(ordering)
+    rows, direction = _page_rows(queryset, ordering, cursor, per_page)
+    return _page(list(rows), ordering, direction, per_page)
+
+
+async def apaginate(queryset, ordering, cursor=None, per_page=PER_PAGE):
+    """paginate() through the async ORM."""
+    ordering = list(ordering)
+    rows, direction = _page_rows(queryset, ordering, cursor, per_page)
+    return _page([row async for row in rows], ordering, direction, per_page)
+
+
+def paginate_request(request, queryset, ordering, per_page=PER_PAGE):
+    """Paginate using the `cursor` query-string parameter of the request."""
+    return paginate(queryset, ordering, request.GET.get('cursor'), per_page)
+
+
+async def apaginate_request(request, queryset, ordering, per_page=PER_PAGE):
+    return await apaginate(queryset, ordering, request.GET.get('cursor'), per_page)
@@ -0,0 +1,358 @@
+import atexit
+import hashlib
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponseNotModified
+from django.template.loader import get_template
+
+from . import metrics
+
+TEMPLATES = (
+    'appointment_pdf_template.html',
+    'sp_Appointment_pdf_template.html',
+    'appointment_sheet_pdf_template.html',
+)
+
+
+class PdfError(Exception):
+    """The PDF could not be generated."""
+
+
+class PdfBusy(PdfError):
+    """Too many PDFs are already queued or rendering took too long."""
+
+
+def render_pdf_bytes(template_name, context):
+    """Render a template to PDF in this process. Used by the pool workers and when the pool is off."""
+    from xhtml2pdf import pisa
+
+    html = get_template(template_name).render(context)
+    result = io.BytesIO()
+    status = pisa.CreatePDF(html, dest=result)
+    if status.err:
+        raise PdfError(status.err)
+    return result.getvalue()
+
+
+def _warm_worker():
+    # Runs once in each pool process: set Django up and pay for the xhtml2pdf
+    # (ReportLab) import and template compilation before the first job arrives.
+    import django
+
+    django.setup()
+    from xhtml2pdf import pisa  # noqa: F401
+
+    for name in TEMPLATES:
+        get_template(name)
+
+
+class PdfService:
+    """Renders PDFs in a bounded pool of warm worker processes.
+
+    xhtml2pdf is CPU-bound and holds the GIL, so rendering in the request thread
+    stalls every other request on the worker. Here the request thread only waits
+    on a future; at most `queue_size` jobs may be waiting or running at once,
+    counting jobs whose caller has given up on them but that are still running.
+    """
+
+    def __init__(self, workers, queue_size, timeout, samples=1000):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(queue_size)
+        self._executor = None
+        self._registered = False
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=samples)
+        self.rendered = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def _pool(self):
+        # multiprocessing loads with the first print rather than with every worker
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        with self._lock:
+            if self._executor is None:
+                if not self._registered:
+                    # Stop the workers before the interpreter tears down the pool's threads
+                    atexit.register(self.shutdown, wait=True)
+                    self._registered = True
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_worker,
+                )
+            return self._executor
+
+    def warm_up(self):
+        """Start the worker processes now instead of on the first print."""
+        pool = self._pool()
+        for future in [pool.submit(time.sleep, 0) for _ in range(self.workers)]:
+            future.result()
+
+    def render(self, template_name, context, timeout=None):
+        """Return the PDF bytes for a template, raising PdfBusy or PdfError on failure."""
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PdfBusy("Too many PDFs are being generated, please try again.")
+        started = time.perf_counter()
+        try:
+            if self.workers:
+                pdf = self._render_in_pool(template_name, context, timeout or self.timeout)
+            else:
+                try:
+                    pdf = render_pdf_bytes(template_name, context)
+                finally:
+                    self._slots.release()
+        except PdfError:
+            self.failed += 1
+            raise
+        elapsed = time.perf_counter() - started
+        self._latencies.append(elapsed)
+        metrics.observe('smartward_pdf_render_seconds', (('template', template_name),), elapsed)
+        self.rendered += 1
+        return pdf
+
+    def _render_in_pool(self, template_name, context, timeout):
+        from concurrent.futures.process import BrokenProcessPool
+
+        try:
+            try:
+                future = self._pool().submit(render_pdf_bytes, template_name, context)
+            except BrokenProcessPool:
+                # A worker died while the pool was idle; submit to a fresh pool
+                self.shutdown()
+                future = self._pool().submit(render_pdf_bytes, template_name, context)
+        except BaseException:
+            self._slots.release()
+            raise
+        # A job that has started cannot be cancelled, so its slot is only given
+        # back once it finishes, not when the caller stops waiting for it
+        future.add_done_callback(lambda future: self._slots.release())
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise PdfBusy("Generating the PDF took too long, please try again.")
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool next time
+            self.shutdown()
+            raise PdfError("The PDF worker stopped unexpectedly.")
+
+    def percentile(self, p):
+        samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+    def stats(self):
+        """Counts and p50/p99 latency in seconds over the most recent renders."""
+        return {
+            'rendered': self.rendered,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'p50': self.percentile(50),
+            'p99': self.percentile(99),
+        }
+
+    def shutdown(self, wait=False):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service():
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = PdfService(
+                workers=getattr(settings, 'PDF_WORKERS', 2),
+                queue_size=getattr(settings, 'PDF_QUEUE_SIZE', 16),
+                timeout=getattr(settings, 'PDF_TIMEOUT', 30),
+            )
+        return _service
+
+
+def render_pdf(template_name, context, timeout=None):
+    """Render a PDF through the shared service."""
+    return get_service().render(template_name, context, timeout)
+
+
+class PdfCache:
+    """Generated PDFs on disk, named by a hash of everything that goes into them.
+
+    A file is only ever written for one exact set of inputs, so a cached slip can
+    never be stale: when the appointment, its patient, doctor or slot, or the
+    template changes, the hash and therefore the file name change with it. Files
+    are named <kind>-<id>-<hash>.pdf so an appointment's PDFs can be dropped when
+    it changes, and the least recently used ones are removed once the directory
+    grows past max_bytes.
+    """
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, kind, object_id, digest):
+        return os.path.join(self.root, f'{kind}-{object_id}-{digest}.pdf')
+
+    def open(self, kind, object_id, digest):
+        """Open the cached file for reading, raising FileNotFoundError on a miss."""
+        path = self.path(kind, object_id, digest)
+        try:
+            # The modification time doubles as the last-used time for eviction
+            os.utime(path)
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return f
+
+    def put(self, kind, object_id, digest, content):
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(kind, object_id, digest)
+        # Write to a temporary name first so a concurrent reader never sees half a file
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self):
+        try:
+            with os.scandir(self.root) as entries:
+                return [entry for entry in entries if entry.name.endswith('.pdf')]
+        except FileNotFoundError:
+            return []
+
+    def evict(self):
+        """Remove the least recently used files until the cache fits in max_bytes."""
+        with self._lock:
+            files = []
+            for entry in self._entries():
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+    def invalidate(self, kind, object_ids):
+        """Drop every cached PDF of these objects, in one pass over the directory."""
+        prefixes = tuple(f'{kind}-{object_id}-' for object_id in object_ids)
+        if not prefixes:
+            return
+        for entry in self._entries():
+            if entry.name.startswith(prefixes):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+_cache = None
+_template_digests = {}
+
+
+def get_cache():
+    global _cache
+    with _service_lock:
+        if _cache is None:
+            _cache = PdfCache(
+                root=str(getattr(settings, 'PDF_CACHE_ROOT', settings.BASE_DIR / 'pdf_cache')),
+                max_bytes=getattr(settings, 'PDF_CACHE_MAX_BYTES', 64 * 1024 * 1024),
+            )
+        return _cache
+
+
+def _template_digest(template_name):
+    if template_name not in _template_digests:
+        source = get_template(template_name).template.source
+        _template_digests[template_name] = hashlib.sha256(source.encode()).hexdigest()
+    return _template_digests[template_name]
+
+
+def appointment_digest(template_name, appointment):
+    """Hash of the template and the appointment, patient, doctor and slot fields on the slip."""
+    patient, slot = appointment.patient, appointment.slot
+    doctor = getattr(appointment, 'doctor', None)
+    parts = [
+        _template_digest(template_name),
+        appointment.pk,
+        patient.pk, patient.first_name, patient.last_name,
+        doctor.username if doctor else '',
+        slot.date, slot.start_time, slot.end_time,
+    ]
+    return hashlib.sha256('\x1f'.join(map(str, parts)).encode()).hexdigest()[:32]
+
+
+def _render_appointment(template_name, kind, appointment, digest):
+    content = render_pdf(template_name, {'appointment': appointment})
+    get_cache().put(kind, appointment.pk, digest, content)
+    return content
+
+
+def appointment_pdf(template_name, kind, appointment, store=True):
+    """The PDF bytes of an appointment slip, from the cache when this version was printed before.
+
+    With store=False a slip that is not cached is rendered without being added.
+    """
+    digest = appointment_digest(template_name, appointment)
+    try:
+        with get_cache().open(kind, appointment.pk, digest) as f:
+            return f.read()
+    except FileNotFoundError:
+        if not store:
+            return render_pdf(template_name, {'appointment': appointment})
+        return _render_appointment(template_name, kind, appointment, digest)
+
+
+def appointment_pdf_response(request, template_name, kind, appointment, filename):
+    """Serve an appointment slip, rendering it only if this exact version is not cached.
+
+    The content hash is the ETag, so a client that already has the file gets a 304.
+    """
+    digest = appointment_digest(template_name, appointment)
+    etag = f'"{digest}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    try:
+        f = get_cache().open(kind, appointment.pk, digest)
+    except FileNotFoundError:
+        f = io.BytesIO(_render_appointment(template_name, kind, appointment, digest))
+    response = FileResponse(f, as_attachment=True, filename=filename, content_type='application/pdf')
+    response['ETag'] = etag
+    # Always revalidate: the same URL serves a new file once the appointment changes
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def invalidate_appointments(kind, appointment_ids):
+    get_cache().invalidate(kind, appointment_ids)
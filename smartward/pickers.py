@@ -0,0 +1,124 @@
+from datetime import date
+
+from django.db.models import Q
+from django.utils import timezone
+
+from . import availability
+from .models import CustomUser
+from .pagination import paginate
+
+# Options of the picker widgets (forms.PickerWidget), a page at a time. They
+# replace <select>s that rendered every free slot or every user of a type.
+PER_PAGE = 20
+SLOT_KINDS = ('doctor', 'specialized')
+STAFF_TYPES = ('doctor', 'nurse', 'receptionist')
+
+
+def _int(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an id.") from None
+
+
+def _name_q(query, prefix=''):
+    """Users whose username, first or last name starts with every word of the query."""
+    condition = Q()
+    for word in query.split():
+        condition &= (
+            Q(**{f'{prefix}username__istartswith': word})
+            | Q(**{f'{prefix}first_name__istartswith': word})
+            | Q(**{f'{prefix}last_name__istartswith': word})
+        )
+    return condition
+
+
+def slot_filters(params):
+    """slot_options() arguments from query parameters; raises ValueError with a message for bad ones."""
+    kind = params.get('kind', 'doctor')
+    if kind not in SLOT_KINDS:
+        raise ValueError(f"kind must be one of {', '.join(SLOT_KINDS)}.")
+    on = params.get('date')
+    if on:
+        try:
+            on = date.fromisoformat(on)
+        except ValueError:
+            raise ValueError("date must be YYYY-MM-DD.") from None
+    return {
+        'kind': kind,
+        'doctor': _int(params, 'doctor'),
+        'appointment_type': _int(params, 'appointment_type'),
+        'on': on or None,
+        'query': params.get('q', '').strip(),
+        'cursor': params.get('cursor'),
+    }
+
+
+def _slot(kind, slot):
+    option = {
+        'id': slot.pk,
+        'label': str(slot),
+        'date': slot.date.isoformat(),
+        'start': timezone.localtime(slot.start_at).isoformat(),
+        'end': timezone.localtime(slot.end_at).isoformat(),
+    }
+    if kind == 'doctor':
+        option['doctor'] = slot.doctor.username
+    else:
+        option['appointment_type'] = slot.appointment_type.name
+    return option
+
+
+def slot_options(kind='doctor', doctor=None, on=None, appointment_type=None, query='', cursor=None,
+                 per_page=PER_PAGE):
+    """A CursorPage of free slots from today on as option dicts, soonest first.
+
+    `query` matches the doctor's name for doctor slots and the type's name for
+    specialized ones. One query, whatever the number of slots.
+    """
+    today = timezone.localdate()
+    if kind == 'doctor':
+        slots = availability.free_doctor_slots(today)
+        if doctor is not None:
+            slots = slots.filter(doctor_id=doctor)
+        if query:
+            slots = slots.filter(_name_q(query, 'doctor__'))
+    else:
+        slots = availability.free_specialized_slots(today, appointment_type)
+        if query:
+            slots = slots.filter(appointment_type__name__icontains=query)
+    if on is not None:
+        slots = slots.filter(date=on)
+    page = paginate(slots, ('start_at', 'id'), cursor, per_page)
+    page.object_list = [_slot(kind, slot) for slot in page]
+    return page
+
+
+def staff_filters(params):
+    """staff_options() arguments from query parameters; raises ValueError with a message for bad ones."""
+    usertype = params.get('usertype') or None
+    if usertype is not None and usertype not in STAFF_TYPES:
+        raise ValueError(f"usertype must be one of {', '.join(STAFF_TYPES)}.")
+    return {'usertype': usertype, 'query': params.get('q', '').strip(), 'cursor': params.get('cursor')}
+
+
+def staff_options(usertype=None, query='', cursor=None, per_page=PER_PAGE):
+    """A CursorPage of active staff as option dicts, by username."""
+    users = CustomUser.objects.filter(is_active=True, usertype__in=[usertype] if usertype else STAFF_TYPES)
+    if query:
+        users = users.filter(_name_q(query))
+    users = users.only('username', 'first_name', 'last_name', 'usertype')
+    page = paginate(users, ('username', 'id'), cursor, per_page)
+    page.object_list = [
+        {
+            'id': user.pk,
+            'label': str(user),
+            'name': f'{user.first_name} {user.last_name}'.strip(),
+            'usertype': user.usertype,
+        }
+        for user in page
+    ]
+    return page
@@ -0,0 +1,209 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger('smartward.queries')
+
+# A query shape seen this many times in one request is reported as a likely N+1
+REPEAT_THRESHOLD = 5
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*\?\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Reduce a query to its shape: literals become ? and IN lists collapse to IN (...)."""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryReport:
+    """The queries run while handling one request, with its budget verdict."""
+
+    def __init__(self, queries, budget=None, name=None):
+        self.queries = queries
+        self.budget = budget
+        self.name = name
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated(self, threshold=REPEAT_THRESHOLD):
+        """(shape, count) for query shapes run at least `threshold` times, most frequent first."""
+        shapes = Counter(normalize(sql) for sql, _ in self.queries)
+        return [(shape, n) for shape, n in shapes.most_common() if n >= threshold]
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+    def problems(self):
+        problems = []
+        if self.over_budget:
+            problems.append(f"{self.name}: {self.count} queries, budget is {self.budget}")
+        for shape, n in self.repeated():
+            problems.append(f"{self.name}: likely N+1, {n} x {shape}")
+        return problems
+
+
+# (aliases, wrapper) pairs active in the current context. Connections belong to
+# threads, while a request under ASGI runs its queries on other threads than its
+# middleware (the async ORM, sync_to_async); context variables follow it there.
+_wrappers = ContextVar('smartward_query_wrappers', default=())
+
+
+def _run_wrappers(execute, sql, params, many, context):
+    wrappers = _wrappers.get()
+    alias = context['connection'].alias
+    for aliases, wrapper in reversed(wrappers):
+        if alias in aliases:
+            execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def _install(connection, **kwargs):
+    if _run_wrappers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_run_wrappers)
+
+
+connection_created.connect(_install)
+
+
+@contextmanager
+def context_execute_wrapper(wrapper, using=None):
+    """Like connection.execute_wrapper, for the queries of the current context on whichever thread they run."""
+    for connection in connections.all(initialized_only=True):
+        _install(connection)
+    token = _wrappers.set((*_wrappers.get(), (frozenset(using or connections), wrapper)))
+    try:
+        yield
+    finally:
+        _wrappers.reset(token)
+
+
+class QueryRecorder:
+    """Records (sql, seconds) for every query on the given connections while active.
+
+    Works with DEBUG off and records only the queries of the current context,
+    including those it runs on other threads through sync_to_async.
+    """
+
+    def __init__(self, using=None):
+        self.using = using or list(connections)
+        self.queries = []
+        self._wrapper = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def __enter__(self):
+        self._wrapper = context_execute_wrapper(self, self.using)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._wrapper.__exit__(*exc_info)
+
+    def report(self, name):
+        return QueryReport(self.queries, budget_for(name), name)
+
+
+def budget_for(name):
+    """The declared query budget of a URL name, or the default budget."""
+    from .budgets import DEFAULT_BUDGET, QUERY_BUDGETS
+
+    return QUERY_BUDGETS.get(name, DEFAULT_BUDGET)
+
+
+class QueryBudgetMiddleware:
+    """Counts each request's queries and logs requests over their URL's budget or with N+1 patterns.
+
+    Put it first in MIDDLEWARE so session and authentication queries are counted
+    too. The report is attached to the response as `query_report` for tests.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'QUERY_BUDGET_ENABLED', True)
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+        return self._check(request, response, recorder)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        with QueryRecorder() as recorder:
+            response = await self.get_response(request)
+        return self._check(request, response, recorder)
+
+    def _check(self, request, response, recorder):
+        match = getattr(request, 'resolver_match', None)
+        name = match.url_name if match else None
+        if name is None:
+            return response
+        report = recorder.report(name)
+        response.query_report = report
+        for problem in report.problems():
+            logger.warning("%s %s", request.path, problem)
+        return response
+
+
+@contextmanager
+def assert_query_budget(name, using=None):
+    """Fail if the queries run inside the block break the budget of URL name `name`.
+
+    For tests of code called outside a request; responses from the test client
+    can be checked with assert_response_within_budget instead.
+    """
+    with QueryRecorder(using) as recorder:
+        yield recorder
+    problems = recorder.report(name).problems()
+    if problems:
+        raise AssertionError('\n'.join(problems))
+
+
+def assert_response_within_budget(response):
+    """Fail if the request behind a test client response broke its query budget."""
+    report = getattr(response, 'query_report', None)
+    if report is None:
+        raise AssertionError("No query report; is QueryBudgetMiddleware installed?")
+    problems = report.problems()
+    if problems:
+        raise AssertionError('\n'.join(problems))
@@ -0,0 +1,126 @@
+import logging
+import random
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils.module_loading import autodiscover_modules
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+
+
+class PeriodicTask:
+    def __init__(self, func, interval, jitter, name):
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.name = name
+        self.next_run = 0.0
+        self.running = threading.Lock()
+        # Timing metrics, in seconds
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.last_time = None
+        self.last_result = None
+
+    def schedule_next(self, now):
+        # Jitter spreads out tasks (and processes) that share an interval
+        spread = self.interval * self.jitter
+        self.next_run = now + self.interval + random.uniform(-spread, spread)
+
+    def stats(self):
+        average = self.total_time / self.runs if self.runs else 0.0
+        last = f"{self.last_time:.3f}s" if self.last_time is not None else "-"
+        return (
+            f"{self.name}: {self.runs} runs, {self.failures} failed, {self.skipped} skipped as still running, "
+            f"last {last}, avg {average:.3f}s, max {self.max_time:.3f}s"
+        )
+
+
+def periodic(every, jitter=0.1, name=None):
+    """Register a function to be run every `every` seconds by the run_scheduler command."""
+    def register(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        REGISTRY[task_name] = PeriodicTask(func, every, jitter, task_name)
+        return func
+    return register
+
+
+def discover():
+    """Import the `tasks` module of every installed app so their tasks register."""
+    autodiscover_modules('tasks')
+    return REGISTRY
+
+
+class Scheduler:
+    """Runs registered periodic tasks in threads, never two runs of one task at once.
+
+    Besides the in-process lock, each run takes a cache lock named after the task,
+    so with a shared cache backend two scheduler processes do not overlap either.
+    """
+
+    def __init__(self, tasks=None, lock_timeout=3600):
+        self.tasks = list((tasks or discover()).values())
+        self.lock_timeout = lock_timeout
+        self._stop = threading.Event()
+        self._threads = []
+
+    def stop(self):
+        self._stop.set()
+
+    def run_task(self, task):
+        if not task.running.acquire(blocking=False):
+            task.skipped += 1
+            return
+        lock_key = f"smartward:scheduler:{task.name}"
+        try:
+            if not cache.add(lock_key, 1, self.lock_timeout):
+                task.skipped += 1
+                return
+            started = time.perf_counter()
+            try:
+                close_old_connections()
+                task.last_result = task.func()
+                logger.info("%s finished: %s", task.name, task.last_result)
+            except Exception:
+                task.failures += 1
+                logger.exception("%s failed", task.name)
+            finally:
+                close_old_connections()
+                cache.delete(lock_key)
+                task.last_time = time.perf_counter() - started
+                task.total_time += task.last_time
+                task.max_time = max(task.max_time, task.last_time)
+                task.runs += 1
+        finally:
+            task.running.release()
+
+    def run_pending(self):
+        now = time.monotonic()
+        for task in self.tasks:
+            if task.next_run <= now:
+                task.schedule_next(now)
+                thread = threading.Thread(target=self.run_task, args=(task,), name=task.name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+
+    def run(self, once=False, tick=1.0):
+        """Run until stop() is called; with `once`, run every task a single time, one after another."""
+        if once:
+            for task in self.tasks:
+                self.run_task(task)
+            return
+        for task in self.tasks:
+            # Start each task at a random point early in its first interval
+            task.next_run = time.monotonic() + random.uniform(0, task.interval * task.jitter)
+        while not self._stop.wait(tick):
+            self.run_pending()
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,191 @@
+import re
+
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+
+from . import bulk
+from .models import Patient, PatientSearchToken
+from .pagination import PER_PAGE, apaginate, paginate
+
+GRAM_SIZE = 3
+WORD_RE = re.compile(r'[^\W_]+')
+PHONE_RE = re.compile(r'[\d\s()+-]+')
+
+
+def normalize_digits(value):
+    """Strip everything but digits from a phone number."""
+    return re.sub(r'\D', '', value or '')
+
+
+def _words(value):
+    return WORD_RE.findall((value or '').lower())
+
+
+def word_grams(word):
+    """Return the padded trigrams of a word, pg_trgm style ("  j", " jo", "joh", ...)."""
+    padded = '  ' + word + ' '
+    return {padded[i:i + GRAM_SIZE] for i in range(len(padded) - GRAM_SIZE + 1)}
+
+
+def patient_tokens(patient):
+    """Return every token stored in the index for a patient."""
+    words = _words(patient.first_name) + _words(patient.last_name)
+    # Local part and domain labels, so "x.com" and "jo@exa" find addresses as before
+    words += _words(patient.email)
+    words += [normalize_digits(patient.phone_contact), normalize_digits(patient.emergency_contact)]
+
+    tokens = set()
+    for word in words:
+        if word:
+            tokens |= word_grams(word)
+    return tokens
+
+
+def query_words(query):
+    """Split a search query into index words; a phone-looking query is one digit string."""
+    query = (query or '').strip().lower()
+    if PHONE_RE.fullmatch(query):
+        digits = normalize_digits(query)
+        return [digits] if digits else []
+    return _words(query)
+
+
+def query_grams(query):
+    """Return (required, scoring) gram sets for a query.
+
+    Every required gram must be present for a patient to match, which keeps the
+    old substring semantics for words of at least GRAM_SIZE characters; shorter
+    words have no gram of their own and are matched by short_words_q() instead.
+    Scoring grams also include the word-boundary grams, so whole-word and prefix
+    matches rank above matches in the middle of a word.
+    """
+    required, scoring = set(), set()
+    for word in query_words(query):
+        if len(word) >= GRAM_SIZE:
+            required |= {word[i:i + GRAM_SIZE] for i in range(len(word) - GRAM_SIZE + 1)}
+        scoring |= word_grams(word)
+    return required, scoring | required
+
+
+def short_words_q(query, prefix=''):
+    """Filter for the query words too short for a gram, matched anywhere as icontains did."""
+    condition = Q()
+    for word in query_words(query):
+        if len(word) < GRAM_SIZE:
+            condition &= (
+                Q(**{f'{prefix}first_name__icontains': word})
+                | Q(**{f'{prefix}last_name__icontains': word})
+                | Q(**{f'{prefix}email__icontains': word})
+                | Q(**{f'{prefix}phone_contact__icontains': word})
+                | Q(**{f'{prefix}emergency_contact__icontains': word})
+            )
+    return condition
+
+
+def index_patient(patient):
+    """Replace the stored tokens of a single patient."""
+    with transaction.atomic():
+        PatientSearchToken.objects.filter(patient_id=patient.pk).delete()
+        PatientSearchToken.objects.bulk_create(
+            PatientSearchToken(patient_id=patient.pk, token=token) for token in patient_tokens(patient)
+        )
+
+
+def rebuild_index(batch_size=2000):
+    """Rebuild the whole index from the Patient table. Returns the number of patients indexed."""
+    count = 0
+    PatientSearchToken.objects.all().delete()
+    patients = Patient.objects.only(
+        'first_name', 'last_name', 'email', 'phone_contact', 'emergency_contact'
+    ).order_by('pk')
+
+    def rows():
+        nonlocal count
+        for patient in patients.iterator(chunk_size=batch_size):
+            count += 1
+            for token in patient_tokens(patient):
+                yield token, patient.pk
+
+    # Tens of tokens per patient: written as plain rows, not model instances
+    bulk.insert_rows(PatientSearchToken, ('token', 'patient'), rows(), batch_size=batch_size * 10)
+    return count
+
+
+def ranked_matches(query):
+    """Return a values queryset of {'patient_id', 'score'} rows, best match first.
+
+    This is a single grouped scan of the token index. Only a query with words
+    shorter than a gram also reads the Patient table, which for a query of
+    nothing but short words means scanning it.
+    """
+    required, scoring = query_grams(query)
+    short = short_words_q(query)
+    if not required:
+        if not short:
+            return PatientSearchToken.objects.none().values('patient_id').annotate(score=Count('id'))
+        # No gram to look up: substring matches, those starting a first or last name first
+        starts = Q()
+        for word in query_words(query):
+            starts |= Q(first_name__istartswith=word) | Q(last_name__istartswith=word)
+        return (
+            Patient.objects.filter(short)
+            .values(patient_id=F('pk'))
+            .annotate(score=Case(When(starts, then=Value(1)), default=Value(0), output_field=IntegerField()))
+            .order_by('-score', 'patient_id')
+        )
+    matches = (
+        PatientSearchToken.objects
+        .filter(token__in=scoring)
+        .values('patient_id')
+        .annotate(
+            hits=Count('id', filter=Q(token__in=required)),
+            score=Count('id'),
+        )
+        .filter(hits=len(required))
+        .order_by('-score', 'patient_id')
+    )
+    if short:
+        matches = matches.filter(patient__in=Patient.objects.filter(short))
+    return matches
+
+
+def exact_matches(query):
+    """Fast path for a patient ID or a full email address typed into the search box."""
+    query = (query or '').strip()
+    if query.isdigit():
+        return Patient.objects.filter(pk=int(query))
+    if '@' in query:
+        return Patient.objects.filter(email__iexact=query)
+    return Patient.objects.none()
+
+
+def matching_patients_q(query, field='patient_id'):
+    """Return a filter on `field` matching the patients a query finds, for use on related tables."""
+    return (
+        Q(**{f"{field}__in": exact_matches(query).values('pk')}) |
+        Q(**{f"{field}__in": ranked_matches(query).values('patient_id')})
+    )
+
+
+def paginate_patients(query, cursor=None, per_page=PER_PAGE):
+    """Return a CursorPage of Patient objects for a query, keyed on (score, patient_id)."""
+    exact = list(exact_matches(query).values_list('pk', flat=True))
+    page = paginate(ranked_matches(query).exclude(patient_id__in=exact), ('-score', 'patient_id'), cursor, per_page)
+    ids = [row['patient_id'] for row in page]
+    if not page.has_previous:
+        ids = exact + ids
+    patients = Patient.objects.in_bulk(ids)
+    page.object_list = [patients[pk] for pk in ids if pk in patients]
+    return page
+
+
+async def apaginate_patients(query, cursor=None, per_page=PER_PAGE):
+    """paginate_patients() through the async ORM."""
+    exact = [pk async for pk in exact_matches(query).values_list('pk', flat=True)]
+    page = await apaginate(ranked_matches(query).exclude(patient_id__in=exact), ('-score', 'patient_id'), cursor, per_page)
+    ids = [row['patient_id'] for row in page]
+    if not page.has_previous:
+        ids = exact + ids
+    patients = await Patient.objects.ain_bulk(ids)
+    page.object_list = [patients[pk] for pk in ids if pk in patients]
+    return page
@@ -0,0 +1,258 @@
+import asyncio
+import io
+import json
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.servers.basehttp import get_internal_wsgi_application
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from . import benchmarks
+from .loadtest import Results
+from .querybudget import context_execute_wrapper
+
+# Throughput of the same pages through the two entry points at rising
+# concurrency. Both are driven in-process, so no server needs installing and
+# HTTP parsing, the same for both, is left out: WSGI as a threaded worker
+# (gunicorn gthread, runserver), ASGI as one uvicorn worker, a single event
+# loop calling the application. Against SQLite every query holds the GIL and
+# neither can overlap anything, so `latency` adds a sleep to each query to
+# stand in for the round trip to a database server.
+DEFAULT_SCENARIOS = (
+    'doctor_dashboard',
+    'receptionist_dashboard',
+    'doctor_appointments',
+    'patient_list',
+    'patient_list_q_name',
+    'patient_detail',
+    'doctor_view_visits',
+    'doctor_view_visits_q',
+)
+
+
+class Target:
+    """One request the drivers send: a scenario's path, query string and session cookie."""
+
+    def __init__(self, name, path, query, cookie):
+        self.name = name
+        self.path = path
+        self.query = query
+        self.cookie = cookie
+
+
+def targets(found, fixtures):
+    sessions = {}
+    for scenario in found:
+        if scenario.role and scenario.role not in sessions:
+            client = Client()
+            client.force_login(fixtures.user(scenario.role))
+            sessions[scenario.role] = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+    return [
+        Target(scenario.name, reverse(scenario.url_name, args=scenario.args), urlencode(scenario.params),
+               sessions.get(scenario.role, ''))
+        for scenario in found
+    ]
+
+
+def _record(results, target, seconds, status):
+    outcome = 'ok' if status is not None and status < 400 else 'error'
+    results.record(target.name, seconds, outcome)
+    results.record('all', seconds, outcome)
+
+
+def _round_trip(latency):
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    return context_execute_wrapper(wrapper)
+
+
+def _environ(target):
+    return {
+        'REQUEST_METHOD': 'GET',
+        'SCRIPT_NAME': '',
+        'PATH_INFO': target.path,
+        'QUERY_STRING': target.query,
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'REMOTE_ADDR': '127.0.0.1',
+        'HTTP_HOST': 'testserver',
+        'HTTP_COOKIE': target.cookie,
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def run_wsgi(found, concurrency, duration, results, latency=0, threads=None):
+    """Send the targets round-robin from `concurrency` clients for `duration` seconds.
+
+    The worker has `threads` threads (default one per client); requests beyond
+    that wait for one, and their latency includes the wait.
+    """
+    application = get_internal_wsgi_application()
+    deadline = time.perf_counter() + duration
+
+    def handle(target):
+        status = None
+
+        def start_response(status_line, headers, exc_info=None):
+            nonlocal status
+            status = int(status_line.split()[0])
+
+        with _round_trip(latency):
+            body = application(_environ(target), start_response)
+            try:
+                for _ in body:
+                    pass
+            finally:
+                if hasattr(body, 'close'):
+                    body.close()
+        return status
+
+    def client(offset):
+        sent = offset
+        while time.perf_counter() < deadline:
+            target = found[sent % len(found)]
+            sent += 1
+            started = time.perf_counter()
+            status = worker.submit(handle, target).result()
+            _record(results, target, time.perf_counter() - started, status)
+
+    with ThreadPoolExecutor(threads or concurrency) as worker, ThreadPoolExecutor(concurrency) as clients:
+        list(clients.map(client, range(concurrency)))
+
+
+def _scope(target):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': target.path,
+        'query_string': target.query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'testserver'), (b'cookie', target.cookie.encode())],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 0),
+    }
+
+
+async def _asgi_request(application, target):
+    status = None
+    received = False
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # The client stays connected; Django cancels this once it has responded
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(_scope(target), receive, send)
+    return status
+
+
+def run_asgi(found, concurrency, duration, results, latency=0, threads=None):
+    """Send the targets round-robin from `concurrency` tasks on one event loop for `duration` seconds."""
+    application = import_string(settings.ASGI_APPLICATION)
+
+    async def main():
+        deadline = time.perf_counter() + duration
+
+        async def worker(offset):
+            sent = offset
+            while time.perf_counter() < deadline:
+                target = found[sent % len(found)]
+                sent += 1
+                started = time.perf_counter()
+                status = await _asgi_request(application, target)
+                _record(results, target, time.perf_counter() - started, status)
+
+        # Tasks and sync_to_async copy the context, so every query gets the delay
+        with _round_trip(latency):
+            await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+
+    asyncio.run(main())
+
+
+DRIVERS = {'wsgi': run_wsgi, 'asgi': run_asgi}
+
+
+def run(only=None, concurrency=(1, 16, 64), duration=10, latency=0, threads=None, log=None):
+    """Requests per second and latency of the scenarios under each entry point and concurrency.
+
+    `latency` is the simulated database round trip in seconds, `threads` the
+    WSGI worker's thread count (default one per concurrent request).
+    """
+    log = log or (lambda message: None)
+    fixtures = benchmarks.Fixtures()
+    names = only or DEFAULT_SCENARIOS
+    found = [scenario for scenario in benchmarks.scenarios(fixtures) if scenario.name in names]
+    results = {}
+    # The host name the drivers send, which ALLOWED_HOSTS may not list
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        sent = targets(found, fixtures)
+        for interface, driver in DRIVERS.items():
+            # One pass first, so caches and indexes are warm for both
+            driver(sent, 1, 0.1, Results(), latency, threads)
+            results[interface] = {}
+            for level in concurrency:
+                recorded = Results()
+                started = time.perf_counter()
+                driver(sent, level, duration, recorded, latency, threads)
+                report = recorded.report(time.perf_counter() - started)
+                results[interface][str(level)] = report
+                total = report.get('all', {})
+                log(f"{interface} x{level:<4} {total.get('throughput_rps', 0):9.1f} req/s  "
+                    f"p50 {total.get('p50_ms', 0):7.1f} ms  p99 {total.get('p99_ms', 0):7.1f} ms  "
+                    f"{total.get('errors', 0)} errors")
+    return {
+        'meta': {
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'duration': duration,
+            'latency_ms': latency * 1000,
+            'wsgi_threads': threads,
+            'scenarios': [scenario.name for scenario in found],
+            'dataset': fixtures.describe(),
+        },
+        'results': results,
+    }
+
+
+def speedups(document):
+    """ASGI throughput over WSGI throughput at each concurrency level."""
+    wsgi, asgi = document['results']['wsgi'], document['results']['asgi']
+    return {
+        level: round(asgi[level]['all']['throughput_rps'] / wsgi[level]['all']['throughput_rps'], 2)
+        for level in wsgi
+        if level in asgi and wsgi[level].get('all', {}).get('throughput_rps')
+    }
+
+
+def save(document, path):
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
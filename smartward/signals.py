@@ -0,0 +1,203 @@
+import threading
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import availability, dashboards, onduty, pdf, search, slotfeed, suggest
+from .models import (
+    DoctorAppointment, DoctorAppointmentSlot, Patient, Shift, SpecializedAppointment, SpecializedAppointmentSlot,
+)
+
+
+@receiver(pre_save, sender=Patient)
+def remember_patient_names(sender, instance, **kwargs):
+    # Other processes' indexes need the old names, whether or not this one has an index
+    instance._previous_names = ()
+    if instance.pk:
+        instance._previous_names = Patient.objects.filter(pk=instance.pk).values_list(
+            'first_name', 'last_name'
+        ).first() or ()
+
+
+@receiver(post_save, sender=Patient)
+def update_patient_search_index(sender, instance, **kwargs):
+    # Tokens are removed with the patient through the foreign key cascade,
+    # so only saves need to touch the index.
+    search.index_patient(instance)
+
+    old_names = getattr(instance, '_previous_names', ())
+    new_names = (instance.first_name, instance.last_name)
+    if tuple(old_names) != new_names:
+        transaction.on_commit(lambda: suggest.patient_changed(old_names, new_names))
+
+
+@receiver(post_delete, sender=Patient)
+def remove_patient_suggestions(sender, instance, **kwargs):
+    names = (instance.first_name, instance.last_name)
+    transaction.on_commit(lambda: suggest.patient_changed(old_names=names))
+
+
+# Models whose per-row receivers below are switched off on this thread while
+# delete_in_batch() removes their rows and does the same work once per batch
+_batch = threading.local()
+
+
+def _batched(sender):
+    return sender in getattr(_batch, 'models', ())
+
+
+@receiver(post_init, sender=DoctorAppointment)
+@receiver(post_init, sender=SpecializedAppointment)
+def remember_appointment_slot(sender, instance, **kwargs):
+    # Needed to free the old slot when an appointment is moved to another one
+    instance._loaded_slot_id = instance.slot_id
+
+
+@receiver(post_init, sender=Shift)
+@receiver(post_init, sender=DoctorAppointment)
+@receiver(post_init, sender=DoctorAppointmentSlot)
+def remember_dashboard_doctor(sender, instance, **kwargs):
+    # Moving a row to another doctor changes both doctors' dashboards. Read from
+    # __dict__ so a row loaded without its doctor is not fetched again for it.
+    instance._loaded_doctor_id = instance.__dict__.get('doctor_id')
+
+
+def _refresh_slots(kind, appointments):
+    refresh = availability.refresh_doctor_slots if kind == 'doctor' else availability.refresh_specialized_slots
+    slot_ids = set()
+    for appointment in appointments:
+        slot_ids |= {appointment.slot_id, appointment._loaded_slot_id}
+        appointment._loaded_slot_id = appointment.slot_id
+    refresh(slot_ids)
+    slotfeed.slots_changed(kind, slot_ids)
+
+
+def _invalidate_pdfs(kind, appointments):
+    pks = [appointment.pk for appointment in appointments]
+    transaction.on_commit(lambda: pdf.invalidate_appointments(kind, pks))
+
+
+def _dashboard_doctors(rows):
+    doctor_ids = set()
+    for row in rows:
+        doctor_ids |= {row.doctor_id, row._loaded_doctor_id}
+        row._loaded_doctor_id = row.doctor_id
+    return doctor_ids - {None}
+
+
+def _publish_slots(sender, slots):
+    # Expired slots removed by the sweeper are on no booking page
+    now = timezone.now()
+    kind = 'doctor' if sender is DoctorAppointmentSlot else 'specialized'
+    slotfeed.slots_changed(kind, {slot.pk for slot in slots if slot.end_at >= now})
+
+
+@receiver(post_save, sender=DoctorAppointment)
+@receiver(post_delete, sender=DoctorAppointment)
+def update_doctor_slot_availability(sender, instance, **kwargs):
+    if not _batched(sender):
+        _refresh_slots('doctor', [instance])
+
+
+@receiver(post_save, sender=SpecializedAppointment)
+@receiver(post_delete, sender=SpecializedAppointment)
+def update_specialized_slot_availability(sender, instance, **kwargs):
+    if not _batched(sender):
+        _refresh_slots('specialized', [instance])
+
+
+@receiver(post_save, sender=DoctorAppointment)
+@receiver(post_delete, sender=DoctorAppointment)
+def invalidate_doctor_appointment_pdf(sender, instance, **kwargs):
+    if not _batched(sender):
+        _invalidate_pdfs('doctor_appointment', [instance])
+
+
+@receiver(post_save, sender=SpecializedAppointment)
+@receiver(post_delete, sender=SpecializedAppointment)
+def invalidate_specialized_appointment_pdf(sender, instance, **kwargs):
+    if not _batched(sender):
+        _invalidate_pdfs('specialized_appointment', [instance])
+
+
+@receiver(post_save, sender=Shift)
+@receiver(post_delete, sender=Shift)
+def invalidate_shift_dashboards(sender, instance, **kwargs):
+    if not _batched(sender):
+        dashboards.invalidate_shifts(_dashboard_doctors([instance]))
+
+
+@receiver(post_save, sender=DoctorAppointment)
+@receiver(post_delete, sender=DoctorAppointment)
+@receiver(post_save, sender=DoctorAppointmentSlot)
+@receiver(post_delete, sender=DoctorAppointmentSlot)
+def invalidate_appointment_dashboards(sender, instance, **kwargs):
+    if not _batched(sender):
+        dashboards.invalidate_appointments(_dashboard_doctors([instance]))
+
+
+@receiver(post_save, sender=Shift)
+def update_on_duty_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: onduty.shift_changed(pk))
+
+
+@receiver(post_delete, sender=Shift)
+def remove_from_on_duty_index(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: onduty.shift_removed(pk))
+
+
+@receiver(post_save, sender=DoctorAppointmentSlot)
+@receiver(post_delete, sender=DoctorAppointmentSlot)
+@receiver(post_save, sender=SpecializedAppointmentSlot)
+@receiver(post_delete, sender=SpecializedAppointmentSlot)
+def publish_slot_change(sender, instance, **kwargs):
+    if not _batched(sender):
+        _publish_slots(sender, [instance])
+
+
+def _doctor_appointments_deleted(rows):
+    _refresh_slots('doctor', rows)
+    _invalidate_pdfs('doctor_appointment', rows)
+    dashboards.invalidate_appointments(_dashboard_doctors(rows))
+
+
+def _specialized_appointments_deleted(rows):
+    _refresh_slots('specialized', rows)
+    _invalidate_pdfs('specialized_appointment', rows)
+
+
+def _doctor_slots_deleted(rows):
+    dashboards.invalidate_appointments(_dashboard_doctors(rows))
+    _publish_slots(DoctorAppointmentSlot, rows)
+
+
+# model -> what its receivers above do, for a whole batch of deleted rows
+_BATCH_DELETES = {
+    DoctorAppointment: _doctor_appointments_deleted,
+    SpecializedAppointment: _specialized_appointments_deleted,
+    DoctorAppointmentSlot: _doctor_slots_deleted,
+    SpecializedAppointmentSlot: lambda rows: _publish_slots(SpecializedAppointmentSlot, rows),
+}
+
+
+def delete_in_batch(model, rows):
+    """Delete loaded rows of a model with one query, and run its receivers' work once for all of them.
+
+    The per-row receivers would otherwise issue a slot UPDATE and queue cache
+    and PDF invalidations for every row of a sweeper or archive batch. Cascaded
+    deletes of other models still go through their receivers.
+    """
+    rows = list(rows)
+    models = getattr(_batch, 'models', frozenset())
+    _batch.models = models | {model}
+    try:
+        model.objects.filter(pk__in=[row.pk for row in rows]).delete()
+    finally:
+        _batch.models = models
+    handle = _BATCH_DELETES.get(model)
+    if handle and rows:
+        handle(rows)
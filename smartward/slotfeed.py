@@ -0,0 +1,176 @@
+import asyncio
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import DoctorAppointmentSlot, SpecializedAppointmentSlot
+
+# Slot changes go into a numbered log in the cache: the sequence number is
+# incremented and the event stored under it. Each ASGI process runs one poller
+# that reads new entries and hands them to its connected streams, so with a
+# shared cache a booking made by any worker reaches every open booking page.
+SEQUENCE_KEY = 'slotfeed:sequence'
+EVENT_TTL = 300  # seconds an event stays available for reconnecting clients
+
+KINDS = {
+    'doctor': (DoctorAppointmentSlot, 'doctor'),
+    'specialized': (SpecializedAppointmentSlot, 'appointment_type'),
+}
+
+
+def _event_key(sequence):
+    return f'slotfeed:event:{sequence}'
+
+
+def _next_sequence():
+    try:
+        return cache.incr(SEQUENCE_KEY)
+    except ValueError:
+        cache.add(SEQUENCE_KEY, 0, None)
+        return cache.incr(SEQUENCE_KEY)
+
+
+def publish(event):
+    """Append one event to the log; returns its sequence number."""
+    sequence = _next_sequence()
+    cache.set(_event_key(sequence), event, EVENT_TTL)
+    return sequence
+
+
+def _describe(kind, slot_ids):
+    # Events carry the slot's state after the change rather than what happened,
+    # so applying them twice or out of order cannot corrupt a page
+    model, related = KINDS[kind]
+    today = timezone.localdate()
+    found = {slot.pk: slot for slot in model.objects.filter(pk__in=slot_ids).select_related(related)}
+    events = []
+    for slot_id in sorted(slot_ids):
+        slot = found.get(slot_id)
+        event = {'kind': kind, 'slot': slot_id, 'available': False}
+        if slot is not None and not slot.is_booked and slot.date >= today:
+            event.update(
+                available=True,
+                label=str(slot),
+                start=timezone.localtime(slot.start_at).isoformat(),
+                times=f'{slot.start_time} - {slot.end_time}',
+            )
+            if kind == 'specialized':
+                event['appointment_type'] = slot.appointment_type_id
+        events.append(event)
+    return events
+
+
+def slots_changed(kind, slot_ids):
+    """Publish the new state of slots once the current transaction commits."""
+    slot_ids = set(slot_ids) - {None}
+    if slot_ids:
+        transaction.on_commit(lambda: [publish(event) for event in _describe(kind, slot_ids)])
+
+
+def reset(kind):
+    """Tell pages to reload their slot lists, for changes made without signals (bulk_create)."""
+    transaction.on_commit(lambda: publish({'kind': kind, 'reset': True}))
+
+
+def read(first, last):
+    """Events first..last from the log, with None for any that have expired."""
+    found = cache.get_many([_event_key(sequence) for sequence in range(first, last + 1)])
+    return [(sequence, found.get(_event_key(sequence))) for sequence in range(first, last + 1)]
+
+
+class Hub:
+    """Fans the log out to the streams connected to this process, polling the cache while any are."""
+
+    def __init__(self, interval=0.5, backlog=1000):
+        self.interval = interval
+        self.backlog = backlog
+        self.streams = set()
+        self.sequence = None
+        self._task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(self.backlog)
+        self.streams.add(queue)
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.streams.discard(queue)
+
+    async def _poll(self):
+        self.sequence = await cache.aget(SEQUENCE_KEY, 0)
+        while self.streams:
+            await asyncio.sleep(self.interval)
+            latest = await cache.aget(SEQUENCE_KEY, 0)
+            if latest == self.sequence:
+                continue
+            if latest < self.sequence or latest - self.sequence > self.backlog:
+                # The counter was lost or we fell far behind: have everyone reload
+                events = [(latest, None)]
+            else:
+                events = await asyncio.to_thread(read, self.sequence + 1, latest)
+            self.sequence = latest
+            for queue in list(self.streams):
+                for item in events:
+                    try:
+                        queue.put_nowait(item)
+                    except asyncio.QueueFull:
+                        # A stream that stopped reading gets a reset when it catches up
+                        self.unsubscribe(queue)
+                        break
+
+
+_hubs = {}
+
+
+def get_hub():
+    """This event loop's hub; one per process under an ASGI server."""
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs.clear()
+        _hubs[loop] = Hub(interval=getattr(settings, 'SLOT_FEED_POLL_INTERVAL', 0.5))
+    return _hubs[loop]
+
+
+def format_event(sequence, event):
+    """One server-sent event; a missing event becomes a reset."""
+    if event is None or event.get('reset'):
+        data = {'kind': event['kind']} if event else {}
+        return f'id: {sequence}\nevent: reset\ndata: {json.dumps(data)}\n\n'
+    return f'id: {sequence}\nevent: slot\ndata: {json.dumps(event)}\n\n'
+
+
+async def stream(last_event_id=None, keepalive=15):
+    """Server-sent events for every slot change from now on.
+
+    A client reconnecting with Last-Event-ID first gets what it missed, or a
+    reset when that is no longer in the log.
+    """
+    hub = get_hub()
+    queue = hub.subscribe()
+    try:
+        yield 'retry: 3000\n\n'
+        if last_event_id is not None:
+            latest = await cache.aget(SEQUENCE_KEY, 0)
+            if latest - last_event_id > hub.backlog or latest < last_event_id:
+                yield format_event(latest, None)
+            elif latest > last_event_id:
+                for sequence, event in await asyncio.to_thread(read, last_event_id + 1, latest):
+                    yield format_event(sequence, event)
+        while True:
+            try:
+                sequence, event = await asyncio.wait_for(queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield ': keep-alive\n\n'
+                continue
+            yield format_event(sequence, event)
+            if queue not in hub.streams:
+                yield format_event(sequence, None)
+                return
+    finally:
+        hub.unsubscribe(queue)
@@ -0,0 +1,201 @@
+import bisect
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from . import dashboards, slotfeed
+from .intervals import IntervalTree
+from .models import MAX_SHIFT_LENGTH, DoctorAppointmentSlot, Shift, slot_bounds
+
+SLOT_LENGTH = timedelta(minutes=15)
+MAX_SLOT_LENGTH = timedelta(minutes=30)
+
+
+class ShiftCoverage:
+    """Answers "is this time inside one of the doctor's shifts" from one bounded query.
+
+    Only shifts overlapping [start, end) are loaded, as a (doctor, start_time)
+    range on the shift index since no shift is longer than MAX_SHIFT_LENGTH, and
+    kept in an interval tree per doctor, so checking one slot or ten thousand
+    costs the same single query.
+    """
+
+    def __init__(self, doctor_ids, start, end):
+        intervals = defaultdict(list)
+        shifts = Shift.objects.filter(
+            doctor_id__in=doctor_ids, start_time__gte=start - MAX_SHIFT_LENGTH, start_time__lt=end,
+            end_time__gt=start,
+        ).values_list('doctor_id', 'start_time', 'end_time', 'pk')
+        for doctor_id, shift_start, shift_end, pk in shifts:
+            intervals[doctor_id].append((shift_start, shift_end, pk))
+        self._trees = {doctor_id: IntervalTree(items) for doctor_id, items in intervals.items()}
+
+    def covers(self, doctor_id, start, end):
+        tree = self._trees.get(doctor_id)
+        return tree is not None and tree.contains(start, end)
+
+
+def check_slot_times(day, start_time, end_time, now=None):
+    """Raise ValidationError unless the slot times are ordered, short enough and not in the past."""
+    if start_time is None or end_time is None:
+        raise ValidationError("Both start time and end time must be specified.")
+
+    if start_time >= end_time:
+        raise ValidationError("End time must be after start time.")
+
+    if day is not None:
+        slot_start, slot_end = slot_bounds(day, start_time, end_time)
+        if slot_start < (now or timezone.now()):
+            raise ValidationError("The slot cannot be in the past.")
+        if slot_end - slot_start > MAX_SLOT_LENGTH:
+            raise ValidationError("The appointment slot duration cannot exceed 30 minutes.")
+
+
+def check_slot(doctor_id, day, start_time, end_time, coverage=None, now=None):
+    """Validate a single slot, including that it lies within one of the doctor's shifts.
+
+    Pass a ShiftCoverage when validating many slots so the shifts are loaded once.
+    """
+    check_slot_times(day, start_time, end_time, now)
+    if day is None:
+        return
+    slot_start, slot_end = slot_bounds(day, start_time, end_time)
+    if coverage is None:
+        coverage = ShiftCoverage([doctor_id], slot_start, slot_end)
+    if not coverage.covers(doctor_id, slot_start, slot_end):
+        raise ValidationError("The slot must be within the doctor's shift time.")
+
+
+def validate_slots(slots):
+    """Validate many unsaved slots against the shift table in one query.
+
+    Returns a list of (slot, ValidationError) for the slots that failed.
+    """
+    slots = list(slots)
+    bounds = [
+        slot_bounds(slot.date, slot.start_time, slot.end_time)
+        for slot in slots if slot.start_time is not None and slot.end_time is not None
+    ]
+    coverage = None
+    if bounds:
+        coverage = ShiftCoverage(
+            {slot.doctor_id for slot in slots}, min(b[0] for b in bounds), max(b[1] for b in bounds)
+        )
+    now = timezone.now()
+    errors = []
+    for slot in slots:
+        try:
+            check_slot(slot.doctor_id, slot.date, slot.start_time, slot.end_time, coverage, now)
+        except ValidationError as e:
+            errors.append((slot, e))
+    return errors
+
+
+def _cut_shift(shift, length, not_before, not_after):
+    """Yield (date, start_time, end_time) for each whole slot of `length` inside a shift."""
+    start = timezone.localtime(max(shift.start_time, not_before))
+    end = timezone.localtime(min(shift.end_time, not_after))
+    # Keep slots aligned to the shift start, whatever the window start is
+    offset = (start - shift.start_time) % length
+    if offset:
+        start += length - offset
+    while start + length <= end:
+        slot_end = start + length
+        # A slot stores a single date, so one running past midnight is left out
+        if slot_end.date() == start.date():
+            yield start.date(), start.time(), slot_end.time()
+        start = slot_end
+
+
+def _existing_slots(doctor_ids, first_date, last_date):
+    """Load the doctors' slots in the date range once, as sorted intervals per (doctor, date)."""
+    existing = defaultdict(list)
+    rows = DoctorAppointmentSlot.objects.filter(
+        doctor_id__in=doctor_ids, date__range=(first_date, last_date)
+    ).values_list('doctor_id', 'date', 'start_time', 'end_time')
+    for doctor_id, day, start_time, end_time in rows:
+        existing[doctor_id, day].append((start_time, end_time))
+    for intervals in existing.values():
+        intervals.sort()
+    return existing
+
+
+def _overlaps(intervals, start_time, end_time):
+    """True if [start_time, end_time) overlaps any interval in a sorted, non-overlapping list."""
+    i = bisect.bisect_left(intervals, (start_time,))
+    if i < len(intervals) and intervals[i][0] < end_time:
+        return True
+    return i > 0 and intervals[i - 1][1] > start_time
+
+
+def plan_slots(shifts, length=SLOT_LENGTH, start=None, end=None, now=None):
+    """Cut shifts into unsaved DoctorAppointmentSlot objects between start and end.
+
+    Every candidate is checked in memory against the doctors' existing slots and
+    against the other candidates, so the whole batch costs one query. Returns
+    (slots, skipped) where skipped counts candidates that clashed with a slot.
+    No slot starts before `now`, the current time unless given.
+    """
+    if length > MAX_SLOT_LENGTH or length <= timedelta(0):
+        raise ValueError("The appointment slot duration must be between 1 and 30 minutes.")
+    shifts = list(shifts)
+    if not shifts:
+        return [], 0
+    # Slots can never be in the past
+    now = now or timezone.now()
+    start = max(start or now, now)
+
+    candidates = []
+    for shift in shifts:
+        for day, start_time, end_time in _cut_shift(shift, length, start, end or shift.end_time):
+            candidates.append((shift.doctor_id, day, start_time, end_time))
+    if not candidates:
+        return [], 0
+
+    existing = _existing_slots(
+        {doctor_id for doctor_id, *_ in candidates},
+        min(day for _, day, _, _ in candidates),
+        max(day for _, day, _, _ in candidates),
+    )
+    slots, skipped = [], 0
+    for doctor_id, day, start_time, end_time in sorted(candidates):
+        intervals = existing[doctor_id, day]
+        if _overlaps(intervals, start_time, end_time):
+            skipped += 1
+            continue
+        bisect.insort(intervals, (start_time, end_time))
+        start_at, end_at = slot_bounds(day, start_time, end_time)
+        slots.append(DoctorAppointmentSlot(
+            doctor_id=doctor_id, date=day, start_time=start_time, end_time=end_time,
+            start_at=start_at, end_at=end_at,
+        ))
+    return slots, skipped
+
+
+def generate_slots(shifts, length=SLOT_LENGTH, start=None, end=None, batch_size=1000):
+    """Create appointment slots for shifts with bulk_create. Returns (created, skipped)."""
+    slots, skipped = plan_slots(shifts, length, start, end)
+    DoctorAppointmentSlot.objects.bulk_create(slots, batch_size=batch_size)
+    if slots:
+        # bulk_create sends no signals, and on MySQL leaves the new slots without ids
+        dashboards.invalidate_appointments({slot.doctor_id for slot in slots})
+        slotfeed.reset('doctor')
+    return len(slots), skipped
+
+
+def date_window(first_date, last_date):
+    """Return the aware (start, end) datetimes covering local dates first_date..last_date."""
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(first_date, datetime.min.time()), tz)
+    end = timezone.make_aware(datetime.combine(last_date + timedelta(days=1), datetime.min.time()), tz)
+    return start, end
+
+
+def shifts_between(start, end, doctors=None):
+    """Shifts overlapping [start, end), optionally only for some doctors."""
+    shifts = Shift.objects.filter(start_time__gte=start - MAX_SHIFT_LENGTH, start_time__lt=end, end_time__gt=start)
+    if doctors is not None:
+        shifts = shifts.filter(doctor__in=doctors)
+    return shifts
@@ -0,0 +1,100 @@
+// Search-as-you-type pickers (PickerWidget in forms.py) in place of selects that
+// listed every option: options come a page at a time from a JSON endpoint, and the
+// chosen id goes into the hidden input. Dispatch "picker:refresh" on a picker to
+// reload its results.
+(function() {
+    function setUp(picker) {
+        const input = picker.querySelector('input[type="hidden"]');
+        const search = picker.querySelector('.picker-search');
+        const date = picker.querySelector('.picker-date');
+        const choice = picker.querySelector('.picker-choice');
+        const results = picker.querySelector('.picker-results');
+        const more = picker.querySelector('.picker-more');
+        let timer = null;
+        let generation = 0;
+
+        function url(cursor) {
+            const params = new URLSearchParams(picker.dataset.params);
+            if (search.value.trim()) {
+                params.set('q', search.value.trim());
+            }
+            if (date && date.value) {
+                params.set('date', date.value);
+            }
+            if (cursor) {
+                params.set('cursor', cursor);
+            }
+            return picker.dataset.url + '?' + params.toString();
+        }
+
+        function load(cursor) {
+            // Answers to searches the user has since changed are dropped
+            const current = ++generation;
+            fetch(url(cursor), {credentials: 'same-origin', headers: {'Accept': 'application/json'}})
+                .then(function(response) { return response.ok ? response.json() : null; })
+                .then(function(page) {
+                    if (!page || current !== generation) {
+                        return;
+                    }
+                    if (!cursor) {
+                        results.innerHTML = '';
+                    }
+                    for (const option of page.results) {
+                        const item = document.createElement('li');
+                        item.dataset.value = option.id;
+                        item.textContent = option.label;
+                        item.tabIndex = 0;
+                        results.appendChild(item);
+                    }
+                    if (!cursor && !page.results.length) {
+                        const empty = document.createElement('li');
+                        empty.textContent = 'No matches.';
+                        results.appendChild(empty);
+                    }
+                    more.hidden = !page.next;
+                    more.dataset.cursor = page.next || '';
+                })
+                .catch(function() {});
+        }
+
+        function choose(item) {
+            input.value = item.dataset.value;
+            choice.textContent = item.textContent;
+            input.dispatchEvent(new Event('change', {bubbles: true}));
+        }
+
+        results.addEventListener('click', function(event) {
+            const item = event.target.closest('li[data-value]');
+            if (item) {
+                choose(item);
+            }
+        });
+        results.addEventListener('keydown', function(event) {
+            const item = event.target.closest('li[data-value]');
+            if (item && event.key === 'Enter') {
+                event.preventDefault();
+                choose(item);
+            }
+        });
+        search.addEventListener('keydown', function(event) {
+            // Enter searches rather than submitting the form
+            if (event.key === 'Enter') {
+                event.preventDefault();
+                clearTimeout(timer);
+                load(null);
+            }
+        });
+        search.addEventListener('input', function() {
+            clearTimeout(timer);
+            timer = setTimeout(function() { load(null); }, 250);
+        });
+        if (date) {
+            date.addEventListener('change', function() { load(null); });
+        }
+        more.addEventListener('click', function() { load(more.dataset.cursor); });
+        picker.addEventListener('picker:refresh', function() { load(null); });
+        load(null);
+    }
+
+    document.querySelectorAll('.picker').forEach(setUp);
+})();
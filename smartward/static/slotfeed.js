@@ -0,0 +1,108 @@
+// Keeps a booking page's slot choices current from the slot feed (server-sent
+// events), so receptionists no longer reload the page to see what is still free.
+// Include with data-feed-url and data-kind ("doctor" or "specialized"), and
+// data-appointment-type to also patch a #slot-list of that type's slots.
+(function() {
+    const script = document.currentScript;
+    const kind = script.dataset.kind;
+    const appointmentType = script.dataset.appointmentType ? Number(script.dataset.appointmentType) : null;
+    const input = document.querySelector('.picker input[name="slot"]');
+    const picker = input ? input.closest('.picker') : null;
+    if (!picker || !window.EventSource) {
+        return;
+    }
+
+    function insertInOrder(parent, element, key) {
+        for (const other of parent.children) {
+            if (key(other) !== null && key(other) > key(element)) {
+                parent.insertBefore(element, other);
+                return;
+            }
+        }
+        parent.appendChild(element);
+    }
+
+    function itemKey(item) {
+        return item.dataset.start || null;
+    }
+
+    function updatePicker(slot) {
+        // Slots that become free show up with the picker's next search
+        if (slot.available) {
+            return;
+        }
+        const item = picker.querySelector('.picker-results li[data-value="' + slot.slot + '"]');
+        if (item) {
+            item.remove();
+        }
+        if (input.value === String(slot.slot)) {
+            // Keep the receptionist's choice visible, but they must pick another
+            const choice = picker.querySelector('.picker-choice');
+            choice.textContent = choice.textContent.replace(/ \(just booked\)$/, '') + ' (just booked)';
+        }
+    }
+
+    function updateList(slot) {
+        const list = document.getElementById('slot-list');
+        if (!list || slot.kind !== 'specialized' || (slot.available && slot.appointment_type !== appointmentType)) {
+            return;
+        }
+        let item = list.querySelector('li[data-slot="' + slot.slot + '"]');
+        if (!slot.available) {
+            if (item) {
+                item.remove();
+            }
+            return;
+        }
+        if (!item) {
+            item = document.createElement('li');
+            item.dataset.slot = slot.slot;
+            item.dataset.start = slot.start;
+            insertInOrder(list, item, itemKey);
+        }
+        item.textContent = slot.times;
+        const empty = document.getElementById('slot-list-empty');
+        if (empty) {
+            empty.remove();
+        }
+    }
+
+    function reload() {
+        // Changes the feed could not describe: search again, and take the list from a fresh copy of the page
+        picker.dispatchEvent(new Event('picker:refresh'));
+        const list = document.getElementById('slot-list');
+        if (!list) {
+            return;
+        }
+        fetch(window.location.href, {credentials: 'same-origin'})
+            .then(function(response) { return response.ok ? response.text() : null; })
+            .then(function(html) {
+                if (!html) {
+                    return;
+                }
+                const freshList = new DOMParser().parseFromString(html, 'text/html').getElementById('slot-list');
+                if (freshList) {
+                    list.innerHTML = freshList.innerHTML;
+                }
+            })
+            .catch(function() {});
+    }
+
+    const source = new EventSource(script.dataset.feedUrl);
+    source.addEventListener('slot', function(message) {
+        const slot = JSON.parse(message.data);
+        if (slot.available && new Date(slot.start) < new Date()) {
+            return;
+        }
+        if (slot.kind === kind) {
+            updatePicker(slot);
+        }
+        updateList(slot);
+    });
+    source.addEventListener('reset', function(message) {
+        const data = JSON.parse(message.data);
+        if (!data.kind || data.kind === kind) {
+            reload();
+        }
+    });
+})();
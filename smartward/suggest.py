@@ -0,0 +1,211 @@
+"""
+"Did you mean" suggestions for patient searches.
+
+Names are held in a symmetric-delete dictionary: every name is stored under each
+string obtained by deleting up to MAX_DISTANCE characters from it, so a lookup
+only generates the deletes of the query and checks the few names found under
+them instead of comparing the query against every patient.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+MAX_DISTANCE = 2
+
+
+def _deletes(word, max_distance):
+    """Return the word and every variant with up to max_distance characters removed."""
+    found = {word}
+    frontier = {word}
+    for _ in range(max_distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a, b, limit):
+    """Damerau-Levenshtein (optimal string alignment) distance, or limit + 1 once it is exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SuggestionIndex:
+    def __init__(self, max_distance=MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.version = None  # the shared version this index is current with
+        self._names = {}  # lowercased name -> [count, name as entered]
+        self._deletes = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name):
+        key = (name or '').strip().lower()
+        if not key:
+            return
+        with self._lock:
+            entry = self._names.get(key)
+            if entry:
+                entry[0] += 1
+                return
+            self._names[key] = [1, name.strip()]
+            for variant in _deletes(key, self.max_distance):
+                self._deletes[variant].add(key)
+
+    def discard(self, name):
+        key = (name or '').strip().lower()
+        with self._lock:
+            entry = self._names.get(key)
+            if not entry:
+                return
+            entry[0] -= 1
+            if entry[0] > 0:
+                return
+            del self._names[key]
+            for variant in _deletes(key, self.max_distance):
+                keys = self._deletes.get(variant)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._deletes[variant]
+
+    def apply(self, old_names, new_names):
+        for name in old_names:
+            self.discard(name)
+        for name in new_names:
+            self.add(name)
+
+    def lookup(self, query):
+        """Return the closest known name to the query, or None."""
+        key = (query or '').strip().lower()
+        if not key:
+            return None
+        # Short queries only tolerate one typo, otherwise nearly everything matches.
+        limit = max(1, min(self.max_distance, len(key) // 3))
+
+        candidates = set()
+        for variant in _deletes(key, limit):
+            candidates |= self._deletes.get(variant, set())
+
+        best = None
+        for candidate in candidates:
+            distance = edit_distance(key, candidate, limit)
+            if distance > limit:
+                continue
+            rank = (distance, -self._names[candidate][0], candidate)
+            if best is None or rank < best:
+                best = rank
+        return self._names[best[2]][1] if best else None
+
+
+VERSION_KEY = 'suggest:version'
+CHANGE_KEY = 'suggest:change:%d'
+# A process further behind than this many changes reloads instead of replaying them
+MAX_REPLAY = 1000
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _cache_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # From the clock so an evicted counter never matches an old value
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _bump():
+    """Move the shared version on, returning the new value (None if it had to be reset)."""
+    try:
+        return cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+        return None
+
+
+def _replay(index, version):
+    """Apply the changes logged after index.version up to version; False if any are gone."""
+    if index.version is None or not 0 < version - index.version <= MAX_REPLAY:
+        return False
+    keys = [CHANGE_KEY % v for v in range(index.version + 1, version + 1)]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return False
+    for key in keys:
+        index.apply(*changes[key])
+    index.version = version
+    return True
+
+
+def get_index():
+    """Return the process-wide index, building it on first use.
+
+    Every patient change bumps a version in the cache and logs the names it
+    removed and added under that version, for SUGGESTION_CHANGE_TIMEOUT seconds.
+    A process whose index is behind the version replays just those changes, and
+    only reloads all names when some have expired or it is too far behind.
+    """
+    global _index
+    version = _cache_version()
+    index = _index
+    if index is None or index.version != version:
+        with _index_lock:
+            index = _index
+            if index is None or (index.version != version and not _replay(index, version)):
+                _index = build_index(version)
+            index = _index
+    return index
+
+
+def build_index(version=None):
+    from .models import Patient
+
+    index = SuggestionIndex()
+    index.version = version
+    for first_name, last_name in Patient.objects.values_list('first_name', 'last_name').iterator(chunk_size=5000):
+        index.add(first_name)
+        index.add(last_name)
+    return index
+
+
+def is_loaded():
+    return _index is not None
+
+
+def suggest(query):
+    """Return a "did you mean" name for a search query that found nothing."""
+    return get_index().lookup(query)
+
+
+def patient_changed(old_names=(), new_names=()):
+    """Log a patient's name change for every process and apply it to this one's index."""
+    old_names, new_names = tuple(old_names), tuple(new_names)
+    with _index_lock:
+        version = _bump()
+        if version is not None:
+            cache.set(CHANGE_KEY % version, (old_names, new_names), getattr(settings, 'SUGGESTION_CHANGE_TIMEOUT', 3600))
+        index = _index
+        # Anything but our own bump leaves the rest to be replayed by get_index()
+        if index is not None and version is not None and index.version == version - 1:
+            index.apply(old_names, new_names)
+            index.version = version
@@ -0,0 +1,132 @@
+import time
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from . import archive, signals
+from .models import DoctorAppointment, DoctorAppointmentSlot, SpecializedAppointment, SweepWatermark, Visit
+
+# Rows are kept until this long after their slot has ended
+GRACE_PERIOD = timedelta(minutes=10)
+BATCH_SIZE = 500
+
+
+class Sweep:
+    """Rows of `model` whose `time_field` is older than `age` are archived or deleted."""
+
+    def __init__(self, model, time_field, age, archive=False, **filters):
+        self.model = model
+        self.time_field = time_field
+        self.age = age
+        self.archive = archive
+        self.filters = filters
+
+    def expired(self, cutoff):
+        return self.model.objects.filter(**self.filters, **{f"{self.time_field}__lte": cutoff})
+
+    def held_since(self, cutoff, after=None):
+        """The earliest expiry among rows `filters` leaves for another sweep, or None."""
+        if not self.filters:
+            return None
+        held = self.model.objects.exclude(**self.filters).filter(**{f"{self.time_field}__lte": cutoff})
+        if after is not None:
+            held = held.filter(**{f"{self.time_field}__gt": after})
+        return held.aggregate(earliest=Min(self.time_field))['earliest']
+
+
+# Run in this order: appointments are archived before their slots are deleted,
+# and booked slots are left for the appointment sweep to release. The watermark
+# of the slot sweep stops short of the earliest slot it left, so the slot is
+# swept once its appointment has gone.
+SWEEPS = {
+    'doctor_appointments': Sweep(DoctorAppointment, 'slot__end_at', GRACE_PERIOD, archive=True),
+    'specialized_appointments': Sweep(SpecializedAppointment, 'slot__end_at', GRACE_PERIOD, archive=True),
+    'visits': Sweep(
+        Visit, 'visit_date', timedelta(days=getattr(settings, 'ARCHIVE_VISITS_AFTER_DAYS', 365)), archive=True
+    ),
+    'doctor_slots': Sweep(DoctorAppointmentSlot, 'end_at', GRACE_PERIOD, is_booked=False),
+}
+
+
+class SweepReport:
+    def __init__(self, name):
+        self.name = name
+        self.rows = 0
+        self.batches = 0
+        self.elapsed = 0.0
+        self.lock_time = 0.0
+        self.max_lock_time = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.name}: {self.rows} rows in {self.batches} batches, {self.elapsed:.2f}s "
+            f"({self.rows_per_second:.0f} rows/s), lock time {self.lock_time:.3f}s "
+            f"(longest batch {self.max_lock_time * 1000:.1f}ms)"
+        )
+
+
+def sweep(name, now=None, batch_size=BATCH_SIZE, sleep=0.0, full=False, dry_run=False):
+    """Archive or delete the rows of one sweep that have expired, in primary-key batches.
+
+    Each batch is handled in its own short transaction so live bookings never wait
+    long for a lock, with an optional pause between batches. Unless `full` is set,
+    only rows that expired after the previous run's watermark are considered.
+    """
+    spec = SWEEPS[name]
+    cutoff = (now or timezone.now()) - spec.age
+    report = SweepReport(name)
+    started = time.perf_counter()
+
+    expired = spec.expired(cutoff)
+    watermark = None if full else SweepWatermark.objects.filter(name=name).first()
+    after = watermark.swept_until if watermark else None
+    if after is not None:
+        expired = expired.filter(**{f"{spec.time_field}__gt": after})
+
+    writer = archive.ArchiveWriter(archive.KIND_BY_MODEL[spec.model]) if spec.archive and not dry_run else None
+    with writer or nullcontext():
+        last_pk = None
+        while True:
+            batch = expired.order_by('pk')
+            if last_pk is not None:
+                batch = batch.filter(pk__gt=last_pk)
+            pks = list(batch.values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            last_pk = pks[-1]
+
+            if not dry_run:
+                lock_started = time.perf_counter()
+                with transaction.atomic():
+                    if writer:
+                        archive.archive_rows(writer, pks)
+                    else:
+                        signals.delete_in_batch(spec.model, spec.model.objects.filter(pk__in=pks))
+                lock_time = time.perf_counter() - lock_started
+                report.lock_time += lock_time
+                report.max_lock_time = max(report.max_lock_time, lock_time)
+            report.rows += len(pks)
+            report.batches += 1
+            if sleep and len(pks) == batch_size:
+                time.sleep(sleep)
+
+    if not dry_run:
+        held = spec.held_since(cutoff, after)
+        swept_until = cutoff if held is None else held - timedelta(microseconds=1)
+        SweepWatermark.objects.update_or_create(name=name, defaults={'swept_until': swept_until})
+    report.elapsed = time.perf_counter() - started
+    return report
+
+
+def sweep_expired(names=None, **options):
+    """Run the named sweeps (all of them by default) and return their reports."""
+    options.setdefault('now', timezone.now())
+    return [sweep(name, **options) for name in (names or SWEEPS)]
@@ -0,0 +1,32 @@
+from . import sweeper
+from .scheduler import periodic
+
+# Celery is optional; the run_scheduler command needs no broker.
+try:
+    from celery import shared_task
+except ImportError:
+    def shared_task(func):
+        return func
+
+
+@shared_task
+@periodic(every=600)
+def delete_expired_appointments():
+    # Archive appointments whose slot ended more than 10 minutes ago, in small batches
+    reports = sweeper.sweep_expired(['doctor_appointments', 'specialized_appointments'])
+    return "; ".join(str(report) for report in reports)
+
+
+@shared_task
+@periodic(every=600)
+def delete_expired_slots():
+    # Delete free slots that ended more than 10 minutes ago, in small batches
+    report = sweeper.sweep('doctor_slots')
+    return f"Deleted {report.rows} expired slots."
+
+
+@shared_task
+@periodic(every=24 * 60 * 60)
+def archive_old_visits():
+    report = sweeper.sweep('visits')
+    return f"Archived {report.rows} visits."
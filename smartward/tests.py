@@ -1,3 +1,1394 @@
-from django.test import TestCase
+import gzip
+import asyncio
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time as time_module
+import zipfile
+from datetime import date, datetime, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.exceptions import ValidationError
+from django.test import LiveServerTestCase, SimpleTestCase, TestCase, override_settings
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+
+from cs314_SITE import asgi_urls
+
+from . import (
+    archive, async_views, availability, benchmarks, booking, dashboards, export, importtime, loadtest, metrics, onduty,
+    pdf, pickers, scheduler, search, signals, slotfeed, slots, suggest, sweeper, views,
+)
+from .models import (
+    MAX_SHIFT_LENGTH, ArchivedRecord, CustomUser, DoctorAppointment, DoctorAppointmentSlot, Patient, Shift,
+    SpecializedAppointment, SpecializedAppointmentSlot, SpecializedAppointmentType, SweepWatermark, Visit,
+)
+from .budgets import QUERY_BUDGETS
+from .dataset import DatasetGenerator
+from .intervals import IntervalTree
+from .pagination import paginate
+from .querybudget import assert_query_budget, assert_response_within_budget
+
+_media = tempfile.mkdtemp(prefix='smartward-tests-')
+
+
+def tearDownModule():
+    shutil.rmtree(_media, ignore_errors=True)
+
+
+@override_settings(
+    ALLOWED_HOSTS=['testserver'],
+    ARCHIVE_ROOT=f'{_media}/archive',
+    PDF_CACHE_ROOT=f'{_media}/pdf_cache',
+    PDF_WORKERS=0,
+    METRICS_DIR=None,
+)
+class ClinicTestCase(TestCase):
+    """A doctor, nurse and receptionist with patients, visits, shifts now and tomorrow, and tomorrow's slots.
+
+    Half of the slots are booked.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = CustomUser.objects.create_user('doctor', password='pw', id_number='D1', usertype='doctor')
+        cls.nurse = CustomUser.objects.create_user('nurse', password='pw', id_number='N1', usertype='nurse')
+        cls.receptionist = CustomUser.objects.create_user(
+            'receptionist', password='pw', id_number='R1', usertype='receptionist'
+        )
+        cls.patients = [
+            Patient.objects.create(
+                first_name=first_name, last_name=last_name, address='Suva', phone_contact=f'{1000000 + i}',
+                emergency_contact='7654321', dob=date(1990, 1, 1), email=f'{first_name.lower()}{i}@example.com',
+            )
+            for i, (first_name, last_name) in enumerate(
+                [('John', 'Smith'), ('Johnny', 'Walker'), ('Mere', 'Smithers'), ('Ana', 'Kumar')] * 5
+            )
+        ]
+        now = timezone.now()
+        for i, patient in enumerate(cls.patients):
+            Visit.objects.create(patient=patient, doctor=cls.doctor, nurse=cls.nurse, visit_date=now - timedelta(days=i))
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        Shift.objects.create(doctor=cls.doctor, start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=8))
+        Shift.objects.create(
+            doctor=cls.doctor, start_time=timezone.make_aware(datetime.combine(tomorrow, time(8))),
+            end_time=timezone.make_aware(datetime.combine(tomorrow, time(16))),
+        )
+        cls.appointment_type = SpecializedAppointmentType.objects.create(name='X-Ray')
+        cls.slots, cls.specialized_slots = [], []
+        for i in range(8):
+            start = time(9 + i // 2, 30 * (i % 2))
+            end = (datetime.combine(tomorrow, start) + timedelta(minutes=15)).time()
+            cls.slots.append(DoctorAppointmentSlot.objects.create(
+                doctor=cls.doctor, date=tomorrow, start_time=start, end_time=end
+            ))
+            cls.specialized_slots.append(SpecializedAppointmentSlot.objects.create(
+                appointment_type=cls.appointment_type, date=tomorrow, start_time=start, end_time=end
+            ))
+        for patient, slot, specialized_slot in list(zip(cls.patients, cls.slots, cls.specialized_slots))[:4]:
+            DoctorAppointment.objects.create(patient=patient, doctor=cls.doctor, slot=slot)
+            SpecializedAppointment.objects.create(patient=patient, slot=specialized_slot)
+
+    def setUp(self):
+        # Dashboards, the on-duty index and the slot feed keep state in the cache
+        cache.clear()
+
+
+class QueryBudgetTests(ClinicTestCase):
+    def test_every_budgeted_route_has_a_scenario(self):
+        found = benchmarks.scenarios(benchmarks.Fixtures())
+        self.assertEqual(benchmarks.uncovered_routes(found), [])
+        self.assertEqual(sorted(set(QUERY_BUDGETS) - {scenario.url_name for scenario in found}), [])
+
+    def test_routes_stay_within_budget(self):
+        fixtures = benchmarks.Fixtures()
+        # Budgets are checked whatever the status: the slot feed refuses WSGI
+        # requests, and a failing view must not hide a query regression
+        self.client.raise_request_exception = False
+        for scenario in benchmarks.scenarios(fixtures):
+            with self.subTest(scenario.name):
+                user = fixtures.user(scenario.role)
+                if user is not None:
+                    self.client.force_login(user)
+                response = self.client.get(reverse(scenario.url_name, args=scenario.args), scenario.params)
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                assert_response_within_budget(response)
+                self.client.logout()
+
+    def test_booking_post_stays_within_budget(self):
+        self.client.force_login(self.receptionist)
+        response = self.client.post(
+            reverse('book_appointment'), {'patient_id': self.patients[-1].pk, 'slot': self.slots[-1].pk}
+        )
+        self.assertRedirects(response, reverse('book_appointment'))
+        assert_response_within_budget(response)
+        self.assertTrue(DoctorAppointment.objects.filter(slot=self.slots[-1]).exists())
+
+    def test_login_post_stays_within_budget(self):
+        response = self.client.post(reverse('login'), {'username': 'receptionist', 'password': 'pw'})
+        self.assertEqual(response.status_code, 302)
+        assert_response_within_budget(response)
+
+    def test_successful_booking_does_not_page_the_list(self):
+        self.client.force_login(self.receptionist)
+        with mock.patch.object(views, 'paginate_request') as paginate_request:
+            response = self.client.post(
+                reverse('book_appointment'), {'patient_id': self.patients[-1].pk, 'slot': self.slots[-1].pk}
+            )
+        self.assertRedirects(response, reverse('book_appointment'))
+        paginate_request.assert_not_called()
+
+    def test_repeated_queries_are_reported(self):
+        with self.assertRaisesMessage(AssertionError, 'likely N+1'):
+            with assert_query_budget('patient_list'):
+                for patient in Patient.objects.all()[:5]:
+                    list(Visit.objects.filter(patient=patient))
+
+    def test_query_budget_passes_within_budget(self):
+        with assert_query_budget('patient_list') as recorder:
+            list(Patient.objects.all())
+        self.assertEqual(len(recorder.queries), 1)
+
+
+class BookingTests(ClinicTestCase):
+    def test_second_booking_of_a_slot_is_rejected(self):
+        slot = self.slots[-1]
+        booking.book_doctor_slot(self.patients[10].pk, slot.pk)
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.book_doctor_slot(self.patients[11].pk, slot.pk)
+        self.assertEqual(list(DoctorAppointment.objects.filter(slot=slot).values_list('patient', flat=True)),
+                         [self.patients[10].pk])
+
+    def test_unique_constraint_rejects_a_booking_the_claim_missed(self):
+        slot = self.slots[-1]
+        booking.book_doctor_slot(self.patients[10].pk, slot.pk)
+        # As if the flag had been cleared by mistake: the constraint still holds
+        DoctorAppointmentSlot.objects.filter(pk=slot.pk).update(is_booked=False)
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.book_doctor_slot(self.patients[11].pk, slot.pk)
+        self.assertEqual(DoctorAppointment.objects.filter(slot=slot).count(), 1)
+
+    def test_second_specialized_booking_is_rejected(self):
+        slot = self.specialized_slots[-1]
+        booking.book_specialized_slot(self.patients[10].pk, slot.pk)
+        with self.assertRaises(booking.SlotUnavailable):
+            booking.book_specialized_slot(self.patients[11].pk, slot.pk)
+        self.assertEqual(SpecializedAppointment.objects.filter(slot=slot).count(), 1)
+
+
+class AvailabilityTests(ClinicTestCase):
+    def assertBooked(self, slot, booked=True):
+        slot.refresh_from_db()
+        self.assertIs(slot.is_booked, booked)
+
+    def test_booking_and_cancelling_update_the_flag(self):
+        slot = self.slots[-1]
+        appointment = booking.book_doctor_slot(self.patients[10].pk, slot.pk)
+        self.assertBooked(slot)
+        appointment.delete()
+        self.assertBooked(slot, False)
+
+    def test_moving_an_appointment_frees_the_old_slot(self):
+        appointment = DoctorAppointment.objects.get(slot=self.slots[0])
+        appointment.slot = self.slots[-1]
+        appointment.save()
+        self.assertBooked(self.slots[0], False)
+        self.assertBooked(self.slots[-1])
+
+    def test_specialized_flag_follows_appointments(self):
+        appointment = SpecializedAppointment.objects.get(slot=self.specialized_slots[0])
+        self.assertBooked(self.specialized_slots[0])
+        appointment.delete()
+        self.assertBooked(self.specialized_slots[0], False)
+
+    def test_batch_delete_frees_the_slots(self):
+        signals.delete_in_batch(DoctorAppointment, DoctorAppointment.objects.all())
+        self.assertFalse(DoctorAppointmentSlot.objects.filter(is_booked=True).exists())
+
+    def test_free_slots_leave_out_booked_ones(self):
+        free = set(availability.free_doctor_slots(timezone.localdate()).values_list('pk', flat=True))
+        self.assertEqual(free, {slot.pk for slot in self.slots[4:]})
+
+
+class PaginationTests(ClinicTestCase):
+    def walk(self, queryset, ordering, per_page):
+        """Follow next cursors to the end, then previous cursors back; returns both lists of pages."""
+        forward, page = [], paginate(queryset, ordering, None, per_page)
+        forward.append([row.pk for row in page])
+        while page.has_next:
+            page = paginate(queryset, ordering, page.next_cursor, per_page)
+            forward.append([row.pk for row in page])
+        backward = [[row.pk for row in page]]
+        while page.has_previous:
+            page = paginate(queryset, ordering, page.previous_cursor, per_page)
+            backward.append([row.pk for row in page])
+        return forward, backward[::-1]
+
+    def test_cursors_round_trip(self):
+        patients = Patient.objects.all()
+        forward, backward = self.walk(patients, ('last_name', 'id'), 3)
+        self.assertEqual(sum(forward, []), list(patients.order_by('last_name', 'id').values_list('pk', flat=True)))
+        self.assertEqual(forward, backward)
+        self.assertEqual(len(forward), 7)
+
+    def test_descending_cursors_round_trip(self):
+        visits = Visit.objects.all()
+        forward, backward = self.walk(visits, ('-visit_date', '-id'), 6)
+        self.assertEqual(sum(forward, []), list(visits.order_by('-visit_date', '-id').values_list('pk', flat=True)))
+        self.assertEqual(forward, backward)
+
+    def test_malformed_cursor_gives_the_first_page(self):
+        first = paginate(Patient.objects.all(), ('id',), None, 5)
+        page = paginate(Patient.objects.all(), ('id',), 'not-a-cursor', 5)
+        self.assertEqual(list(page), list(first))
+        self.assertFalse(page.has_previous)
+
+
+class SearchTests(ClinicTestCase):
+    def found(self, query):
+        return [patient.pk for patient in search.paginate_patients(query, per_page=50)]
+
+    def names(self, query):
+        return {str(Patient.objects.get(pk=pk)) for pk in self.found(query)}
+
+    def test_patient_id_is_an_exact_match(self):
+        patient = self.patients[5]
+        self.assertEqual(self.found(str(patient.pk))[0], patient.pk)
+
+    def test_whole_words_rank_above_longer_words(self):
+        found = self.found('smith')
+        last_names = [Patient.objects.get(pk=pk).last_name for pk in found]
+        self.assertEqual(set(last_names), {'Smith', 'Smithers'})
+        self.assertEqual(last_names, sorted(last_names, key=lambda name: name != 'Smith'))
+
+    def test_substrings_match(self):
+        self.assertEqual(self.names('ohn'), {'John Smith', 'Johnny Walker'})
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.names('john smith'), {'John Smith'})
+
+    def test_email_domain_and_partial_address(self):
+        self.assertEqual(len(self.found('example.com')), len(self.patients))
+        self.assertEqual(self.found('ana3@exa'), [self.patients[3].pk])
+
+    def test_words_shorter_than_a_gram_match_anywhere(self):
+        self.assertEqual(self.names('th'), {'John Smith', 'Mere Smithers'})
+        self.assertEqual(self.names('mi'), {'John Smith', 'Mere Smithers'})
+        # Names starting with the query come first
+        self.assertEqual(Patient.objects.get(pk=self.found('jo')[0]).first_name[:2], 'Jo')
+        self.assertEqual(self.names('smith er'), {'Mere Smithers'})
+
+    def test_short_word_results_page_with_cursors(self):
+        found, page = [], search.paginate_patients('th', per_page=3)
+        found += [patient.pk for patient in page]
+        while page.has_next:
+            page = search.paginate_patients('th', page.next_cursor, per_page=3)
+            found += [patient.pk for patient in page]
+        self.assertEqual(found, self.found('th'))
+        self.assertEqual(len(found), 10)
+
+    def test_phone_number(self):
+        self.assertEqual(self.found('100 0002'), [self.patients[2].pk])
+
+    def test_index_follows_edits(self):
+        patient = self.patients[0]
+        patient.last_name = 'Tuilagi'
+        patient.save()
+        self.assertEqual(self.found('tuilagi'), [patient.pk])
+        self.assertNotIn(patient.pk, self.found('smith'))
+
+
+class SuggestionTests(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        suggest._index = None
+        self.addCleanup(setattr, suggest, '_index', None)
+
+    def rename(self, patient, last_name):
+        with self.captureOnCommitCallbacks(execute=True):
+            patient.last_name = last_name
+            patient.save()
+
+    def test_typos_suggest_the_closest_name(self):
+        self.assertEqual(suggest.suggest('Smiht'), 'Smith')
+        self.assertEqual(suggest.suggest('jonh'), 'John')
+        self.assertIsNone(suggest.suggest('Xyzzy'))
+
+    def test_edits_in_this_process_are_applied(self):
+        index = suggest.get_index()
+        self.rename(self.patients[1], 'Tuilagi')
+        self.assertIs(suggest.get_index(), index)
+        self.assertEqual(suggest.suggest('Tuilagl'), 'Tuilagi')
+        # Walker was on five patients, so it stays until the last one is renamed
+        self.assertEqual(suggest.suggest('Walkre'), 'Walker')
+        for patient in self.patients[5::4]:
+            self.rename(patient, 'Tuilagi')
+        self.assertIsNone(suggest.suggest('Walkre'))
+
+    def test_other_processes_replay_only_the_changes(self):
+        index = suggest.get_index()
+        suggest._index = None  # as if the change was made by another worker
+        self.rename(self.patients[1], 'Tuilagi')
+        suggest._index = index
+        with mock.patch.object(suggest, 'build_index', side_effect=AssertionError('reloaded')):
+            self.assertEqual(suggest.suggest('Tuilagl'), 'Tuilagi')
+        self.assertIs(suggest.get_index(), index)
+
+    def test_expired_changes_reload_the_index(self):
+        index = suggest.get_index()
+        suggest._index = None
+        self.rename(self.patients[1], 'Tuilagi')
+        cache.delete(suggest.CHANGE_KEY % cache.get(suggest.VERSION_KEY))
+        suggest._index = index
+        self.assertEqual(suggest.suggest('Tuilagl'), 'Tuilagi')
+        self.assertIsNot(suggest.get_index(), index)
+
+
+class SweeperTests(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        # Once tomorrow's slots have ended and the grace period has passed
+        self.later = timezone.now() + timedelta(days=3)
+
+    def test_expired_appointments_are_archived_and_slots_deleted(self):
+        sweeper.sweep_expired(['doctor_appointments', 'specialized_appointments', 'doctor_slots'], now=self.later)
+        self.assertFalse(DoctorAppointment.objects.exists())
+        self.assertFalse(SpecializedAppointment.objects.exists())
+        self.assertFalse(DoctorAppointmentSlot.objects.exists())
+        self.assertEqual(ArchivedRecord.objects.filter(kind='doctor_appointment').count(), 4)
+        self.assertEqual(ArchivedRecord.objects.filter(kind='specialized_appointment').count(), 4)
+
+        history = archive.patient_history(self.patients[0].pk)
+        self.assertEqual([record['kind'] for record in history], ['doctor_appointment', 'specialized_appointment'])
+        self.assertEqual(history[0]['context']['doctor'], self.doctor.username)
+
+    def test_booked_slot_is_swept_once_its_appointment_is_archived(self):
+        sweeper.sweep('doctor_slots', now=self.later)
+        self.assertEqual(DoctorAppointmentSlot.objects.count(), 4)
+        sweeper.sweep('doctor_appointments', now=self.later)
+        sweeper.sweep('doctor_slots', now=self.later)
+        self.assertFalse(DoctorAppointmentSlot.objects.exists())
+
+    def test_rows_that_have_not_expired_are_kept(self):
+        sweeper.sweep_expired()
+        self.assertEqual(DoctorAppointment.objects.count(), 4)
+        self.assertEqual(DoctorAppointmentSlot.objects.count(), 8)
+        self.assertEqual(Visit.objects.count(), len(self.patients))
+        self.assertFalse(ArchivedRecord.objects.exists())
+
+    def test_dry_run_changes_nothing(self):
+        reports = sweeper.sweep_expired(now=self.later, dry_run=True)
+        # Appointments of both kinds, and the free slots: booked ones wait for their appointment to go
+        self.assertEqual(sum(report.rows for report in reports), 4 + 4 + 4)
+        self.assertEqual(DoctorAppointmentSlot.objects.count(), 8)
+        self.assertFalse(ArchivedRecord.objects.exists())
+        self.assertFalse(SweepWatermark.objects.exists())
+
+    def test_old_visits_are_archived_with_tombstones(self):
+        report = sweeper.sweep('visits', now=timezone.now() + timedelta(days=400), batch_size=7)
+        self.assertEqual(report.rows, len(self.patients))
+        self.assertEqual(report.batches, 3)
+        self.assertFalse(Visit.objects.exists())
+        tombstones = ArchivedRecord.objects.filter(kind='visit')
+        self.assertEqual(tombstones.count(), len(self.patients))
+        self.assertEqual(set(tombstones.values_list('patient_id', flat=True)), {p.pk for p in self.patients})
+
+
+class SlotGenerationTests(ClinicTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other_doctor = CustomUser.objects.create_user('doctor2', password='pw', id_number='D2', usertype='doctor')
+
+    def at(self, hour, minute=0, days=1):
+        day = timezone.localdate() + timedelta(days=days)
+        return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+    def shift(self, start, end):
+        return Shift.objects.create(doctor=self.other_doctor, start_time=start, end_time=end)
+
+    def times(self):
+        return list(
+            DoctorAppointmentSlot.objects.filter(doctor=self.other_doctor).order_by('start_at')
+            .values_list('start_time', 'end_time')
+        )
+
+    def test_shift_is_cut_into_whole_slots_from_its_start(self):
+        shift = self.shift(self.at(8, 7), self.at(9, 10))
+        self.assertEqual(slots.generate_slots([shift]), (4, 0))
+        self.assertEqual([start for start, _ in self.times()], [time(8, 7), time(8, 22), time(8, 37), time(8, 52)])
+        self.assertEqual(self.times()[0][1], time(8, 22))
+
+    def test_slots_clashing_with_existing_ones_are_skipped(self):
+        shift = self.shift(self.at(9), self.at(10))
+        DoctorAppointmentSlot.objects.create(
+            doctor=self.other_doctor, date=self.at(9).date(), start_time=time(9, 10), end_time=time(9, 25)
+        )
+        self.assertEqual(slots.generate_slots([shift]), (2, 2))
+        self.assertEqual(slots.generate_slots([shift]), (0, 4))
+        self.assertEqual(len(self.times()), 3)
+
+    def test_planning_a_batch_costs_one_query(self):
+        shifts = [self.shift(self.at(8, days=days), self.at(12, days=days)) for days in range(1, 8)]
+        with self.assertNumQueries(1):
+            planned, skipped = slots.plan_slots(shifts, length=timedelta(minutes=20))
+        self.assertEqual((len(planned), skipped), (7 * 12, 0))
+
+    def test_no_slots_in_the_past(self):
+        now = timezone.now()
+        shift = self.shift(now - timedelta(hours=2), now + timedelta(hours=1))
+        planned, _ = slots.plan_slots([shift])
+        self.assertTrue(planned)
+        self.assertTrue(all(slot.start_at >= now for slot in planned))
+
+    def test_slot_length_is_limited(self):
+        shift = self.shift(self.at(8), self.at(12))
+        with self.assertRaises(ValueError):
+            slots.plan_slots([shift], length=timedelta(minutes=45))
+
+
+
+class IntervalTreeTests(SimpleTestCase):
+    def test_queries_match_a_full_scan(self):
+        rng = random.Random(7)
+        for size in (0, 1, 2, 5, 50, 300):
+            intervals = []
+            for i in range(size):
+                start = rng.randrange(0, 1000)
+                intervals.append((start, start + rng.randrange(1, 120), i))
+            tree = IntervalTree(intervals)
+            for _ in range(200):
+                a = rng.randrange(-50, 1100)
+                b = a + rng.randrange(0, 150)
+                self.assertEqual(
+                    sorted(tree.overlapping(a, b)), sorted(x for x in intervals if x[0] < b and x[1] > a)
+                )
+                self.assertEqual(
+                    sorted(tree.containing(a, b)), sorted(x for x in intervals if x[0] <= a and x[1] >= b)
+                )
+                self.assertEqual(sorted(tree.at(a)), sorted(x for x in intervals if x[0] <= a < x[1]))
+                self.assertEqual(tree.contains(a, b), any(x[0] <= a and x[1] >= b for x in intervals))
+
+
+class ShiftCoverageTests(ClinicTestCase):
+    def at(self, hour, minute=0):
+        day = timezone.localdate() + timedelta(days=1)
+        return timezone.make_aware(datetime.combine(day, time(hour, minute)))
+
+    def test_slots_are_checked_against_the_shifts(self):
+        coverage = slots.ShiftCoverage([self.doctor.pk], self.at(0), self.at(23))
+        self.assertTrue(coverage.covers(self.doctor.pk, self.at(8), self.at(8, 15)))
+        self.assertTrue(coverage.covers(self.doctor.pk, self.at(15, 45), self.at(16)))
+        self.assertFalse(coverage.covers(self.doctor.pk, self.at(15, 50), self.at(16, 5)))
+        self.assertFalse(coverage.covers(self.nurse.pk, self.at(9), self.at(9, 15)))
+
+    def test_a_full_length_shift_is_found_from_its_last_minutes(self):
+        doctor = CustomUser.objects.create_user('doctor2', password='pw', id_number='D2', usertype='doctor')
+        end = self.at(0) + MAX_SHIFT_LENGTH
+        Shift.objects.create(doctor=doctor, start_time=self.at(0), end_time=end)
+        coverage = slots.ShiftCoverage([doctor.pk], end - timedelta(minutes=15), end)
+        self.assertTrue(coverage.covers(doctor.pk, end - timedelta(minutes=15), end))
+
+    def test_slot_outside_a_shift_is_invalid(self):
+        slot = DoctorAppointmentSlot(
+            doctor=self.doctor, date=self.at(0).date(), start_time=time(17), end_time=time(17, 15)
+        )
+        with self.assertRaisesMessage(ValidationError, "within the doctor's shift"):
+            slot.clean()
+        slot.start_time, slot.end_time = time(10, 15), time(10, 30)
+        slot.clean()
+
+    def test_shifts_are_limited_in_length(self):
+        shift = Shift(doctor=self.doctor, start_time=self.at(8), end_time=self.at(8) + MAX_SHIFT_LENGTH)
+        shift.clean()
+        shift.end_time += timedelta(minutes=1)
+        with self.assertRaisesMessage(ValidationError, '24 hours'):
+            shift.clean()
+
+
+class SlotStartEndAtTests(ClinicTestCase):
+    def test_saving_fills_the_datetimes_in_local_time(self):
+        slot = DoctorAppointmentSlot.objects.get(pk=self.slots[0].pk)
+        self.assertEqual(timezone.localtime(slot.start_at), timezone.make_aware(datetime.combine(slot.date, time(9))))
+        self.assertEqual(slot.end_at - slot.start_at, timedelta(minutes=15))
+        specialized = SpecializedAppointmentSlot.objects.get(pk=self.specialized_slots[1].pk)
+        self.assertEqual(timezone.localtime(specialized.start_at).time(), time(9, 30))
+
+    def test_saving_some_fields_keeps_the_datetimes_in_step(self):
+        slot = self.slots[-1]
+        slot.start_time, slot.end_time = time(14), time(14, 30)
+        slot.save(update_fields=['start_time', 'end_time'])
+        slot = DoctorAppointmentSlot.objects.get(pk=slot.pk)
+        self.assertEqual(timezone.localtime(slot.start_at).time(), time(14))
+        self.assertEqual(timezone.localtime(slot.end_at).time(), time(14, 30))
+
+    def test_range_filters_match_the_date_and_times(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        start = timezone.make_aware(datetime.combine(tomorrow, time(10)))
+        by_datetime = DoctorAppointmentSlot.objects.filter(start_at__gte=start).order_by('start_at')
+        by_fields = DoctorAppointmentSlot.objects.filter(date=tomorrow, start_time__gte=time(10)).order_by('start_time')
+        self.assertEqual(list(by_datetime), list(by_fields))
+        self.assertEqual(len(by_datetime), 6)
+
+
+class ArchiveTests(ClinicTestCase):
+    def test_each_batch_is_read_back_from_its_own_offset(self):
+        sweeper.sweep('visits', now=timezone.now() + timedelta(days=400), batch_size=7)
+        offsets = sorted(set(ArchivedRecord.objects.values_list('archive_offset', flat=True)))
+        self.assertEqual(len(offsets), 3)
+        self.assertEqual(offsets[0], 0)
+        for patient in self.patients:
+            history = archive.patient_history(patient.pk)
+            self.assertEqual([(record['kind'], record['fields']['patient']) for record in history],
+                             [('visit', patient.pk)])
+
+    def test_only_the_patients_batches_are_decompressed(self):
+        sweeper.sweep('visits', now=timezone.now() + timedelta(days=400), batch_size=7)
+        tombstone = ArchivedRecord.objects.order_by('-archive_offset').first()
+        # Spoil the first batch: a reader that starts at the beginning of the file would fail
+        path = archive.archive_root() / tombstone.archive_file
+        data = bytearray(path.read_bytes())
+        data[10:tombstone.archive_offset - 8] = bytes(tombstone.archive_offset - 18)
+        path.write_bytes(bytes(data))
+        history = archive.patient_history(tombstone.patient_id)
+        self.assertEqual([record['pk'] for record in history], [tombstone.original_id])
+
+    def test_whole_file_still_reads_as_one_gzip_stream(self):
+        sweeper.sweep('visits', now=timezone.now() + timedelta(days=400), batch_size=7)
+        archive_file = ArchivedRecord.objects.values_list('archive_file', flat=True).first()
+        with gzip.open(archive.archive_root() / archive_file, 'rt', encoding='utf-8') as f:
+            self.assertEqual(len(f.readlines()), len(self.patients))
+
+
+class SchedulerTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def task(self, func, interval=60, jitter=0.1):
+        return scheduler.PeriodicTask(func, interval, jitter, f'test.{func.__name__}')
+
+    def test_runs_and_failures_are_counted(self):
+        def works():
+            return 'done'
+
+        def fails():
+            raise RuntimeError('boom')
+
+        good, bad = self.task(works), self.task(fails)
+        runner = scheduler.Scheduler({'good': good, 'bad': bad})
+        with self.assertLogs('smartward.scheduler', 'ERROR'):
+            runner.run(once=True)
+        self.assertEqual((good.runs, good.failures, good.last_result), (1, 0, 'done'))
+        self.assertEqual((bad.runs, bad.failures), (1, 1))
+        self.assertIn('1 runs, 1 failed', bad.stats())
+
+    def test_a_task_still_running_is_skipped(self):
+        task = self.task(lambda: None)
+        runner = scheduler.Scheduler({'task': task})
+        with task.running:
+            runner.run_task(task)
+        self.assertEqual((task.runs, task.skipped), (0, 1))
+
+    def test_the_cache_lock_keeps_other_processes_out(self):
+        task = self.task(lambda: None)
+        runner = scheduler.Scheduler({'task': task})
+        cache.add(f'smartward:scheduler:{task.name}', 1)
+        runner.run_task(task)
+        self.assertEqual((task.runs, task.skipped), (0, 1))
+        cache.delete(f'smartward:scheduler:{task.name}')
+        runner.run_task(task)
+        self.assertEqual(task.runs, 1)
+        # Released after the run
+        self.assertIsNone(cache.get(f'smartward:scheduler:{task.name}'))
+
+    def test_due_tasks_run_in_threads_and_are_rescheduled(self):
+        ran = threading.Event()
+        task = self.task(ran.set, interval=100, jitter=0.1)
+        runner = scheduler.Scheduler({'task': task})
+        before = time_module.monotonic()
+        runner.run_pending()
+        self.assertTrue(ran.wait(5))
+        self.assertTrue(before + 90 <= task.next_run <= time_module.monotonic() + 110)
+        runner.run_pending()
+        for thread in runner._threads:
+            thread.join()
+        self.assertEqual(task.runs, 1)
+
+    def test_maintenance_tasks_are_discovered(self):
+        names = set(scheduler.discover())
+        self.assertTrue({
+            'smartward.tasks.delete_expired_appointments',
+            'smartward.tasks.delete_expired_slots',
+            'smartward.tasks.archive_old_visits',
+        } <= names)
+
+
+class PdfServiceTests(SimpleTestCase):
+    template = 'appointment_pdf_template.html'
+
+    def service(self, workers, queue_size=2, timeout=60):
+        service = pdf.PdfService(workers=workers, queue_size=queue_size, timeout=timeout)
+        self.addCleanup(service.shutdown, wait=True)
+        return service
+
+    def test_renders_in_the_request_without_workers(self):
+        service = self.service(workers=0)
+        self.assertTrue(service.render(self.template, {}).startswith(b'%PDF'))
+        stats = service.stats()
+        self.assertEqual((stats['rendered'], stats['failed'], stats['rejected']), (1, 0, 0))
+        self.assertIsNotNone(stats['p99'])
+
+    def test_a_full_queue_rejects_new_jobs(self):
+        service = self.service(workers=0, queue_size=1)
+        service._slots.acquire()
+        with self.assertRaises(pdf.PdfBusy):
+            service.render(self.template, {})
+        self.assertEqual(service.rejected, 1)
+        service._slots.release()
+        service.render(self.template, {})
+
+    def test_pool_renders_and_keeps_the_slot_of_an_abandoned_job(self):
+        service = self.service(workers=1, queue_size=1)
+        # Starting a worker alone takes far longer than this
+        with self.assertRaises(pdf.PdfBusy):
+            service.render(self.template, {}, timeout=0.001)
+        with self.assertRaises(pdf.PdfBusy):
+            service.render(self.template, {})
+        self.assertEqual(service.rejected, 1)
+        # The abandoned job still finishes and then gives its slot back
+        deadline = time_module.monotonic() + 60
+        while not service._slots.acquire(blocking=False):
+            self.assertLess(time_module.monotonic(), deadline)
+            time_module.sleep(0.05)
+        service._slots.release()
+        self.assertTrue(service.render(self.template, {}).startswith(b'%PDF'))
+
+    def test_a_dead_worker_is_replaced(self):
+        service = self.service(workers=1)
+        service.warm_up()
+        for process in list(service._executor._processes.values()):
+            process.kill()
+            process.join()
+        # Wait for the pool to notice, as it would between prints
+        deadline = time_module.monotonic() + 10
+        while not service._executor._broken and time_module.monotonic() < deadline:
+            time_module.sleep(0.05)
+        self.assertTrue(service.render(self.template, {}).startswith(b'%PDF'))
+
+
+class PdfCacheTests(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        pdf._cache = None
+        self.addCleanup(setattr, pdf, '_cache', None)
+        shutil.rmtree(pdf.get_cache().root, ignore_errors=True)
+        self.client.force_login(self.receptionist)
+        self.appointment = DoctorAppointment.objects.get(slot=self.slots[0])
+        self.url = reverse('print_appointment', args=[self.appointment.pk])
+
+    def cached_files(self):
+        return sorted(os.listdir(pdf.get_cache().root))
+
+    def test_reprints_come_from_the_cache_with_the_same_etag(self):
+        first = self.client.get(self.url)
+        content = b''.join(first.streaming_content)
+        self.assertTrue(content.startswith(b'%PDF'))
+        self.assertEqual(self.cached_files(), [f'doctor_appointment-{self.appointment.pk}-{first["ETag"][1:-1]}.pdf'])
+        with mock.patch.object(pdf, 'render_pdf', side_effect=AssertionError('rendered again')):
+            second = self.client.get(self.url)
+            self.assertEqual(b''.join(second.streaming_content), content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(second['Cache-Control'], 'private, no-cache')
+        self.assertEqual((pdf.get_cache().hits, pdf.get_cache().misses), (1, 1))
+
+    def test_matching_if_none_match_gets_a_304(self):
+        etag = self.client.get(self.url)['ETag']
+        with mock.patch.object(pdf, 'render_pdf', side_effect=AssertionError('rendered again')):
+            response = self.client.get(self.url, headers={'If-None-Match': f'"other", {etag}'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        response = self.client.get(self.url, headers={'If-None-Match': '"other"'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_give_a_new_etag_and_drop_the_old_file(self):
+        etag = self.client.get(self.url)['ETag']
+        patient = self.appointment.patient
+        patient.first_name = 'Jonathan'
+        patient.save()
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.appointment.save()
+        self.assertEqual(self.cached_files(), [])
+
+    def test_least_recently_used_files_are_evicted(self):
+        cache_dir = tempfile.mkdtemp(dir=_media)
+        pdf_cache = pdf.PdfCache(cache_dir, max_bytes=350)
+        for i in range(3):
+            pdf_cache.put('doctor_appointment', i, 'x', bytes(100))
+            os.utime(pdf_cache.path('doctor_appointment', i, 'x'), (i, i))
+        pdf_cache.open('doctor_appointment', 0, 'x').close()
+        pdf_cache.put('doctor_appointment', 3, 'x', bytes(100))
+        self.assertEqual(sorted(os.listdir(cache_dir)), [f'doctor_appointment-{i}-x.pdf' for i in (0, 2, 3)])
+
+
+class ExportTests(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        pdf._cache = None
+        self.addCleanup(setattr, pdf, '_cache', None)
+        shutil.rmtree(pdf.get_cache().root, ignore_errors=True)
+        self.tomorrow = timezone.localdate() + timedelta(days=1)
+
+    def pages(self, f):
+        from pypdf import PdfReader
+
+        return len(PdfReader(f).pages)
+
+    def test_sheet_has_a_page_per_appointment_across_chunks(self):
+        with mock.patch.object(export, 'CHUNK_SIZE', 3):
+            sheet = export.sheet_pdf(*export.appointments_between(self.tomorrow, self.tomorrow))
+        self.assertEqual(self.pages(sheet), 8)
+        sheet = export.sheet_pdf(*export.appointments_between(self.tomorrow, self.tomorrow, doctor=self.doctor))
+        self.assertEqual(self.pages(sheet), 4)
+
+    def test_empty_range_gives_one_page(self):
+        today = timezone.localdate()
+        self.assertEqual(self.pages(export.sheet_pdf(*export.appointments_between(today, today))), 1)
+
+    @override_settings(PDF_EXPORT_MAX_PAGES=5)
+    def test_sheet_larger_than_the_limit_asks_for_a_zip(self):
+        with self.assertRaises(export.SheetTooLarge):
+            export.sheet_pdf(*export.appointments_between(self.tomorrow, self.tomorrow))
+        self.client.force_login(self.receptionist)
+        day = self.tomorrow.strftime('%d/%m/%Y')
+        response = self.client.get(
+            reverse('export_appointments'), {'first_date': day, 'last_date': day, 'output': 'pdf'}
+        )
+        self.assertContains(response, 'Export a ZIP instead')
+
+    def test_zip_holds_every_slip_without_filling_the_cache(self):
+        appointment = DoctorAppointment.objects.select_related('patient', 'doctor', 'slot').first()
+        cached = pdf.appointment_pdf(export.SLIP_TEMPLATES['doctor_appointment'], 'doctor_appointment', appointment)
+        self.assertEqual(len(os.listdir(pdf.get_cache().root)), 1)
+
+        content = b''.join(export.zip_stream(*export.appointments_between(self.tomorrow, self.tomorrow)))
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), 8)
+            self.assertEqual(archive.read(f'{self.tomorrow}/doctor_appointment_{appointment.pk}.pdf'), cached)
+            self.assertTrue(all(archive.read(name).startswith(b'%PDF') for name in names))
+        self.assertEqual(len(os.listdir(pdf.get_cache().root)), 1)
+
+    def test_slips_that_fail_are_listed(self):
+        with mock.patch.object(pdf, 'render_pdf', side_effect=pdf.PdfError('broken')):
+            content = b''.join(export.zip_stream(*export.appointments_between(self.tomorrow, self.tomorrow)))
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            self.assertEqual(archive.namelist(), ['errors.txt'])
+            self.assertEqual(archive.read('errors.txt').decode().count('broken'), 8)
+
+
+class MetricsTests(ClinicTestCase):
+    def total(self, name, **labels):
+        key = (name, tuple(labels.items()))
+        return metrics.collect().get(key, 0)
+
+    def test_requests_are_counted_by_route(self):
+        before = self.total('smartward_http_requests_total', route='login', method='GET', status='200')
+        self.client.get(reverse('login'))
+        self.assertEqual(
+            self.total('smartward_http_requests_total', route='login', method='GET', status='200'), before + 1
+        )
+        response = self.client.get(reverse('metrics'))
+        self.assertContains(response, 'smartward_http_request_duration_seconds_bucket{route="login",le="+Inf"}')
+
+    def test_exited_threads_keep_their_counts(self):
+        labels = (('route', 'metrics-test-threads'),)
+        threads = [threading.Thread(target=metrics.inc, args=('smartward_db_query_seconds_total', labels, 2))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        del threads
+        self.assertEqual(metrics.collect()['smartward_db_query_seconds_total', labels], 10)
+
+    def test_histograms_are_cumulative_in_the_text_format(self):
+        labels = (('template', 'metrics-test.html'),)
+        for value in (0.003, 0.2, 0.2, 20):
+            metrics.observe('smartward_pdf_render_seconds', labels, value)
+        text = metrics.render_text()
+        self.assertIn('smartward_pdf_render_seconds_bucket{template="metrics-test.html",le="0.005"} 1\n', text)
+        self.assertIn('smartward_pdf_render_seconds_bucket{template="metrics-test.html",le="0.25"} 3\n', text)
+        self.assertIn('smartward_pdf_render_seconds_bucket{template="metrics-test.html",le="+Inf"} 4\n', text)
+        self.assertIn('smartward_pdf_render_seconds_count{template="metrics-test.html"} 4\n', text)
+
+
+class MetricsDirectoryTests(SimpleTestCase):
+    labels = (('route', 'metrics-test-dir'),)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(dir=_media)
+        override = override_settings(METRICS_DIR=self.directory, METRICS_FLUSH_INTERVAL=5)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def write(self, filename, value, age=0):
+        path = os.path.join(self.directory, filename)
+        with open(path, 'w') as f:
+            json.dump({'counters': [['smartward_db_query_seconds_total', [list(self.labels[0])], value]],
+                       'histograms': []}, f)
+        mtime = time_module.time() - age
+        os.utime(path, (mtime, mtime))
+
+    def other_processes(self):
+        key = ('smartward_db_query_seconds_total', self.labels)
+        return metrics.collect().get(key, 0) - metrics._totals([metrics.snapshot()]).get(key, 0)
+
+    def dead_pid(self):
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        return process.pid
+
+    def test_flush_writes_a_file_named_by_pid_and_start_time(self):
+        metrics.flush(force=True)
+        name = metrics._snapshot_name()
+        self.assertRegex(name, rf'^{os.getpid()}-\d+\.json$')
+        self.assertEqual(os.listdir(self.directory), [name])
+
+    def test_running_processes_are_summed(self):
+        self.write(f'{os.getppid()}-1.json', 3)
+        self.assertEqual(self.other_processes(), 3)
+
+    def test_exit_folds_the_counts_into_the_retired_file(self):
+        key = ('smartward_db_query_seconds_total', self.labels)
+        metrics.inc(*key, 4)
+        metrics.flush(force=True)
+        metrics._retire_process(os.getpid())
+        self.assertNotIn(metrics._snapshot_name(), os.listdir(self.directory))
+        with open(os.path.join(self.directory, metrics.RETIRED)) as f:
+            retired = metrics._totals([json.load(f)])
+        self.assertEqual(retired[key], metrics._totals([metrics.snapshot()])[key])
+
+    def test_files_of_killed_processes_are_retired_once_stale(self):
+        pid = self.dead_pid()
+        self.write(f'{pid}-1.json', 5, age=60)
+        self.write(f'{pid}-2.json', 7, age=1)
+        # A newer file of the same pid means the older one's process is gone too
+        self.write(f'{os.getppid()}-1.json', 11, age=60)
+        self.write(f'{os.getppid()}-2.json', 13, age=1)
+        self.assertEqual(self.other_processes(), 5 + 7 + 11 + 13)
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            sorted([f'{pid}-2.json', f'{os.getppid()}-2.json', 'retired.json', 'retired.lock']),
+        )
+        self.assertEqual(self.other_processes(), 5 + 7 + 11 + 13)
+
+
+class DatasetTests(TestCase):
+    now = timezone.make_aware(datetime(2026, 3, 4, 10, 30))
+    sizes = dict(doctors=3, nurses=2, receptionists=1, patients=30, visits=60, days_back=10, days_ahead=6,
+                 booked_ratio=0.5, index=False)
+
+    def generate(self, prefix, now=None, seed=1):
+        DatasetGenerator(seed=seed, prefix=prefix, batch_size=7, now=now or self.now).generate(**self.sizes)
+        patients = Patient.objects.filter(email__endswith=f'@{prefix}.example.com').order_by('pk')
+        doctors = CustomUser.objects.filter(username__startswith=f'{prefix}_doctor')
+        return {
+            'patients': [
+                (p.first_name, p.last_name, p.address, p.phone_contact, p.dob, p.email.split('@')[0])
+                for p in patients
+            ],
+            'visits': list(Visit.objects.filter(patient__in=patients).order_by('pk').values_list(
+                'visit_date', 'weight', 'temperature', 'blood_pressure', 'doctor_notes'
+            )),
+            'shifts': list(
+                Shift.objects.filter(doctor__in=doctors).order_by('pk').values_list('start_time', 'end_time')
+            ),
+            'slots': list(DoctorAppointmentSlot.objects.filter(doctor__in=doctors).order_by('pk').values_list(
+                'start_at', 'is_booked'
+            )),
+        }
+
+    def test_same_seed_and_now_give_the_same_data(self):
+        first, second = self.generate('one'), self.generate('two')
+        self.assertEqual(first, second)
+        self.assertEqual(len(first['patients']), 30)
+        self.assertEqual(len(first['visits']), 60)
+        self.assertTrue(first['slots'])
+        self.assertTrue(all(start_at >= self.now for start_at, _ in first['slots']))
+
+    def test_the_data_follows_now(self):
+        first = self.generate('one')
+        second = self.generate('two', now=self.now + timedelta(days=7))
+        self.assertEqual(
+            [start + timedelta(days=7) for start, _ in first['shifts']], [start for start, _ in second['shifts']]
+        )
+
+    def test_command_takes_a_date_for_now(self):
+        out = io.StringIO()
+        call_command(
+            'generate_dataset', '--now', '2026-03-04', '--prefix', 'cmd', '--doctors', '1', '--nurses', '1',
+            '--receptionists', '0', '--patients', '5', '--visits', '5', '--days-back', '3', '--days-ahead', '2',
+            '--no-index', stdout=out,
+        )
+        self.assertIn('Dataset generated', out.getvalue())
+        latest = Visit.objects.order_by('-visit_date').values_list('visit_date', flat=True).first()
+        self.assertLessEqual(latest, timezone.make_aware(datetime(2026, 3, 4)))
+        with self.assertRaises(CommandError):
+            call_command('generate_dataset', '--now', '2026-13-40', stdout=out)
+
+
+@override_settings(PDF_WORKERS=0, METRICS_DIR=None)
+class LoadTestTests(LiveServerTestCase):
+    def setUp(self):
+        cache.clear()
+        self.doctor = CustomUser.objects.create_user('doctor', password='pw', id_number='D1', usertype='doctor')
+        CustomUser.objects.create_user('nurse', password='pw', id_number='N1', usertype='nurse')
+        CustomUser.objects.create_user('receptionist', password='pw', id_number='R1', usertype='receptionist')
+        self.patients = [
+            Patient.objects.create(
+                first_name='Ana', last_name=f'Kumar{i}', address='Suva', phone_contact=f'{1000000 + i}',
+                emergency_contact='7654321', dob=date(1990, 1, 1), email=f'ana{i}@example.com',
+            )
+            for i in range(5)
+        ]
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.slots = [
+            DoctorAppointmentSlot.objects.create(
+                doctor=self.doctor, date=tomorrow, start_time=time(9, 15 * i), end_time=time(9, 15 * i + 10)
+            )
+            for i in range(4)
+        ]
+
+    def test_a_short_run_reports_every_role(self):
+        counts = {'receptionist': 1, 'nurse': 1, 'doctor': 1}
+        document = loadtest.run(self.live_server_url, counts, duration=1.5, think_time=0, password='pw', seed=3)
+        self.assertEqual(document['meta']['login_failures'], [])
+        self.assertEqual(document['totals']['errors'], 0, document['scenarios'])
+        scenarios = document['scenarios']
+        for scenario in ('patient_list GET', 'book_appointment GET', 'slot_search GET', 'create_visit POST',
+                         'doctor_view_visits GET'):
+            self.assertIn(scenario, scenarios)
+        result = scenarios['patient_list GET']
+        self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+        self.assertLessEqual(result['p99_ms'], result['max_ms'])
+
+    def test_a_slot_booked_first_by_someone_else_is_a_conflict(self):
+        results = loadtest.Results()
+        pool = loadtest.Pool('pw', {'receptionist': 1})
+        user = loadtest.VirtualUser(self.live_server_url, 'receptionist', 'pw', pool, results, seed=0)
+        self.assertTrue(user.login())
+        path = reverse('book_appointment')
+        user.request('GET', path)
+        for patient in self.patients[:2]:
+            user.request('POST', path, data={'patient_id': patient.pk, 'slot': self.slots[0].pk},
+                         classify=loadtest._booking_outcome)
+        self.assertEqual(results.outcomes['book_appointment POST'], {'ok': 1, 'error': 0, 'conflict': 1})
+        self.assertEqual(DoctorAppointment.objects.get(slot=self.slots[0]).patient, self.patients[0])
+
+
+class ImportTimeTests(SimpleTestCase):
+    output = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |     _weakref\n"
+        "import time:       300 |        420 |   weakref\n"
+        "import time:      2000 |       2000 |     multiprocessing.queues\n"
+        "import time:       500 |       2500 |   concurrent.futures.process\n"
+        "import time:       100 |       3020 | smartward.pdf\n"
+        "import time:        50 |         50 | json\n"
+    )
+
+    def test_parse_nests_modules_under_their_importer(self):
+        roots = importtime.parse(self.output)
+        self.assertEqual([node.name for node in roots], ['smartward.pdf', 'json'])
+        pdf_node = roots[0]
+        self.assertEqual([node.name for node in pdf_node.children], ['weakref', 'concurrent.futures.process'])
+        self.assertEqual([node.name for node in pdf_node.children[0].children], ['_weakref'])
+        self.assertEqual(pdf_node.cumulative_us, 3020)
+
+    def test_format_tree_ranks_by_cumulative_time_and_hides_fast_modules(self):
+        lines = importtime.format_tree(importtime.parse(self.output), min_ms=0.4)
+        self.assertEqual(
+            [line.split()[-1] for line in lines],
+            ['smartward.pdf', 'concurrent.futures.process', 'multiprocessing.queues', 'weakref'],
+        )
+
+    def test_a_process_pool_at_boot_is_eager(self):
+        booted = ['asyncio', 'concurrent', 'concurrent.futures', 'concurrent.futures.thread', 'multiprocessing',
+                  'multiprocessing.context']
+        self.assertEqual(importtime.eager_lazy_modules(booted), [])
+        self.assertEqual(
+            importtime.eager_lazy_modules([*booted, 'concurrent.futures.process', 'multiprocessing.queues']),
+            ['concurrent.futures.process', 'multiprocessing.queues'],
+        )
+        self.assertEqual(importtime.eager_lazy_modules(['reportlab.pdfgen.canvas']), ['reportlab'])
+        self.assertEqual(importtime.eager_lazy_modules(['reportlabx']), [])
+
+    def test_import_chain_leads_to_the_first_import(self):
+        roots = importtime.parse(self.output)
+        self.assertEqual(
+            importtime.import_chain(roots, 'multiprocessing.queues'),
+            ['smartward.pdf', 'concurrent.futures.process', 'multiprocessing.queues'],
+        )
+        self.assertIsNone(importtime.import_chain(roots, 'celery'))
+
+    def test_boot_loads_no_lazy_module(self):
+        roots, boot = importtime.profile_boot()
+        self.assertIn('smartward.views', boot['modules'])
+        self.assertEqual(importtime.eager_lazy_modules(boot['modules']), [])
+
+
+class DashboardCacheTests(ClinicTestCase):
+    def add_shift(self, doctor, days):
+        start = timezone.now() + timedelta(days=days)
+        with self.captureOnCommitCallbacks(execute=True):
+            return Shift.objects.create(doctor=doctor, start_time=start, end_time=start + timedelta(hours=8))
+
+    def test_reads_are_served_from_the_cache(self):
+        first = dashboards.doctor_shifts(self.doctor.pk)
+        dashboards.current_shifts()
+        with self.assertNumQueries(0):
+            self.assertEqual(dashboards.doctor_shifts(self.doctor.pk), first)
+            self.assertEqual(len(dashboards.current_shifts()), 2)
+
+    def test_a_saved_shift_shows_on_the_next_read(self):
+        self.assertEqual(len(dashboards.doctor_shifts(self.doctor.pk)), 1)
+        self.assertEqual(len(dashboards.current_shifts()), 2)
+        shift = self.add_shift(self.doctor, days=2)
+        self.assertEqual(dashboards.doctor_shifts(self.doctor.pk)[-1]['start_time'], shift.start_time)
+        self.assertEqual(len(dashboards.current_shifts()), 3)
+
+        shift.end_time += timedelta(hours=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            shift.save()
+        self.assertEqual(dashboards.doctor_shifts(self.doctor.pk)[-1]['end_time'], shift.end_time)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shift.delete()
+        self.assertEqual(len(dashboards.doctor_shifts(self.doctor.pk)), 1)
+        self.assertEqual(len(dashboards.current_shifts()), 2)
+
+    def test_the_cache_is_invalidated_only_once_the_save_commits(self):
+        dashboards.doctor_shifts(self.doctor.pk)
+        start = timezone.now() + timedelta(days=2)
+        with self.captureOnCommitCallbacks() as callbacks:
+            Shift.objects.create(doctor=self.doctor, start_time=start, end_time=start + timedelta(hours=8))
+            self.assertEqual(len(dashboards.doctor_shifts(self.doctor.pk)), 1)
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(dashboards.doctor_shifts(self.doctor.pk)), 2)
+
+    def test_moving_a_shift_to_another_doctor_refreshes_both(self):
+        other = CustomUser.objects.create_user('other', password='pw', id_number='D2', usertype='doctor')
+        shift = self.add_shift(self.doctor, days=2)
+        self.assertEqual(len(dashboards.doctor_shifts(self.doctor.pk)), 2)
+        self.assertEqual(dashboards.doctor_shifts(other.pk), [])
+
+        shift = Shift.objects.get(pk=shift.pk)
+        shift.doctor = other
+        with self.captureOnCommitCallbacks(execute=True):
+            shift.save()
+        self.assertEqual(len(dashboards.doctor_shifts(self.doctor.pk)), 1)
+        self.assertEqual([s['start_time'] for s in dashboards.doctor_shifts(other.pk)], [shift.start_time])
+        self.assertIn('other', [s['doctor_username'] for s in dashboards.current_shifts()])
+
+    def test_a_shift_saved_elsewhere_leaves_a_doctor_cached(self):
+        other = CustomUser.objects.create_user('other', password='pw', id_number='D2', usertype='doctor')
+        dashboards.doctor_shifts(self.doctor.pk)
+        self.add_shift(other, days=2)
+        with self.assertNumQueries(0):
+            dashboards.doctor_shifts(self.doctor.pk)
+
+
+class OnDutyIndexTests(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = CustomUser.objects.create_user('other', password='pw', id_number='D2', usertype='doctor')
+        self.index = onduty.OnDutyIndex()
+
+    def create_shift(self, start, hours=4):
+        # Saved without running the commit hooks, so only what the test applies reaches the index
+        with self.captureOnCommitCallbacks():
+            return Shift.objects.create(doctor=self.other, start_time=start, end_time=start + timedelta(hours=hours))
+
+    def test_on_duty_and_starting_soon(self):
+        soon = self.create_shift(timezone.now() + timedelta(hours=1))
+        self.create_shift(timezone.now() + timedelta(hours=3))
+        on_duty, starting_soon = self.index.on_duty()
+        self.assertEqual([shift['username'] for shift in on_duty], ['doctor'])
+        self.assertEqual([shift['shift_id'] for shift in starting_soon], [soon.pk])
+        on_duty, _ = self.index.on_duty(at=soon.start_time + timedelta(minutes=1))
+        self.assertEqual({shift['username'] for shift in on_duty}, {'doctor', 'other'})
+
+    def test_reads_after_the_load_need_no_queries(self):
+        self.index.on_duty()
+        with self.assertNumQueries(0):
+            on_duty, _ = self.index.on_duty()
+        self.assertEqual(len(on_duty), 1)
+
+    def test_a_change_in_this_process_is_applied_without_a_reload(self):
+        self.index.on_duty()
+        shift = self.create_shift(timezone.now() - timedelta(minutes=5))
+        self.index.shift_changed(shift.pk)
+        with self.assertNumQueries(0):
+            on_duty, _ = self.index.on_duty()
+        self.assertEqual({s['username'] for s in on_duty}, {'doctor', 'other'})
+
+        self.index.shift_removed(shift.pk)
+        with self.assertNumQueries(0):
+            on_duty, _ = self.index.on_duty()
+        self.assertEqual([s['username'] for s in on_duty], ['doctor'])
+
+    def test_a_shift_outside_the_window_is_left_out(self):
+        self.index.on_duty()
+        shift = self.create_shift(timezone.now() + timedelta(hours=30))
+        self.index.shift_changed(shift.pk)
+        self.assertNotIn(shift.pk, self.index._shifts)
+
+    def test_a_change_in_another_process_forces_a_reload(self):
+        self.index.on_duty()
+        shift = self.create_shift(timezone.now() - timedelta(minutes=5))
+        # What another worker's index does after saving the shift
+        onduty.OnDutyIndex().shift_changed(shift.pk)
+        with self.assertNumQueries(1):
+            on_duty, _ = self.index.on_duty()
+        self.assertEqual({s['username'] for s in on_duty}, {'doctor', 'other'})
+
+    def test_a_change_racing_ours_forces_a_reload(self):
+        self.index.on_duty()
+        self.create_shift(timezone.now() - timedelta(minutes=5))
+        onduty._bump()
+        # Ours alone would drop the doctor's shift; the reload finds it still there and the new one
+        self.index.shift_removed(Shift.objects.filter(doctor=self.doctor).earliest('start_time').pk)
+        with self.assertNumQueries(1):
+            on_duty, _ = self.index.on_duty()
+        self.assertEqual({s['username'] for s in on_duty}, {'doctor', 'other'})
+
+    def test_saving_a_shift_updates_the_shared_index(self):
+        index = onduty.get_index()
+        index.on_duty()
+        start = timezone.now() - timedelta(minutes=5)
+        with self.captureOnCommitCallbacks(execute=True):
+            Shift.objects.create(doctor=self.other, start_time=start, end_time=start + timedelta(hours=4))
+        with self.assertNumQueries(0):
+            on_duty, _ = index.on_duty()
+        self.assertEqual({s['username'] for s in on_duty}, {'doctor', 'other'})
+
+
+@override_settings(SLOT_FEED_POLL_INTERVAL=0.01)
+class SlotFeedTests(ClinicTestCase):
+    def events(self):
+        latest = cache.get(slotfeed.SEQUENCE_KEY, 0)
+        return [event for _, event in slotfeed.read(1, latest)]
+
+    def first_messages(self, count, last_event_id=None, publish=()):
+        """The first `count` messages of a stream, publishing `publish` once it is connected."""
+        async def collect():
+            stream = slotfeed.stream(last_event_id, keepalive=5)
+            messages = [await anext(stream)]
+            # Events from before the hub read its starting point count as before connecting
+            while slotfeed.get_hub().sequence is None:
+                await asyncio.sleep(0.01)
+            for event in publish:
+                await asyncio.to_thread(slotfeed.publish, event)
+            try:
+                while len(messages) < count:
+                    messages.append(await asyncio.wait_for(anext(stream), 5))
+            finally:
+                await stream.aclose()
+            return messages
+        return asyncio.run(collect())
+
+    def test_a_booking_publishes_the_slot_state(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment = DoctorAppointment.objects.create(
+                patient=self.patients[5], doctor=self.doctor, slot=self.slots[5]
+            )
+        self.assertEqual(self.events(), [{'kind': 'doctor', 'slot': self.slots[5].pk, 'available': False}])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            appointment.delete()
+        event = self.events()[-1]
+        self.assertTrue(event['available'])
+        self.assertEqual(event['slot'], self.slots[5].pk)
+
+    def test_format_event(self):
+        self.assertEqual(
+            slotfeed.format_event(4, {'kind': 'doctor', 'slot': 1, 'available': False}),
+            'id: 4\nevent: slot\ndata: {"kind": "doctor", "slot": 1, "available": false}\n\n',
+        )
+        self.assertEqual(slotfeed.format_event(5, None), 'id: 5\nevent: reset\ndata: {}\n\n')
+        self.assertEqual(
+            slotfeed.format_event(6, {'kind': 'specialized', 'reset': True}),
+            'id: 6\nevent: reset\ndata: {"kind": "specialized"}\n\n',
+        )
+
+    def test_last_event_id_replays_what_was_missed(self):
+        for slot in self.slots[:3]:
+            slotfeed.publish({'kind': 'doctor', 'slot': slot.pk, 'available': True})
+        messages = self.first_messages(3, last_event_id=1)
+        self.assertEqual(messages[0], 'retry: 3000\n\n')
+        self.assertEqual([message.split('\n')[0] for message in messages[1:]], ['id: 2', 'id: 3'])
+        self.assertIn(f'"slot": {self.slots[2].pk}', messages[2])
+
+    def test_an_expired_event_is_replayed_as_a_reset(self):
+        for slot in self.slots[:3]:
+            slotfeed.publish({'kind': 'doctor', 'slot': slot.pk, 'available': True})
+        cache.delete(slotfeed._event_key(2))
+        messages = self.first_messages(3, last_event_id=1)
+        self.assertEqual(messages[1], 'id: 2\nevent: reset\ndata: {}\n\n')
+        self.assertTrue(messages[2].startswith('id: 3\nevent: slot'))
+
+    def test_a_lost_or_distant_last_event_id_gets_a_reset(self):
+        slotfeed.publish({'kind': 'doctor', 'slot': self.slots[0].pk, 'available': True})
+        # The counter was lost since the client's last event
+        self.assertEqual(self.first_messages(2, last_event_id=50)[1], 'id: 1\nevent: reset\ndata: {}\n\n')
+        cache.set(slotfeed.SEQUENCE_KEY, 5000, None)
+        self.assertEqual(self.first_messages(2, last_event_id=1)[1], 'id: 5000\nevent: reset\ndata: {}\n\n')
+
+    def test_events_published_later_reach_the_stream(self):
+        messages = self.first_messages(2, publish=[{'kind': 'doctor', 'slot': self.slots[6].pk, 'available': True}])
+        self.assertTrue(messages[1].startswith('id: 1\nevent: slot'))
+        self.assertIn(f'"slot": {self.slots[6].pk}', messages[1])
+
+    def test_the_view_needs_a_receptionist_and_asgi(self):
+        url = reverse('slot_feed')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.nurse)
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.receptionist)
+        self.assertEqual(self.client.get(url).status_code, 503)
+
+
+class AsyncViewTests(ClinicTestCase):
+    """The async views of asgi_urls.py give the pages the same context as the sync ones."""
+
+    @staticmethod
+    def rows(value):
+        return value if value is None or isinstance(value, (dict, Patient)) else list(value)
+
+    def contexts(self, name, user=None, keys=(), args=(), data=None):
+        url = reverse(name, args=args)
+        if user:
+            self.client.force_login(user)
+            async_to_sync(self.async_client.aforce_login)(user)
+        sync_response = self.client.get(url, data)
+        # So the async views build the dashboards themselves
+        cache.clear()
+        with override_settings(ROOT_URLCONF='cs314_SITE.asgi_urls'):
+            async_response = async_to_sync(self.async_client.get)(url, data)
+            # Resolved lazily, so only right under this urlconf
+            self.assertIs(async_response.resolver_match.func, asgi_urls.ASYNC_VIEWS[name])
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        # Querysets and pages compare by their rows
+        return [response.context and {key: self.rows(response.context[key]) for key in keys}
+                for response in (sync_response, async_response)]
+
+    def assertSameContext(self, *args, **kwargs):
+        sync_context, async_context = self.contexts(*args, **kwargs)
+        self.assertEqual(sync_context, async_context)
+        return async_context
+
+    def test_asgi_urls_route_only_the_async_views(self):
+        resolver = get_resolver('cs314_SITE.asgi_urls')
+        self.assertIs(resolver.resolve(reverse('patient_list')).func, async_views.patient_list_view)
+        self.assertIs(resolver.resolve(reverse('book_appointment')).func, views.receptionist_book_appointment)
+
+    def test_dashboards(self):
+        context = self.assertSameContext('doctor_dashboard', self.doctor, keys=('shifts', 'appointments'))
+        self.assertEqual(context['appointments']['upcoming'], 4)
+        context = self.assertSameContext(
+            'receptionist_dashboard', self.receptionist,
+            keys=('doctors_shifts', 'appointment_summary', 'on_duty', 'starting_soon'),
+        )
+        self.assertEqual([shift['username'] for shift in context['on_duty']], ['doctor'])
+
+    def test_doctor_pages(self):
+        context = self.assertSameContext('doctor_appointments', self.doctor, keys=('appointments',))
+        self.assertEqual(len(context['appointments']), 4)
+        context = self.assertSameContext('doctor_view_visits', self.doctor, keys=('visits',), data={'q': 'Smith'})
+        self.assertEqual(len(context['visits']), 10)
+
+    def test_patient_pages(self):
+        self.assertSameContext('patient_list', self.receptionist, keys=('patients',))
+        context = self.assertSameContext('patient_list', self.receptionist, keys=('patients',), data={'q': 'Kum'})
+        self.assertEqual(len(context['patients']), 5)
+        self.assertSameContext('patient_detail', self.receptionist, keys=('patient', 'archived_records'),
+                               args=[self.patients[0].pk], data={'history': '1'})
+        self.assertSameContext('patient_detail', self.receptionist, args=[0])
+
+    def test_login_is_still_required(self):
+        with override_settings(ROOT_URLCONF='cs314_SITE.asgi_urls'):
+            response = async_to_sync(self.async_client.get)(reverse('doctor_dashboard'))
+        self.assertRedirects(response, f"{settings.LOGIN_URL}?next={reverse('doctor_dashboard')}",
+                             fetch_redirect_response=False)
+
+
+class PickerTests(ClinicTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.receptionist)
+
+    def search(self, name, status=200, **params):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, status, response.content)
+        return response.json()
+
+    def test_slot_search_lists_free_slots_soonest_first(self):
+        found = self.search('slot_search')
+        self.assertEqual([option['id'] for option in found['results']], [slot.pk for slot in self.slots[4:]])
+        self.assertEqual(found['results'][0]['doctor'], 'doctor')
+        self.assertIsNone(found['next'])
+        found = self.search('slot_search', kind='specialized', appointment_type=self.appointment_type.pk)
+        self.assertEqual([option['id'] for option in found['results']],
+                         [slot.pk for slot in self.specialized_slots[4:]])
+        self.assertEqual(found['results'][0]['appointment_type'], 'X-Ray')
+
+    def test_slot_search_filters(self):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.assertEqual(len(self.search('slot_search', date=tomorrow.isoformat())['results']), 4)
+        self.assertEqual(self.search('slot_search', date=timezone.localdate().isoformat())['results'], [])
+        self.assertEqual(len(self.search('slot_search', doctor=self.doctor.pk)['results']), 4)
+        self.assertEqual(self.search('slot_search', doctor=self.nurse.pk)['results'], [])
+        self.assertEqual(len(self.search('slot_search', q='doc')['results']), 4)
+        self.assertEqual(self.search('slot_search', q='nobody')['results'], [])
+        self.assertEqual(len(self.search('slot_search', kind='specialized', q='ray')['results']), 4)
+
+    def test_bad_parameters_are_a_400(self):
+        for params in ({'kind': 'nurse'}, {'date': '18/10/2026'}, {'doctor': 'abc'}):
+            self.assertIn('error', self.search('slot_search', status=400, **params))
+        self.assertIn('error', self.search('staff_search', status=400, usertype='patient'))
+
+    def test_slot_options_page_with_one_query_each(self):
+        with self.assertNumQueries(1):
+            first = pickers.slot_options(per_page=3)
+        self.assertEqual([option['id'] for option in first.object_list], [slot.pk for slot in self.slots[4:7]])
+        with self.assertNumQueries(1):
+            second = pickers.slot_options(cursor=first.next_cursor, per_page=3)
+        self.assertEqual([option['id'] for option in second.object_list], [self.slots[7].pk])
+
+    def test_staff_search(self):
+        self.assertEqual([option['label'] for option in self.search('staff_search')['results']],
+                         [str(self.doctor), str(self.nurse), str(self.receptionist)])
+        found = self.search('staff_search', usertype='doctor')['results']
+        self.assertEqual([(option['id'], option['usertype']) for option in found], [(self.doctor.pk, 'doctor')])
+        self.assertEqual([option['id'] for option in self.search('staff_search', q='nur')['results']], [self.nurse.pk])
+        CustomUser.objects.filter(pk=self.nurse.pk).update(is_active=False)
+        self.assertEqual(self.search('staff_search', q='nur')['results'], [])
+
+    def test_login_is_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('slot_search')).status_code, 302)
+        self.assertEqual(self.client.get(reverse('staff_search')).status_code, 302)
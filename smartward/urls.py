@@ -25,7 +25,13 @@ from .views import (
     print_appointment_view,
     appointment_success,
     receptionist_book_appointment,
-    print_special_appointment_view
+    print_special_appointment_view,
+    export_appointments_view,
+    on_duty_view,
+    slot_feed_view,
+    slot_search_view,
+    staff_search_view,
+    metrics_view
 )
 
 urlpatterns = [
@@ -37,6 +43,7 @@ urlpatterns = [
     path('nurse_dashboard/', nurse_dashboard_view, name='nurse_dashboard'),
     path('receptionist_dashboard/', receptionist_dashboard_view, name='receptionist_dashboard'),
     path('logout/', logout_view, name='logout'),
+    path('on-duty/', on_duty_view, name='on_duty'),
 
     # Profile URLs
     path('doctor_profile/', doctor_profile_view, name='doctor_profile'),
@@ -52,6 +59,10 @@ urlpatterns = [
     path('delete_specialized_appointment/<int:appointment_id>/', delete_specialized_appointment, name='delete_specialized_appointment'),
     path('appointment/<int:appointment_id>/print/', print_appointment_view, name='print_appointment'),
     path('special_app/<int:appointment_id>/print/',print_special_appointment_view, name='sp_print_appointment'),
+    path('appointments/export/', export_appointments_view, name='export_appointments'),
+    path('slots/feed/', slot_feed_view, name='slot_feed'),
+    path('slots/search/', slot_search_view, name='slot_search'),
+    path('staff/search/', staff_search_view, name='staff_search'),
 
 
     # Patient Management URLs
@@ -65,4 +76,7 @@ urlpatterns = [
     path('patients/<int:patient_id>/create-visit/', create_visit, name='create_visit'),
     path('doctor/view-visits/', doctor_view_visits, name='doctor_view_visits'),
     path('doctor/attend_visit/<int:visit_id>/', doctor_attend_visit, name='doctor_attend_visit'),
+
+    # Prometheus scrape endpoint
+    path('metrics', metrics_view, name='metrics'),
 ]
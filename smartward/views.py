@@ -1,17 +1,17 @@
 from datetime import timedelta
-from django.http import HttpResponse
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from .models import  DoctorAppointment, DoctorAppointmentSlot, Patient, Shift, SpecializedAppointment, SpecializedAppointmentSlot, SpecializedAppointmentType, Visit
-from .forms import  DoctorVisitForm, PatientForm, ProfileUpdateForm, ReceptionistAppointmentForm, SpecializedAppointmentForm, VisitForm
+from .models import  DoctorAppointment, DoctorAppointmentSlot, Patient, SpecializedAppointment, SpecializedAppointmentSlot, SpecializedAppointmentType, Visit
+from .forms import  AppointmentExportForm, DoctorVisitForm, PatientForm, ProfileUpdateForm, ReceptionistAppointmentForm, SpecializedAppointmentForm, VisitForm
 from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.forms import PasswordChangeForm
-from django.db.models import Q
-import difflib
-from django.template.loader import get_template
-from xhtml2pdf import pisa
+from . import archive, availability, booking, dashboards, export, metrics, onduty, pdf, pickers, search, slotfeed, suggest
+from .pagination import paginate_request
 from django.utils import timezone
 from django.contrib.auth.forms import PasswordChangeForm
 
@@ -43,9 +43,11 @@ def user_login(request):
 @login_required
 def doctor_dashboard_view(request):
     user = request.user
-    now = timezone.now()
-    shifts = Shift.objects.filter(doctor=user, start_time__gt=now).order_by('start_time')
-    return render(request, 'doctor_dashboard.html', {'user': user, 'shifts': shifts})
+    return render(request, 'doctor_dashboard.html', {
+        'user': user,
+        'shifts': dashboards.doctor_shifts(user.pk),
+        'appointments': dashboards.doctor_appointment_summary(user.pk),
+    })
 
 @login_required
 def nurse_dashboard_view(request):
@@ -60,10 +62,14 @@ def receptionist_dashboard_view(request):
     if user.usertype != 'receptionist':
         return redirect('home')
 
-    doctors_shifts = Shift.objects.filter(doctor__usertype='doctor')
+    on_duty, starting_soon = onduty.get_index().on_duty()
     return render(request, 'receptionist_dashboard.html', {
         'user': user,
-        'doctors_shifts': doctors_shifts,
+        'doctors_shifts': dashboards.current_shifts(),
+        'appointment_summary': dashboards.appointment_summary(),
+        'shift_days': settings.DASHBOARD_SHIFT_DAYS,
+        'on_duty': on_duty,
+        'starting_soon': starting_soon,
     })
 
 
@@ -72,13 +78,14 @@ from django.contrib.auth.decorators import user_passes_test
 
 @user_passes_test(lambda u: u.usertype == 'receptionist')  
 def receptionist_book_appointment(request):
-    upcoming_bookings = DoctorAppointment.objects.filter(
-        slot__date__gte=timezone.now().date()  # Fetch upcoming bookings
-    ).select_related('patient', 'doctor', 'slot').order_by('slot__date')  # Optimize queries
     if request.method == "POST":
         form = ReceptionistAppointmentForm(request.POST)
         if form.is_valid():
-            form.save()  # Save the appointment
+            try:
+                form.save()  # Save the appointment
+            except booking.SlotUnavailable:
+                messages.error(request, "Booking Unsuccessful: that slot has just been booked.")
+                return redirect('book_appointment')
             messages.success(request, 'Booking Successful.')
             return redirect('book_appointment')
         else:
@@ -86,9 +93,15 @@ def receptionist_book_appointment(request):
     else:
         form = ReceptionistAppointmentForm()
 
+    # Only pages the form back, so a successful booking redirects without running the list queries
+    upcoming_bookings = DoctorAppointment.objects.filter(
+        slot__date__gte=timezone.now().date()  # Fetch upcoming bookings
+    ).select_related('patient', 'doctor', 'slot')  # Optimize queries
+    upcoming_bookings = paginate_request(request, upcoming_bookings, ('slot__start_at', 'id'))
     return render(request, 'appointment_booking.html',
                 {'form': form,
-                'upcoming_bookings': upcoming_bookings})
+                'upcoming_bookings': upcoming_bookings,
+                'page': upcoming_bookings})
 
 
 @login_required
@@ -131,12 +144,12 @@ def doctor_appointments_view(request):
     now = timezone.now()
     threshold_time = now - timedelta(minutes=10)
 
-    # Filter appointments to include only those that are scheduled in the future
+    # Filter appointments to include only those that are scheduled in the future,
+    # excluding bookings that have ended more than 10 minutes ago
     appointments = DoctorAppointment.objects.filter(
-        doctor=user, 
-    ).select_related('patient', 'slot').exclude(
-        slot__end_time__lt=threshold_time.time()  # Exclude bookings that have ended more than 10 minutes ago
-    )
+        doctor=user,
+        slot__end_at__gte=threshold_time,
+    ).select_related('patient', 'slot').order_by('slot__start_at')
     return render(request, 'doctor_appointments.html', {
         'appointments': appointments,
     })
@@ -159,29 +172,20 @@ def add_patient_view(request):
 
 def patient_list_view(request):
     query = request.GET.get('q', '').strip()
-    patients = Patient.objects.all()
     suggested_query = None
 
     if query:
-        patients = patients.filter(
-            Q(id__icontains=query) |
-            Q(first_name__icontains=query) |
-            Q(last_name__icontains=query) |
-            Q(email__icontains=query) |
-            Q(phone_contact__icontains=query) |
-            Q(emergency_contact__icontains=query)
-        )
-
-        if not patients.exists():
-            all_names = list(Patient.objects.values_list('first_name', flat=True)) + \
-                        list(Patient.objects.values_list('last_name', flat=True))
-            close_matches = difflib.get_close_matches(query, all_names, n=1, cutoff=0.6)
+        # Ranked lookup through the patient search index instead of a table scan
+        patients = search.paginate_patients(query, request.GET.get('cursor'))
 
-            if close_matches:
-                suggested_query = close_matches[0]
+        if not patients:
+            suggested_query = suggest.suggest(query)
+    else:
+        patients = paginate_request(request, Patient.objects.all(), ('id',))
 
     return render(request, 'patient_list.html', {
         'patients': patients,
+        'page': patients,
         'query': query,
         'suggested_query': suggested_query
     })
@@ -226,17 +230,22 @@ def update_patient_view(request, patient_id):
 
 def patient_detail_view(request, patient_id):
     patient = get_object_or_404(Patient, id=patient_id)
-    return render(request, 'patient_detail.html', {'patient': patient})
+    # Archived appointments and visits are only read from disk when asked for
+    archived_records = archive.patient_history(patient.id) if request.GET.get('history') else None
+    return render(request, 'patient_detail.html', {'patient': patient, 'archived_records': archived_records})
 
 
 def book_specialized_appointment(request, appointment_type_id):
     appointment_type = get_object_or_404(SpecializedAppointmentType, id=appointment_type_id)
-    available_slots = SpecializedAppointmentSlot.objects.filter(appointment_type=appointment_type, specializedappointment__isnull=True)
     
     if request.method == 'POST':
-        form = SpecializedAppointmentForm(request.POST)
+        form = SpecializedAppointmentForm(request.POST, initial={'appointment_type': appointment_type})
         if form.is_valid():
-            form.save()
+            try:
+                form.save()
+            except booking.SlotUnavailable:
+                messages.error(request, 'That slot has just been booked. Please choose another.')
+                return redirect('book_specialized_appointment', appointment_type_id=appointment_type.id)
             messages.success(request, 'Appointment booked successfully!')
             return redirect('specialized_appointment_list')
     else:
@@ -244,7 +253,7 @@ def book_specialized_appointment(request, appointment_type_id):
     
     context = {
         'form': form,
-        'available_slots': available_slots,
+        'available_slots': availability.free_specialized_slots(appointment_type=appointment_type),
         'appointment_type': appointment_type,
     }
     return render(request, 'book_specialized_appointment.html', context)
@@ -260,14 +269,14 @@ def specialized_appointment_list(request):
 
     # Filter to show only future bookings or bookings that ended within the last 10 minutes
     specialbookings = SpecializedAppointment.objects.filter(
-        slot__date__gte=now.date()
-    ).exclude(
-        slot__end_time__lt=threshold_time.time()  # Exclude bookings that have ended more than 10 minutes ago
-    )
+        slot__end_at__gte=threshold_time  # Exclude bookings that have ended more than 10 minutes ago
+    ).select_related('patient', 'slot__appointment_type')
+    specialbookings = paginate_request(request, specialbookings, ('slot__start_at', 'id'))
 
     return render(request, 'specialized_appointment_list.html', {
         'appointment_types': appointment_types,
-        'specialbookings': specialbookings
+        'specialbookings': specialbookings,
+        'page': specialbookings,
     })
 
 
@@ -289,20 +298,18 @@ def logout_view(request):
 
 
 def print_appointment_view(request, appointment_id):
-    appointment = get_object_or_404(DoctorAppointment, id=appointment_id)
-
-    template = get_template('appointment_pdf_template.html')
-    html = template.render({'appointment': appointment})
+    # Everything the template needs is loaded here, so the PDF worker never queries
+    appointment = get_object_or_404(DoctorAppointment.objects.select_related('patient', 'doctor', 'slot'), id=appointment_id)
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="appointment_{appointment.id}.pdf"'
-
-    # Using xhtml2pdf to create the PDF
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse(f'Error generating PDF: {pisa_status.err}')
-
-    return response
+    # Reprints are served from the PDF cache; new ones are rendered in the PDF worker pool
+    try:
+        return pdf.appointment_pdf_response(
+            request, 'appointment_pdf_template.html', 'doctor_appointment', appointment, f'appointment_{appointment.id}.pdf'
+        )
+    except pdf.PdfBusy as err:
+        return HttpResponse(str(err), status=503)
+    except pdf.PdfError as err:
+        return HttpResponse(f'Error generating PDF: {err}')
 
 
 def appointment_success(request):
@@ -311,31 +318,18 @@ def appointment_success(request):
 
 
 def patient_visit_list(request):
-    patients = Patient.objects.all()
     query = request.GET.get('q')
     suggested_query = None
 
     if query:
-        try:
-            query_id = int(query)
-            # If query is numeric, filter patients by exact ID match
-            patients = patients.filter(Q(id=query_id))
-        except ValueError:
-            # If query is not numeric, filter by name or contact
-            patients = patients.filter(
-                Q(first_name__icontains=query) |
-                Q(last_name__icontains=query) |
-                Q(phone_contact__icontains=query)
-            )
-        if not patients.exists():
-            all_names = list(Patient.objects.values_list('first_name', flat=True)) + \
-                        list(Patient.objects.values_list('last_name', flat=True))
-            close_matches = difflib.get_close_matches(query, all_names, n=1, cutoff=0.6)
-
-            if close_matches:
-                suggested_query = close_matches[0]
+        # Exact ID matches come first, then name and contact matches by rank
+        patients = search.paginate_patients(query, request.GET.get('cursor'))
+        if not patients:
+            suggested_query = suggest.suggest(query)
+    else:
+        patients = paginate_request(request, Patient.objects.all(), ('id',))
 
-    return render(request, 'patient_visit_list.html', {'patients': patients, 'query': query, 'suggested_query':suggested_query})
+    return render(request, 'patient_visit_list.html', {'patients': patients, 'page': patients, 'query': query, 'suggested_query':suggested_query})
 
 # Create a new visit for a selected patient
 def create_visit(request, patient_id):
@@ -361,32 +355,20 @@ def create_visit(request, patient_id):
 @login_required
 def doctor_view_visits(request):
     query = request.GET.get('q')
-    visits = Visit.objects.filter(doctor=request.user).order_by('-visit_date')
+    visits = Visit.objects.filter(doctor=request.user).select_related('patient')
     suggested_query = None  # Initialize suggested_query to None
 
     if query:
-        try:
-            query_id = int(query)
-            # Exact ID match for patient
-            visits = visits.filter(Q(patient__id=query_id))
-        except ValueError:
-            # If the query is not numeric, search by patient first name, last name, or phone contact
-            visits = visits.filter(
-                Q(patient__first_name__icontains=query) |
-                Q(patient__last_name__icontains=query) |
-                Q(patient__phone_contact__icontains=query)
-            )
-
-        if not visits.exists():
-            all_names = list(Patient.objects.values_list('first_name', flat=True)) + \
-                        list(Patient.objects.values_list('last_name', flat=True))
-            close_matches = difflib.get_close_matches(query, all_names, n=1, cutoff=0.6)
+        # Patient ID, name or contact matches from the search index
+        visits = visits.filter(search.matching_patients_q(query))
 
-            if close_matches:
-                suggested_query = close_matches[0]
+    visits = paginate_request(request, visits, ('-visit_date', '-id'))
+    if query and not visits:
+        suggested_query = suggest.suggest(query)
 
     return render(request, 'doctor_view_visits.html', {
         'visits': visits,
+        'page': visits,
         'query': query,
         'suggested_query': suggested_query
     })
@@ -460,46 +442,131 @@ def edit_profile(request):
 
 
 def print_special_appointment_view(request, appointment_id):
-    appointment = get_object_or_404(SpecializedAppointment, id=appointment_id)
+    # Everything the template needs is loaded here, so the PDF worker never queries
+    appointment = get_object_or_404(SpecializedAppointment.objects.select_related('patient', 'slot'), id=appointment_id)
 
-    template = get_template('sp_Appointment_pdf_template.html')
-    html = template.render({'appointment': appointment})
+    # Reprints are served from the PDF cache; new ones are rendered in the PDF worker pool
+    try:
+        return pdf.appointment_pdf_response(
+            request, 'sp_Appointment_pdf_template.html', 'specialized_appointment', appointment, f'appointment_{appointment.id}.pdf'
+        )
+    except pdf.PdfBusy as err:
+        return HttpResponse(str(err), status=503)
+    except pdf.PdfError as err:
+        return HttpResponse(f'Error generating PDF: {err}')
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="appointment_{appointment.id}.pdf"'
 
-    # Using xhtml2pdf to create the PDF
-    pisa_status = pisa.CreatePDF(html, dest=response)
-    if pisa_status.err:
-        return HttpResponse(f'Error generating PDF: {pisa_status.err}')
+@user_passes_test(lambda u: u.usertype == 'receptionist')
+def export_appointments_view(request):
+    form = AppointmentExportForm(request.GET or None)
 
-    return response
+    if form.is_valid():
+        data = form.cleaned_data
+        doctor_appointments, specialized_appointments = export.appointments_between(
+            data['first_date'], data['last_date'], data['doctor'], data['appointment_type']
+        )
+        filename = f"appointments_{data['first_date']:%Y%m%d}-{data['last_date']:%Y%m%d}"
 
+        if data['output'] == 'zip':
+            # Slips are rendered and sent one at a time while the archive is being written
+            response = StreamingHttpResponse(
+                export.zip_stream(doctor_appointments, specialized_appointments),
+                content_type='application/zip'
+            )
+            response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+            return response
 
-from celery import shared_task
+        try:
+            sheet = export.sheet_pdf(doctor_appointments, specialized_appointments)
+        except export.SheetTooLarge as err:
+            form.add_error(None, str(err))
+        except pdf.PdfBusy as err:
+            return HttpResponse(str(err), status=503)
+        except pdf.PdfError as err:
+            return HttpResponse(f'Error generating PDF: {err}')
+        else:
+            return FileResponse(sheet, as_attachment=True, filename=f'{filename}.pdf', content_type='application/pdf')
 
-@shared_task
-def delete_expired_appointments():
-    now = timezone.now()
-    ten_minutes_ago = now - timedelta(minutes=10)
+    return render(request, 'appointment_export.html', {'form': form})
 
-    # Find and delete all appointments where the time slot has passed by more than 10 minutes
-    expired_appointments = DoctorAppointment.objects.filter(slot__end_time__lte=ten_minutes_ago)
-    expired_appointments.delete()
 
+def _on_duty_json(shift):
+    return {
+        'doctor_id': shift['doctor_id'],
+        'doctor': shift['doctor'],
+        'username': shift['username'],
+        'shift_start': timezone.localtime(shift['start']).isoformat(),
+        'shift_end': timezone.localtime(shift['end']).isoformat(),
+    }
+
+
+@login_required
+def on_duty_view(request):
+    """Doctors on shift now and those starting within ?within= minutes (default 120), from memory."""
+    index = onduty.get_index()
+    max_minutes = int(index.window.total_seconds() - index.refresh.total_seconds()) // 60
+    try:
+        within = int(request.GET.get('within', 120))
+    except ValueError:
+        return JsonResponse({'error': 'within must be a number of minutes.'}, status=400)
+    if not 0 <= within <= max_minutes:
+        return JsonResponse({'error': f'within must be between 0 and {max_minutes} minutes.'}, status=400)
 
-@shared_task
-def delete_expired_slots():
     now = timezone.now()
-    
-    # Query for all slots that have passed the end time by 10 minutes
-    expired_slots = DoctorAppointmentSlot.objects.filter(
-        date__lt=now.date()
-    ) | DoctorAppointmentSlot.objects.filter(
-        date=now.date(),
-        end_time__lte=(now - timedelta(minutes=10)).time()
-    )
-    
-    count = expired_slots.count()
-    expired_slots.delete()
-    return f"Deleted {count} expired slots."
\ No newline at end of file
+    on_duty, starting_soon = index.on_duty(now, timedelta(minutes=within))
+    return JsonResponse({
+        'at': timezone.localtime(now).isoformat(),
+        'within_minutes': within,
+        'on_duty': [_on_duty_json(shift) for shift in on_duty],
+        'starting_soon': [_on_duty_json(shift) for shift in starting_soon],
+    })
+
+
+def _options_json(page):
+    return JsonResponse({'results': page.object_list, 'next': page.next_cursor, 'previous': page.previous_cursor})
+
+
+@login_required
+def slot_search_view(request):
+    """Free slots for the slot pickers, filtered by ?kind=, doctor=, date=, appointment_type= and q=."""
+    try:
+        filters = pickers.slot_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return _options_json(pickers.slot_options(**filters))
+
+
+@login_required
+def staff_search_view(request):
+    """Active staff for the staff pickers, filtered by ?usertype= and q= (name or username prefix)."""
+    try:
+        filters = pickers.staff_filters(request.GET)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return _options_json(pickers.staff_options(**filters))
+
+
+async def slot_feed_view(request):
+    """Server-sent events with slot availability changes, which the booking pages apply in place."""
+    user = await request.auser()
+    if not user.is_authenticated or user.usertype != 'receptionist':
+        return HttpResponseForbidden()
+    # Under WSGI the endless stream would be read into memory and hold a worker for good
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse('The slot feed needs the ASGI server.', status=503, content_type='text/plain')
+
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID', ''))
+    except ValueError:
+        last_event_id = None
+    response = StreamingHttpResponse(slotfeed.stream(last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics_view(request):
+    # Only for the scraper on this machine, not for browsers
+    if request.META.get('REMOTE_ADDR') not in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1')):
+        raise Http404()
+    return HttpResponse(metrics.render_text(), content_type='text/plain; version=0.0.4; charset=utf-8')